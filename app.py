@@ -44,16 +44,56 @@ def page_not_found(e):
 def internal_server_error(e):
     return render_template('500.html'), 500
 
+def upgrade_schema():
+    """
+    为已存在的表补充模型中新增的可空列及其索引，以及模型中新增的唯一索引
+    create_all只会创建缺失的表，不会修改已有的表结构
+    """
+    from sqlalchemy import inspect, text
+    
+    inspector = inspect(db.engine)
+    existing_tables = set(inspector.get_table_names())
+    
+    for table in db.metadata.sorted_tables:
+        if table.name not in existing_tables:
+            continue
+        
+        existing_columns = {column['name'] for column in inspector.get_columns(table.name)}
+        added_columns = set()
+        for column in table.columns:
+            if column.name in existing_columns or not column.nullable:
+                continue
+            
+            column_type = column.type.compile(dialect=db.engine.dialect)
+            with db.engine.begin() as conn:
+                conn.execute(text(f'ALTER TABLE "{table.name}" ADD COLUMN "{column.name}" {column_type}'))
+            added_columns.add(column.name)
+            logger.info(f"Added column {table.name}.{column.name}")
+        
+        # 为新增列创建索引
+        for index in table.indexes:
+            if added_columns & {column.name for column in index.columns}:
+                index.create(bind=db.engine, checkfirst=True)
+        
+        # 为已有列新增的唯一索引（如每个品种一个进行中刷新任务的部分唯一索引）
+        existing_indexes = {index['name'] for index in inspector.get_indexes(table.name)}
+        for index in table.indexes:
+            if not index.unique or index.name in existing_indexes:
+                continue
+            try:
+                index.create(bind=db.engine, checkfirst=True)
+                logger.info(f"Created unique index {index.name}")
+            except Exception as e:
+                # 已有数据违反唯一约束时跳过，不影响启动
+                logger.error(f"Error creating unique index {index.name}: {str(e)}")
+
 with app.app_context():
     # Import models to create tables
     import models  # noqa: F401
     
     try:
         db.create_all()
+        upgrade_schema()
         logger.info("Database tables created successfully")
     except Exception as e:
         logger.error(f"Error creating database tables: {str(e)}")
-
-    # Initialize the scheduler service
-    from services.scheduler import init_scheduler
-    init_scheduler(app)
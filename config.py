@@ -1,13 +1,109 @@
 import os
+import tempfile
+
+def _env_flag(name, default):
+    """读取布尔型环境变量"""
+    return os.environ.get(name, default).lower() in ('true', 'yes', '1', 't', 'y')
 
 # Application configuration
 class Config:
+    # 是否在当前进程内运行定时任务（采集/计算）
+    # 生产环境的Web worker应关闭，由独立的 worker.py 进程负责
+    RUN_SCHEDULER = _env_flag('RUN_SCHEDULER', 'true')
+    
+    # 调度器租约：只有租约持有者执行定时任务，持有者失联超过TTL后由其他进程接管
+    SCHEDULER_LEASE_TTL_SECONDS = 60
+    SCHEDULER_LEASE_RENEW_SECONDS = 20
+    
+    # 计算模式: 'event' - 每个快照入库后立即排队计算; 'interval' - 按固定周期计算最新快照
+    PIPELINE_MODE = os.environ.get('PIPELINE_MODE', 'event')
+    PIPELINE_MAX_PENDING = 20
+    PIPELINE_SUBMIT_TIMEOUT_SECONDS = 60
+    
     # Data retention period in days
     DATA_RETENTION_DAYS = 30
     
+    # 期权数据存储模式: 'full' - 每个快照写入全部合约; 'delta' - 只写入相对上次写入值有变化的合约
+    OPTION_STORAGE_MODE = os.environ.get('OPTION_STORAGE_MODE', 'full')
+    # delta模式下判定变化的相对容差，0表示任何变化都写入
+    OPTION_DELTA_TOLERANCES = {
+        'option_price': 0.001,
+        'implied_volatility': 0.001,
+        'volume': 0,
+        'open_interest': 0,
+        'delta': 0.001,
+        'gamma': 0.001,
+        'theta': 0.001,
+        'vega': 0.001
+    }
+    # delta模式下每隔多久写入一次全量快照（关键帧），限制重建快照时需要回溯的范围
+    OPTION_KEYFRAME_MINUTES = 60
+    
+    # 冷归档: 超过保留期的期权数据删除前导出为Parquet（需要安装pyarrow）
+    ARCHIVE_ENABLED = _env_flag('ARCHIVE_ENABLED', 'false')
+    ARCHIVE_DIR = os.environ.get('ARCHIVE_DIR', 'archive')
+    
+    # 历史回放: 并行进程数（默认CPU核数）; 偏离异常回放的时间周期（需要回溯两个窗口的数据，默认不含7d/30d）
+    REPLAY_WORKERS = int(os.environ.get('REPLAY_WORKERS', os.cpu_count() or 2))
+    REPLAY_DEVIATION_PERIODS = ['15m', '1h', '4h', '1d']
+    # 阈值扫描: 警报后一个时间周期内标的价格绝对变动达到该百分比视为命中
+    THRESHOLD_SWEEP_MOVE_PCT = 2.0
+    
     # Option strike price range (% from current price) to consider
     OPTION_STRIKE_RANGE_PCT = 10
     
+    # 期权到期结算时刻（UTC小时），用于计算剩余期限
+    OPTION_EXPIRY_HOUR_UTC = 8
+    # 各交易所期权权利金的计价方式: 'coin' 以标的币计价（反向期权），'usd' 以USD/USDT计价
+    EXCHANGE_PREMIUM_CURRENCY = {
+        'deribit': 'coin',
+        'okx': 'coin',
+        'binance': 'usd'
+    }
+    # 波动率偏斜和Volaxivity的IV来源: 'surface' 使用每个快照按到期日拟合的SVI曲面，'raw' 直接平均原始报价
+    IMPLIED_VOL_SOURCE = os.environ.get('IMPLIED_VOL_SOURCE', 'surface')
+    # 曲面指标（ATM波动率、25 delta风险逆转）的目标期限（天）
+    # 采集器只保留7天内到期的期权，拟合又排除1天内到期的，目标期限必须落在这个范围内
+    VOL_SURFACE_TENOR_DAYS = 5
+    
+    # 情景分析引擎: 'full' 使用Black-76全量重定价，'linear' 使用delta-gamma近似
+    SCENARIO_ENGINE_MODES = ['full', 'linear']
+    SCENARIO_ENGINE_MODE = os.environ.get('SCENARIO_ENGINE_MODE', 'full')
+    # 批量情景网格的最大情景数（价格 × 波动率 × 时间范围）
+    SCENARIO_GRID_MAX_POINTS = 20000
+    # 情景结果缓存: 按 (品种, 快照, 情景参数, 引擎, 组合) 缓存计算结果，新快照到达时清除该品种的旧结果
+    SCENARIO_CACHE_MAX_ENTRIES = int(os.environ.get('SCENARIO_CACHE_MAX_ENTRIES', 512))
+    SCENARIO_CACHE_TTL_SECONDS = 3600
+    
+    # 做市商GEX曲线: 每个快照在标的价格网格上计算净gamma敞口
+    GAMMA_EXPOSURE_GRID_POINTS = 101
+    GAMMA_EXPOSURE_GRID_RANGE = 0.2  # 网格范围为当前价格±20%
+    GAMMA_EXPOSURE_WALLS = 5  # 返回的Gamma墙数量
+    
+    # 蒙特卡洛VaR/ES: 相关的标的价格与隐含波动率路径，对最新期权链全量重定价
+    MONTE_CARLO_ENABLED = _env_flag('MONTE_CARLO_ENABLED', 'true')
+    MONTE_CARLO_INTERVAL_MINUTES = 5
+    MONTE_CARLO_PATHS = int(os.environ.get('MONTE_CARLO_PATHS', 100000))
+    MONTE_CARLO_MAX_PATHS = 50000  # API请求的路径数上限
+    # API请求的模拟在后台线程中排队执行: 线程数; 排队和运行中的任务上限（所有进程合计）; 超时视为已失效
+    MONTE_CARLO_JOB_WORKERS = 1
+    MONTE_CARLO_MAX_ACTIVE_JOBS = 4
+    MONTE_CARLO_JOB_STALE_MINUTES = 30
+    MONTE_CARLO_HORIZONS = [1, 7]  # 天
+    MONTE_CARLO_CONFIDENCES = [0.95, 0.99]
+    MONTE_CARLO_SEED = int(os.environ.get('MONTE_CARLO_SEED', 20240601))
+    MONTE_CARLO_WORKERS = int(os.environ.get('MONTE_CARLO_WORKERS', min(os.cpu_count() or 2, 8)))
+    MONTE_CARLO_CHUNK_PATHS = 2000  # 每个任务模拟的路径数
+    MONTE_CARLO_BATCH_CHUNKS = 8  # 每批任务数，每批结束后检查收敛
+    # 提前结束: 至少模拟该路径数，且最高置信度、最长期限的组合VaR相邻两批变化小于该比例
+    MONTE_CARLO_MIN_PATHS = 20000
+    MONTE_CARLO_CONVERGENCE_TOL = 0.005
+    # 路径参数: 标的价格波动率取近平值期权的隐含波动率；隐含波动率按对数正态随机游走
+    MONTE_CARLO_VOL_OF_VOL = 1.0
+    MONTE_CARLO_SPOT_CORRELATION = 0.8  # 不同品种标的价格之间
+    MONTE_CARLO_VOL_CORRELATION = 0.7  # 不同品种隐含波动率之间
+    MONTE_CARLO_SPOT_VOL_CORRELATION = -0.5  # 标的价格与隐含波动率之间
+    
     # 时间周期定义
     TIME_PERIODS = {
         '15m': {'label': '15分钟', 'minutes': 15},
@@ -89,3 +185,56 @@ class Config:
     
     # Default language
     DEFAULT_LANGUAGE = 'en'
+    
+    # API响应缓存设置
+    RESPONSE_CACHE_MAX_ENTRIES = int(os.environ.get('RESPONSE_CACHE_MAX_ENTRIES', 256))
+    RESPONSE_CACHE_TTL_SECONDS = int(os.environ.get('RESPONSE_CACHE_TTL_SECONDS', 600))
+    # 数据版本查询结果的缓存时间，短于数据更新周期即可
+    DATA_VERSION_TTL_SECONDS = 5
+    # 可选的Redis兼容缓存地址，多worker部署时共享缓存，如 redis://localhost:6379/0
+    CACHE_REDIS_URL = os.environ.get('CACHE_REDIS_URL')
+    
+    # SSE事件推送设置
+    SSE_HEARTBEAT_SECONDS = 15
+    SSE_SUBSCRIBER_QUEUE_SIZE = 100
+    # 每个Web进程允许的SSE长连接数；每个连接在gthread下独占一个线程，gunicorn_config按此额外增加线程
+    SSE_MAX_CONNECTIONS = int(os.environ.get('SSE_MAX_CONNECTIONS', 8))
+    # 采集进程与Web进程分离部署时，通过Redis频道转发事件
+    EVENT_REDIS_URL = os.environ.get('EVENT_REDIS_URL') or CACHE_REDIS_URL
+    
+    # 交易所市场数据（合约列表）的刷新周期（分钟），交易所实例在采集周期之间复用
+    EXCHANGE_MARKETS_REFRESH_MINUTES = int(os.environ.get('EXCHANGE_MARKETS_REFRESH_MINUTES', 60))
+    
+    # 交易所请求限速（跨进程共享的令牌桶）
+    # rate - 每秒补充的权重单位（与ccxt端点cost同单位），capacity - 允许的突发量
+    EXCHANGE_RATE_LIMITS = {
+        'deribit': {'rate': 20, 'capacity': 50},
+        'okx': {'rate': 10, 'capacity': 20},
+        'binance': {'rate': 20, 'capacity': 40}
+    }
+    # 实际使用的速率占上限的比例，留出余量给时钟误差和其他客户端
+    RATE_LIMIT_UTILIZATION = 0.9
+    # 令牌桶状态文件，同一主机上的所有进程共享；配置Redis后可跨主机共享
+    RATE_LIMIT_DB_PATH = os.environ.get('RATE_LIMIT_DB_PATH',
+                                        os.path.join(tempfile.gettempdir(), 'ors_rate_limits.db'))
+    RATE_LIMIT_REDIS_URL = os.environ.get('RATE_LIMIT_REDIS_URL') or CACHE_REDIS_URL
+    
+    # 交易所请求熔断: 连续失败次数达到阈值后熔断，经过重置时间后放行探测请求
+    CIRCUIT_BREAKER_FAILURE_THRESHOLD = 5
+    CIRCUIT_BREAKER_RESET_SECONDS = 60
+    # 自适应超时 = 近期延迟P99 × 倍数，限制在[最小值, 最大值]之间；样本不足时使用最大值
+    ADAPTIVE_TIMEOUT_MIN_SECONDS = 1.0
+    ADAPTIVE_TIMEOUT_MAX_SECONDS = 15.0
+    ADAPTIVE_TIMEOUT_MULTIPLIER = 2.0
+    ADAPTIVE_TIMEOUT_MIN_SAMPLES = 20
+    # 请求耗时超过该延迟分位数时发出对冲请求
+    HEDGE_PERCENTILE = 0.95
+    HEDGE_MIN_DELAY_SECONDS = 0.25
+    # 每个交易所用于超时控制和对冲请求的线程数
+    EXCHANGE_CALL_WORKERS = 8
+    # 每个交易所除主实例外的备用客户端实例数，用于对冲请求和接替仍有超时请求在运行的实例
+    EXCHANGE_SPARE_CLIENTS = 2
+    
+    # 手动刷新任务: 后台线程数; 超过该时间仍未结束的任务视为已失效（如进程重启），不再合并新请求
+    REFRESH_JOB_WORKERS = 2
+    REFRESH_JOB_STALE_MINUTES = 10
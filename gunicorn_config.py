@@ -0,0 +1,49 @@
+"""
+生产环境Gunicorn配置
+Web worker只处理HTTP请求，不运行定时任务；采集和计算由 worker.py 独立进程负责
+
+用法:
+    gunicorn -c gunicorn_config.py main:app
+    python worker.py
+"""
+import logging
+import multiprocessing
+import os
+
+# Web worker绝不启动调度器，无论外部环境如何设置
+os.environ['RUN_SCHEDULER'] = 'false'
+
+from config import Config
+
+bind = os.environ.get('BIND', '0.0.0.0:5000')
+
+# 默认按CPU核数扩展worker数量
+workers = int(os.environ.get('WEB_CONCURRENCY', multiprocessing.cpu_count() * 2 + 1))
+
+# 使用线程worker；每个SSE长连接独占一个线程，在普通请求线程之外为其预留SSE_MAX_CONNECTIONS个
+worker_class = 'gthread'
+threads = int(os.environ.get('WEB_THREADS', 8)) + Config.SSE_MAX_CONNECTIONS
+
+timeout = 120
+graceful_timeout = 30
+keepalive = 5
+
+# 定期重启worker，防止长时间运行后的内存增长
+max_requests = 2000
+max_requests_jitter = 200
+
+# 每个worker独立导入应用，避免fork后共享数据库连接池
+preload_app = False
+reload = False
+
+accesslog = '-'
+errorlog = '-'
+loglevel = os.environ.get('LOG_LEVEL', 'info')
+
+
+def when_ready(server):
+    # 采集在worker.py中运行，没有Redis转发时它发布的事件到不了这里的SSE客户端
+    if not Config.EVENT_REDIS_URL:
+        logging.getLogger('gunicorn.error').warning(
+            "EVENT_REDIS_URL未设置：worker.py发布的snapshot/indicators/gamma_profile/alert事件"
+            "不会推送到Web进程的SSE客户端，页面只能依赖定时刷新")
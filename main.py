@@ -1,3 +1,5 @@
+import multiprocessing
+
 from app import app, db
 from services.data_service import DataService
 from services.risk_service import RiskService
@@ -15,43 +17,26 @@ deviation_service = DeviationMonitorService()
 
 # Import routes later in the file to avoid circular imports
 
-def initialize_database():
-    """
-    Initialize the database with real data for each tracked symbol
-    """
-    try:
-        # Initialize data for each tracked symbol
-        for symbol in Config.TRACKED_SYMBOLS:
-            logger.info(f"Initializing data for {symbol} from real exchange APIs...")
-            
-            # Fetch latest option data for the symbol
-            success = data_service.fetch_and_store_option_data(symbol)
-            
-            if success:
-                # Calculate risk indicators based on the new data
-                risk_service.calculate_risk_indicators(symbol)
-                # 计算期权执行价偏离指标
-                deviation_service.calculate_deviation_metrics(symbol)
-                logger.info(f"Successfully initialized data for {symbol}")
-            else:
-                logger.error(f"Failed to initialize data for {symbol} - please check API connections")
-    except Exception as e:
-        logger.error(f"Error initializing database: {str(e)}")
-
-# Initialize the database with data when the app starts
 with app.app_context():
     # Check if data already exists
     from models import OptionData
     count = OptionData.query.count()
     if count == 0:
-        logger.info("No data found in database. Initializing...")
-        initialize_database()
+        logger.info("No data found in database. The scheduler will populate it in the background")
     else:
         logger.info(f"Database already contains {count} option data records")
     
     # Import routes after database initialization to avoid circular imports
     import routes  # noqa: F401
 
+# 开发环境单进程运行时在本进程内启动调度器；生产环境由 worker.py 负责
+# 调度器通过数据库租约选主，即使多个进程同时启动也只有一个执行任务
+# spawn启动的子进程（如蒙特卡洛进程池）会以 __mp_main__ 重新导入本模块，子进程中不启动调度器
+# （重新导入发生在子进程初始化完成之前，此时 parent_process() 仍为None，只能按进程名判断）
+if Config.RUN_SCHEDULER and multiprocessing.current_process().name == 'MainProcess':
+    from services.scheduler import init_scheduler
+    init_scheduler(app)
+
 if __name__ == "__main__":
     # Make sure to run the server so it's accessible externally
     app.run(host="0.0.0.0", port=5000, debug=True, threaded=True, use_reloader=True)
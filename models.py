@@ -1,3 +1,4 @@
+import json
 from datetime import datetime
 from app import db
 
@@ -19,10 +20,49 @@ class OptionData(db.Model):
     vega = db.Column(db.Float, nullable=True)
     timestamp = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
     exchange = db.Column(db.String(20), default='deribit', nullable=False, index=True)  # 'deribit', 'binance', 'okx'
+    instrument_id = db.Column(db.Integer, db.ForeignKey('instrument.id'), nullable=True, index=True)  # 合约维度表ID
 
     def __repr__(self):
         return f'<OptionData {self.symbol} {self.option_type} {self.strike_price} {self.expiration_date} {self.exchange}>'
 
+class Instrument(db.Model):
+    """Model to store the option contract dimension (one row per exchange contract)"""
+    __table_args__ = (
+        db.UniqueConstraint('exchange', 'symbol', 'expiration_date', 'strike_price', 'option_type',
+                            name='uq_instrument_contract'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    exchange = db.Column(db.String(20), nullable=False)
+    symbol = db.Column(db.String(20), nullable=False, index=True)
+    expiration_date = db.Column(db.Date, nullable=False)
+    strike_price = db.Column(db.Float, nullable=False)
+    option_type = db.Column(db.String(4), nullable=False)  # 'call' or 'put'
+    exchange_symbol = db.Column(db.String(64), nullable=True)  # 交易所原生合约名称，如 BTC-27JUN25-100000-C
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f'<Instrument {self.id}: {self.exchange} {self.symbol} {self.option_type} {self.strike_price} {self.expiration_date}>'
+
+class OptionSnapshot(db.Model):
+    """Model to store one ingested option chain snapshot per symbol and exchange"""
+    __table_args__ = (
+        db.Index('ix_option_snapshot_symbol_time', 'symbol', 'snapshot_time'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    exchange = db.Column(db.String(20), nullable=False)
+    snapshot_time = db.Column(db.DateTime, nullable=False)
+    underlying_price = db.Column(db.Float, nullable=False)
+    keyframe_time = db.Column(db.DateTime, nullable=False)  # 重建该快照所需的最近一次全量写入时间
+    contract_count = db.Column(db.Integer, nullable=False)  # 快照中的合约数量
+    rows_written = db.Column(db.Integer, nullable=False)  # 实际写入OptionData的行数
+    instrument_ids = db.Column(db.Text, nullable=False)  # 快照中合约ID列表（JSON）
+    
+    def __repr__(self):
+        return f'<OptionSnapshot {self.symbol} {self.exchange} {self.snapshot_time} {self.rows_written}/{self.contract_count}>'
+
 class RiskIndicator(db.Model):
     """Model to store calculated risk indicators"""
     id = db.Column(db.Integer, primary_key=True)
@@ -88,6 +128,9 @@ class ScenarioAnalysis(db.Model):
     estimated_gamma = db.Column(db.Float, nullable=True)
     estimated_vega = db.Column(db.Float, nullable=True)
     estimated_theta = db.Column(db.Float, nullable=True)
+    engine_mode = db.Column(db.String(10), nullable=True)  # 'full' or 'linear'; 旧记录为空（线性近似）
+    portfolio_id = db.Column(db.Integer, nullable=True)  # 计算使用的组合；为空时按每个合约持有1份计算，组合删除后保留原值
+    snapshot_time = db.Column(db.DateTime, nullable=True)  # 计算使用的期权链快照，旧记录为空
     
     def __repr__(self):
         return f'<ScenarioAnalysis {self.name} {self.symbol}>'
@@ -178,3 +221,177 @@ class SystemSetting(db.Model):
     
     def __repr__(self):
         return f"<SystemSetting {self.setting_name}: {self.setting_value} ({self.setting_type})>"
+
+class SchedulerLease(db.Model):
+    """Model to store the scheduler leader lease (only the holder runs scheduled jobs)"""
+    name = db.Column(db.String(50), primary_key=True)
+    holder = db.Column(db.String(100), nullable=False)
+    expires_at = db.Column(db.DateTime, nullable=False)
+    renewed_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<SchedulerLease {self.name}: {self.holder} until {self.expires_at}>"
+
+class RefreshJob(db.Model):
+    """Model to track manual data refresh jobs running in the background"""
+    __table_args__ = (
+        # 每个品种最多一个进行中的任务，多个进程并发提交时由数据库保证不重复
+        db.Index('uq_refresh_job_active_symbol', 'symbol', unique=True,
+                 postgresql_where=db.text("status IN ('queued', 'running')"),
+                 sqlite_where=db.text("status IN ('queued', 'running')")),
+    )
+    
+    id = db.Column(db.String(36), primary_key=True)  # uuid4
+    symbol = db.Column(db.String(20), nullable=False, index=True)
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # 'queued', 'running', 'succeeded', 'failed'
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    snapshot_time = db.Column(db.DateTime, nullable=True)  # 本次刷新写入的快照时间
+    error = db.Column(db.Text, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'symbol': self.symbol,
+            'status': self.status,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'snapshot_time': self.snapshot_time.isoformat() if self.snapshot_time else None,
+            'error': self.error
+        }
+    
+    def __repr__(self):
+        return f"<RefreshJob {self.id}: {self.symbol} {self.status}>"
+
+class VarEstimate(db.Model):
+    """Model to store Monte Carlo VaR / Expected Shortfall estimates of the latest option chains"""
+    id = db.Column(db.Integer, primary_key=True)
+    run_id = db.Column(db.String(36), nullable=False, index=True)  # 同一次模拟的所有结果
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False, index=True)
+    symbol = db.Column(db.String(20), nullable=False)  # 品种，'TOTAL' 为所有品种的组合
+    snapshot_time = db.Column(db.DateTime, nullable=True)  # 使用的期权链快照，组合为空
+    horizon_days = db.Column(db.Integer, nullable=False)
+    confidence = db.Column(db.Float, nullable=False)
+    var = db.Column(db.Float, nullable=False)  # 损失以正数表示
+    expected_shortfall = db.Column(db.Float, nullable=False)
+    paths = db.Column(db.Integer, nullable=False)
+    converged = db.Column(db.Boolean, default=False)
+    seed = db.Column(db.BigInteger, nullable=True)
+    portfolio_id = db.Column(db.Integer, nullable=True, index=True)  # 为空时为全部合约各持有1份
+    
+    def to_dict(self):
+        return {
+            'run_id': self.run_id,
+            'portfolio_id': self.portfolio_id,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'symbol': self.symbol,
+            'snapshot_time': self.snapshot_time.isoformat() if self.snapshot_time else None,
+            'horizon_days': self.horizon_days,
+            'confidence': self.confidence,
+            'var': self.var,
+            'expected_shortfall': self.expected_shortfall,
+            'paths': self.paths,
+            'converged': self.converged,
+            'seed': self.seed
+        }
+    
+    def __repr__(self):
+        return f"<VarEstimate {self.symbol} {self.horizon_days}d {self.confidence}: {self.var:.2f}>"
+
+class VarJob(db.Model):
+    """Model to track Monte Carlo VaR runs requested through the API and running in the background"""
+    id = db.Column(db.String(36), primary_key=True)  # uuid4，同时作为VarEstimate.run_id
+    status = db.Column(db.String(20), nullable=False, default='queued', index=True)  # 'queued', 'running', 'succeeded', 'failed'
+    portfolio_id = db.Column(db.Integer, nullable=True)
+    paths = db.Column(db.Integer, nullable=False)  # 请求的最大路径数
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    started_at = db.Column(db.DateTime, nullable=True)
+    finished_at = db.Column(db.DateTime, nullable=True)
+    error = db.Column(db.Text, nullable=True)
+    
+    def to_dict(self):
+        return {
+            'job_id': self.id,
+            'status': self.status,
+            'portfolio_id': self.portfolio_id,
+            'paths': self.paths,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'started_at': self.started_at.isoformat() if self.started_at else None,
+            'finished_at': self.finished_at.isoformat() if self.finished_at else None,
+            'error': self.error
+        }
+    
+    def __repr__(self):
+        return f"<VarJob {self.id}: {self.status}>"
+
+class Portfolio(db.Model):
+    """Model to store a named book of option positions"""
+    id = db.Column(db.Integer, primary_key=True)
+    name = db.Column(db.String(100), nullable=False, unique=True)
+    description = db.Column(db.Text, nullable=True)
+    created_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)  # 任何持仓变化都会更新，用于多进程同步
+    
+    def to_dict(self):
+        return {
+            'id': self.id,
+            'name': self.name,
+            'description': self.description,
+            'created_at': self.created_at.isoformat() if self.created_at else None,
+            'updated_at': self.updated_at.isoformat() if self.updated_at else None
+        }
+    
+    def __repr__(self):
+        return f"<Portfolio {self.id}: {self.name}>"
+
+class Position(db.Model):
+    """Model to store the quantity held of one option contract in a portfolio"""
+    __table_args__ = (
+        db.UniqueConstraint('portfolio_id', 'instrument_id', name='uq_position_instrument'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    portfolio_id = db.Column(db.Integer, db.ForeignKey('portfolio.id'), nullable=False, index=True)
+    instrument_id = db.Column(db.Integer, db.ForeignKey('instrument.id'), nullable=False)
+    quantity = db.Column(db.Float, nullable=False)  # 合约数，正数为多头，负数为空头
+    updated_at = db.Column(db.DateTime, default=datetime.utcnow, nullable=False)
+    
+    def __repr__(self):
+        return f"<Position {self.portfolio_id}/{self.instrument_id}: {self.quantity}>"
+
+class GammaExposureProfile(db.Model):
+    """Model to store the dealer gamma exposure (GEX) profile of one option chain snapshot"""
+    __table_args__ = (
+        db.UniqueConstraint('symbol', 'snapshot_time', name='uq_gamma_profile_snapshot'),
+    )
+    
+    id = db.Column(db.Integer, primary_key=True)
+    symbol = db.Column(db.String(20), nullable=False)
+    snapshot_time = db.Column(db.DateTime, nullable=False, index=True)
+    spot = db.Column(db.Float, nullable=False)
+    total_gex = db.Column(db.Float, nullable=False)  # 当前价格下的净GEX（USD / 1%）
+    flip_level = db.Column(db.Float, nullable=True)  # 网格范围内没有过零点时为空
+    call_wall = db.Column(db.Float, nullable=True)
+    put_wall = db.Column(db.Float, nullable=True)
+    contracts = db.Column(db.Integer, nullable=False)
+    profile = db.Column(db.Text, nullable=False)  # 曲线和按执行价汇总的GEX（JSON）
+    
+    def to_dict(self, include_profile=True):
+        data = {
+            'symbol': self.symbol,
+            'snapshot_time': self.snapshot_time.isoformat() if self.snapshot_time else None,
+            'spot': self.spot,
+            'total_gex': self.total_gex,
+            'flip_level': self.flip_level,
+            'call_wall': self.call_wall,
+            'put_wall': self.put_wall,
+            'contracts': self.contracts
+        }
+        if include_profile:
+            data.update(json.loads(self.profile))
+        return data
+    
+    def __repr__(self):
+        return f"<GammaExposureProfile {self.symbol} {self.snapshot_time}: {self.total_gex:.0f}>"
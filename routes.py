@@ -1,9 +1,11 @@
 from flask import render_template, request, jsonify, redirect, url_for, flash, session
 from datetime import datetime, timedelta
+import math
+import queue
 from sqlalchemy import func
 
 from app import app, db
-from models import OptionData, RiskIndicator, Alert, AlertThreshold, ScenarioAnalysis, StrikeDeviationMonitor, DeviationAlert, ApiCredential, SystemSetting
+from models import OptionData, RiskIndicator, Alert, AlertThreshold, ScenarioAnalysis, StrikeDeviationMonitor, DeviationAlert, ApiCredential, SystemSetting, Portfolio
 from config import Config
 
 # Get service instances from main to avoid circular imports
@@ -13,6 +15,10 @@ risk_service = main.risk_service
 deviation_service = main.deviation_service
 from services.alert_service import get_active_alerts, acknowledge_alert, update_alert_threshold
 from services.exchange_api_ccxt import set_api_credentials, get_underlying_price, test_connection
+from services.cache_service import cached_response
+from services.event_hub import event_hub, format_sse, SubscriberLimitError
+from services.refresh_jobs import refresh_job_manager
+from services.archive_service import load_archived_option_data, hot_window_start
 from translations import translations
 
 @app.route('/')
@@ -28,6 +34,44 @@ def health_check():
         'message': '服务正常运行中'
     })
 
+@app.route('/api/stream')
+def event_stream():
+    """SSE推送通道：新快照、风险指标和警报产生时实时推送"""
+    # 可选的事件类型过滤，如 ?topics=indicators,alert
+    topics = {t for t in request.args.get('topics', '').split(',') if t}
+    
+    # 在返回响应前占用订阅名额，超出上限时让客户端退回定时刷新
+    try:
+        q = event_hub.subscribe()
+    except SubscriberLimitError as e:
+        app.logger.warning(str(e))
+        return jsonify({'success': False, 'message': 'Too many stream connections'}), 503, {'Retry-After': '30'}
+    
+    def generate():
+        try:
+            yield 'retry: 5000\n\n'
+            while True:
+                try:
+                    event = q.get(timeout=Config.SSE_HEARTBEAT_SECONDS)
+                except queue.Empty:
+                    # 心跳注释，保持连接并让代理不要超时断开
+                    yield ': keep-alive\n\n'
+                    continue
+                
+                if topics and event['type'] not in topics:
+                    continue
+                yield format_sse(event)
+        finally:
+            event_hub.unsubscribe(q)
+    
+    response = app.response_class(generate(), mimetype='text/event-stream', headers={
+        'Cache-Control': 'no-cache',
+        'X-Accel-Buffering': 'no'
+    })
+    # 生成器未开始迭代就断开时finally不会执行，响应关闭时也释放名额
+    response.call_on_close(lambda: event_hub.unsubscribe(q))
+    return response
+
 @app.route('/dashboard')
 def dashboard():
     # 获取时间周期参数，默认为15m
@@ -70,6 +114,7 @@ def dashboard():
                            current_time_period=time_period)
 
 @app.route('/api/dashboard/data')
+@cached_response(RiskIndicator)
 def dashboard_data():
     try:
         symbol = request.args.get('symbol', Config.TRACKED_SYMBOLS[0])
@@ -206,6 +251,13 @@ def historical():
         OptionData.timestamp > from_date
     ).order_by(OptionData.timestamp.desc(), OptionData.strike_price).limit(1000).all()
     
+    # 查询范围超出数据库保留期时，从冷归档中补充更早的数据
+    if Config.ARCHIVE_ENABLED and len(options) < 1000 and from_date < hot_window_start():
+        hot_start = options[-1].timestamp if options else datetime.utcnow()
+        archived = load_archived_option_data(symbol, from_date, hot_start, option_type=option_type)
+        archived.sort(key=lambda o: (o.timestamp, -o.strike_price), reverse=True)
+        options = options + archived[:1000 - len(options)]
+    
     # Get expiration dates for the filter
     expirations = db.session.query(OptionData.expiration_date).filter(
         OptionData.symbol == symbol
@@ -273,9 +325,22 @@ def scenario():
     # Get saved scenarios
     scenarios = ScenarioAnalysis.query.order_by(ScenarioAnalysis.created_at.desc()).all()
     
+    portfolios = Portfolio.query.order_by(Portfolio.name).all()
+    
     return render_template('scenario.html', 
                            scenarios=scenarios,
-                           symbols=Config.TRACKED_SYMBOLS)
+                           portfolios=portfolios,
+                           symbols=Config.TRACKED_SYMBOLS,
+                           default_engine_mode=Config.SCENARIO_ENGINE_MODE)
+
+def _portfolio_id(value):
+    """请求中的组合ID: 为空时返回None，组合不存在时抛出ValueError"""
+    if value in (None, ''):
+        return None
+    portfolio = Portfolio.query.get(int(value))
+    if portfolio is None:
+        raise ValueError(f'Portfolio not found: {value}')
+    return portfolio.id
 
 @app.route('/api/scenario/run', methods=['POST'])
 def run_scenario():
@@ -287,14 +352,39 @@ def run_scenario():
         if field not in scenario_data:
             return jsonify({'success': False, 'message': f'Missing required field: {field}'}), 400
     
+    engine_mode = scenario_data.get('engine_mode') or Config.SCENARIO_ENGINE_MODE
+    if engine_mode not in Config.SCENARIO_ENGINE_MODES:
+        return jsonify({'success': False, 'message': f'Invalid engine_mode: {engine_mode}'}), 400
+    
+    try:
+        portfolio_id = _portfolio_id(scenario_data.get('portfolio_id'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    try:
+        price_change = float(scenario_data['price_change'])
+        volatility_change = float(scenario_data['volatility_change'])
+        time_horizon = float(scenario_data['time_horizon'])
+        if not all(math.isfinite(value) for value in (price_change, volatility_change, time_horizon)):
+            raise ValueError('non-finite value')
+        time_horizon = int(time_horizon)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid scenario parameters'}), 400
+    
+    # 价格下跌100%及以上会得到非正的远期价格，定价结果为NaN
+    if price_change <= -100:
+        return jsonify({'success': False, 'message': 'price_change must be greater than -100'}), 400
+    
     # Run the scenario analysis using risk_service
     result = risk_service.run_scenario_analysis(
         scenario_data['name'],
         scenario_data['symbol'],
-        float(scenario_data['price_change']),
-        float(scenario_data['volatility_change']),
-        int(scenario_data['time_horizon']),
-        scenario_data.get('description', '')
+        price_change,
+        volatility_change,
+        time_horizon,
+        scenario_data.get('description', ''),
+        engine_mode,
+        portfolio_id
     )
     
     if result:
@@ -312,12 +402,91 @@ def run_scenario():
                 'estimated_delta': result.estimated_delta,
                 'estimated_gamma': result.estimated_gamma,
                 'estimated_vega': result.estimated_vega,
-                'estimated_theta': result.estimated_theta
+                'estimated_theta': result.estimated_theta,
+                'engine_mode': result.engine_mode,
+                'portfolio_id': result.portfolio_id
             }
         })
     else:
         return jsonify({'success': False, 'message': 'Error running scenario analysis'}), 500
 
+def _scenario_axis(value, default):
+    """
+    网格坐标轴: 数值列表，或 {"min": , "max": , "step": }（含max）
+    先按点数上限校验再生成列表，避免超大范围在请求线程里分配巨型列表
+    """
+    if value is None:
+        return default
+    max_points = Config.SCENARIO_GRID_MAX_POINTS
+    if isinstance(value, dict):
+        start, stop, step = float(value['min']), float(value['max']), float(value['step'])
+        if not all(math.isfinite(item) for item in (start, stop, step)):
+            raise ValueError('non-finite range')
+        if step <= 0 or stop < start:
+            raise ValueError('invalid range')
+        count = int(round((stop - start) / step)) + 1
+        if count > max_points:
+            raise ValueError('range too large')
+        return [round(start + i * step, 6) for i in range(count)]
+    if len(value) > max_points:
+        raise ValueError('axis too large')
+    axis = [float(item) for item in value]
+    if not all(math.isfinite(item) for item in axis):
+        raise ValueError('non-finite value')
+    return axis
+
+@app.route('/api/scenario/grid', methods=['POST'])
+def run_scenario_grid():
+    """
+    批量情景网格，一次请求返回 时间范围 × 价格变化 × 波动率变化 的损益矩阵，用于热力图
+    save=true 时只把最差情景保存为一条情景分析记录
+    """
+    grid_data = request.json or {}
+    symbol = grid_data.get('symbol')
+    if symbol not in Config.TRACKED_SYMBOLS:
+        return jsonify({'success': False, 'message': f'Invalid symbol: {symbol}'}), 400
+    
+    engine_mode = grid_data.get('engine_mode') or Config.SCENARIO_ENGINE_MODE
+    if engine_mode not in Config.SCENARIO_ENGINE_MODES:
+        return jsonify({'success': False, 'message': f'Invalid engine_mode: {engine_mode}'}), 400
+    
+    try:
+        price_changes = _scenario_axis(grid_data.get('price_changes'), list(range(-30, 31, 5)))
+        volatility_changes = _scenario_axis(grid_data.get('volatility_changes'), list(range(-20, 21, 5)))
+        time_horizons = [int(value) for value in _scenario_axis(grid_data.get('time_horizons'), [0, 7, 30])]
+    except (KeyError, TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid grid axes'}), 400
+    
+    # 价格下跌100%及以上会得到非正的远期价格，定价结果为NaN
+    if any(value <= -100 for value in price_changes):
+        return jsonify({'success': False, 'message': 'price_changes must be greater than -100'}), 400
+    
+    try:
+        portfolio_id = _portfolio_id(grid_data.get('portfolio_id'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    points = len(price_changes) * len(volatility_changes) * len(time_horizons)
+    if points == 0 or points > Config.SCENARIO_GRID_MAX_POINTS:
+        return jsonify({'success': False,
+                        'message': f'Grid must contain 1-{Config.SCENARIO_GRID_MAX_POINTS} scenarios'}), 400
+    
+    result = risk_service.run_scenario_grid(
+        symbol,
+        price_changes,
+        volatility_changes,
+        time_horizons,
+        engine_mode,
+        save_summary=bool(grid_data.get('save')),
+        name=grid_data.get('name'),
+        description=grid_data.get('description', ''),
+        portfolio_id=portfolio_id
+    )
+    
+    if result is None:
+        return jsonify({'success': False, 'message': 'No option data available'}), 404
+    return jsonify({'success': True, 'grid': result})
+
 @app.route('/api/scenario/delete/<int:scenario_id>', methods=['POST'])
 def delete_scenario(scenario_id):
     scenario = ScenarioAnalysis.query.get(scenario_id)
@@ -329,6 +498,182 @@ def delete_scenario(scenario_id):
     else:
         return jsonify({'success': False, 'message': 'Scenario not found'}), 404
 
+@app.route('/api/risk/var', methods=['GET', 'POST'])
+def monte_carlo_var():
+    """
+    蒙特卡洛VaR/ES
+    GET 返回最近一次计算结果；POST 按请求参数（symbols, horizons, confidences, paths, seed）在后台排队计算，
+    返回任务ID，结果通过 /api/risk/var/<job_id> 查询
+    两种请求都可以指定 portfolio_id，按该组合的持仓计算
+    """
+    from services.var_service import get_latest_var
+    from services.var_jobs import var_job_manager
+    
+    params = (request.json or {}) if request.method == 'POST' else request.args
+    try:
+        portfolio_id = _portfolio_id(params.get('portfolio_id'))
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if request.method == 'GET':
+        result = get_latest_var(portfolio_id)
+        if result is None:
+            return jsonify({'success': False, 'message': 'No VaR estimate available'}), 404
+        return jsonify({'success': True, 'var': result})
+    
+    symbols = params.get('symbols') or Config.TRACKED_SYMBOLS
+    if not set(symbols) <= set(Config.TRACKED_SYMBOLS):
+        return jsonify({'success': False, 'message': f'Invalid symbols: {symbols}'}), 400
+    
+    try:
+        horizons = [int(value) for value in params.get('horizons') or Config.MONTE_CARLO_HORIZONS]
+        confidences = [float(value) for value in params.get('confidences') or Config.MONTE_CARLO_CONFIDENCES]
+        paths = int(params.get('paths') or min(Config.MONTE_CARLO_PATHS, Config.MONTE_CARLO_MAX_PATHS))
+        seed = params.get('seed')
+        seed = None if seed is None else int(seed)
+    except (TypeError, ValueError):
+        return jsonify({'success': False, 'message': 'Invalid parameters'}), 400
+    
+    if not horizons or min(horizons) <= 0 or not confidences or not all(0 < c < 1 for c in confidences):
+        return jsonify({'success': False, 'message': 'Invalid horizons or confidences'}), 400
+    if not 0 < paths <= Config.MONTE_CARLO_MAX_PATHS:
+        return jsonify({'success': False,
+                        'message': f'paths must be 1-{Config.MONTE_CARLO_MAX_PATHS}'}), 400
+    
+    # 模拟耗时较长，在后台执行，不占用请求线程
+    job = var_job_manager.submit(symbols, horizons, confidences, paths, seed, portfolio_id=portfolio_id)
+    if job is None:
+        return jsonify({'success': False, 'message': 'Too many VaR jobs in progress'}), 429, {'Retry-After': '30'}
+    
+    result = job.to_dict()
+    result['success'] = True
+    return jsonify(result), 202
+
+@app.route('/api/risk/var/<job_id>', methods=['GET'])
+def monte_carlo_var_status(job_id):
+    """查询蒙特卡洛VaR任务状态，完成后附带模拟结果"""
+    from services.var_service import get_var_run
+    from services.var_jobs import var_job_manager
+    
+    job = var_job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    result = job.to_dict()
+    result['success'] = True
+    if job.status == 'succeeded':
+        result['var'] = get_var_run(job.id)
+    return jsonify(result)
+
+@app.route('/api/risk/gamma-exposure')
+def gamma_exposure():
+    """
+    做市商GEX曲线: ?symbol= ，可选 ?snapshot_time=（ISO格式，返回不晚于该时间的最近快照）
+    ?history=N 返回最近N个快照的净GEX、翻转点和Gamma墙序列，不含曲线
+    """
+    from services.gex_service import get_gamma_profile, get_gamma_history
+
+    symbol = request.args.get('symbol', Config.TRACKED_SYMBOLS[0])
+    if symbol not in Config.TRACKED_SYMBOLS:
+        return jsonify({'success': False, 'message': f'Invalid symbol: {symbol}'}), 400
+
+    try:
+        history = request.args.get('history', type=int)
+        snapshot_time = request.args.get('snapshot_time')
+        snapshot_time = datetime.fromisoformat(snapshot_time) if snapshot_time else None
+    except ValueError:
+        return jsonify({'success': False, 'message': 'Invalid parameters'}), 400
+
+    if history:
+        return jsonify({'success': True, 'history': get_gamma_history(symbol, min(history, 5000))})
+
+    profile = get_gamma_profile(symbol, snapshot_time)
+    if profile is None:
+        return jsonify({'success': False, 'message': 'No gamma exposure profile available'}), 404
+    return jsonify({'success': True, 'profile': profile})
+
+@app.route('/api/portfolios', methods=['GET', 'POST'])
+def portfolios():
+    """
+    GET 列出所有组合及其在各品种上的汇总Greeks（可用 ?symbol= 只返回一个品种）
+    POST 创建组合 {"name": , "description": }
+    """
+    from services.portfolio_service import create_portfolio, get_portfolio_greeks
+    
+    if request.method == 'POST':
+        data = request.json or {}
+        name = (data.get('name') or '').strip()
+        if not name:
+            return jsonify({'success': False, 'message': 'Missing required field: name'}), 400
+        portfolio = create_portfolio(name, data.get('description', ''))
+        if portfolio is None:
+            return jsonify({'success': False, 'message': f'Portfolio already exists: {name}'}), 400
+        return jsonify({'success': True, 'portfolio': portfolio.to_dict()})
+    
+    symbol = request.args.get('symbol')
+    if symbol and symbol not in Config.TRACKED_SYMBOLS:
+        return jsonify({'success': False, 'message': f'Invalid symbol: {symbol}'}), 400
+    symbols = [symbol] if symbol else Config.TRACKED_SYMBOLS
+    
+    return jsonify({
+        'success': True,
+        'portfolios': [
+            dict(portfolio.to_dict(), greeks=get_portfolio_greeks(portfolio.id, symbols))
+            for portfolio in Portfolio.query.order_by(Portfolio.name).all()
+        ]
+    })
+
+@app.route('/api/portfolios/<int:portfolio_id>')
+def portfolio_detail(portfolio_id):
+    """组合的持仓明细和汇总Greeks"""
+    from services.portfolio_service import get_positions, get_portfolio_greeks
+    
+    portfolio = Portfolio.query.get(portfolio_id)
+    if not portfolio:
+        return jsonify({'success': False, 'message': 'Portfolio not found'}), 404
+    
+    return jsonify({
+        'success': True,
+        'portfolio': dict(
+            portfolio.to_dict(),
+            positions=get_positions(portfolio_id),
+            greeks=get_portfolio_greeks(portfolio_id, Config.TRACKED_SYMBOLS)
+        )
+    })
+
+@app.route('/api/portfolios/<int:portfolio_id>/positions', methods=['POST'])
+def update_positions(portfolio_id):
+    """
+    设置持仓数量 {"positions": [{"instrument_id": 1, "quantity": 10}, {"exchange": "deribit", "instrument": "BTC-27JUN25-100000-C", "quantity": -5}]}
+    只修改列出的合约，数量为0时删除持仓
+    """
+    from services.portfolio_service import set_positions, get_portfolio_greeks
+    
+    positions = (request.json or {}).get('positions')
+    if not isinstance(positions, list):
+        return jsonify({'success': False, 'message': 'Missing required field: positions'}), 400
+    
+    try:
+        updated = set_positions(portfolio_id, positions)
+    except (TypeError, ValueError) as e:
+        return jsonify({'success': False, 'message': str(e)}), 400
+    
+    if updated is None:
+        return jsonify({'success': False, 'message': 'Portfolio not found'}), 404
+    return jsonify({
+        'success': True,
+        'updated': updated,
+        'greeks': get_portfolio_greeks(portfolio_id, Config.TRACKED_SYMBOLS)
+    })
+
+@app.route('/api/portfolios/delete/<int:portfolio_id>', methods=['POST'])
+def delete_portfolio(portfolio_id):
+    from services.portfolio_service import delete_portfolio as remove_portfolio
+    
+    if remove_portfolio(portfolio_id):
+        return jsonify({'success': True})
+    return jsonify({'success': False, 'message': 'Portfolio not found'}), 404
+
 @app.route('/settings')
 def settings():
     time_period = request.args.get('time_period', '15m')
@@ -364,15 +709,23 @@ def refresh_data():
     if not symbol:
         return jsonify({'success': False, 'message': 'Symbol is required'}), 400
     
-    # 使用DataService获取最新数据
-    success = data_service.fetch_and_store_option_data(symbol)
+    # 在后台执行采集和计算，同一品种的并发刷新请求合并为一个任务
+    job, created = refresh_job_manager.submit(symbol)
     
-    if success:
-        # 使用RiskService计算风险指标
-        risk_result = risk_service.calculate_risk_indicators(symbol)
-        return jsonify({'success': True})
-    else:
-        return jsonify({'success': False, 'message': 'Error fetching option data'}), 500
+    result = job.to_dict()
+    result.update({'success': True, 'deduplicated': not created})
+    return jsonify(result), 202
+
+@app.route('/api/data/refresh/<job_id>', methods=['GET'])
+def refresh_data_status(job_id):
+    """查询刷新任务状态"""
+    job = refresh_job_manager.get(job_id)
+    if not job:
+        return jsonify({'success': False, 'message': 'Job not found'}), 404
+    
+    result = job.to_dict()
+    result['success'] = True
+    return jsonify(result)
 
 @app.route('/deviation_monitor')
 def deviation_monitor():
@@ -433,6 +786,7 @@ def deviation_monitor():
                           expiration_dates=[exp[0] for exp in expiration_dates])
 
 @app.route('/api/deviation/data')
+@cached_response(StrikeDeviationMonitor)
 def deviation_data_api():
     """获取期权执行价偏离数据API"""
     try:
@@ -579,6 +933,7 @@ def acknowledge_deviation_alert_api():
         return jsonify({'success': False, 'message': 'Alert not found'}), 404
         
 @app.route('/api/deviation/volume-analysis')
+@cached_response(StrikeDeviationMonitor)
 def deviation_volume_analysis_api():
     """获取期权执行价偏离监控的多空成交量分析数据API"""
     try:
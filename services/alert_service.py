@@ -4,6 +4,8 @@ from datetime import datetime
 from app import db
 from models import Alert, AlertThreshold
 from config import Config
+from services.event_hub import publish_after_commit
+from services.indicators import evaluate_threshold
 
 logger = logging.getLogger(__name__)
 
@@ -99,19 +101,13 @@ def check_individual_threshold(symbol, indicator_name, current_value, threshold)
     if not threshold.is_enabled:
         return
     
-    alert_type = None
-    threshold_value = None
-    
     # Check from most severe to least severe
-    if current_value >= threshold.severe_threshold:
-        alert_type = 'severe'
-        threshold_value = threshold.severe_threshold
-    elif current_value >= threshold.warning_threshold:
-        alert_type = 'warning'
-        threshold_value = threshold.warning_threshold
-    elif current_value >= threshold.attention_threshold:
-        alert_type = 'attention'
-        threshold_value = threshold.attention_threshold
+    alert_type, threshold_value = evaluate_threshold(
+        current_value,
+        threshold.attention_threshold,
+        threshold.warning_threshold,
+        threshold.severe_threshold
+    )
     
     if alert_type:
         # Create alert message
@@ -141,6 +137,18 @@ def check_individual_threshold(symbol, indicator_name, current_value, threshold)
             )
             
             db.session.add(alert)
+            db.session.flush()
+            
+            publish_after_commit(db.session, 'alert', {
+                'id': alert.id,
+                'symbol': symbol,
+                'indicator': indicator_name,
+                'time_period': threshold.time_period,
+                'alert_type': alert_type,
+                'value': float(current_value),
+                'threshold': float(threshold_value),
+                'message': message
+            })
             db.session.commit()
             
             logger.info(f"Generated {alert_type} alert: {message}")
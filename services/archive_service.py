@@ -0,0 +1,194 @@
+"""
+期权数据冷归档
+超过热数据保留期的OptionData在删除前按 symbol/exchange/date 分区导出为Parquet文件，
+字符串列使用字典编码；读取时通过内存映射的Arrow数据集按时间范围查询，与数据库中的热数据合并
+
+需要可选依赖 pyarrow
+"""
+import logging
+import os
+from datetime import datetime, timedelta, time as dt_time
+
+from app import db
+from models import OptionData
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+try:
+    import pyarrow as pa
+    import pyarrow.dataset as ds
+    import pyarrow.parquet as pq
+    from pyarrow import fs as pa_fs
+except ImportError:  # 可选依赖
+    pa = None
+
+# 归档的列，与OptionData保持一致（不含自增id）
+ARCHIVE_COLUMNS = (
+    'symbol', 'exchange', 'instrument_id', 'timestamp', 'expiration_date', 'strike_price', 'option_type',
+    'underlying_price', 'option_price', 'volume', 'open_interest', 'implied_volatility',
+    'delta', 'gamma', 'theta', 'vega'
+)
+# 取值重复度高的列使用字典编码
+DICTIONARY_COLUMNS = ['symbol', 'exchange', 'option_type']
+
+_DONE_DIR = '_archived_days'
+
+
+def is_available():
+    return pa is not None
+
+
+def _schema():
+    return pa.schema([
+        ('symbol', pa.string()),
+        ('exchange', pa.string()),
+        ('instrument_id', pa.int32()),
+        ('timestamp', pa.timestamp('us')),
+        ('expiration_date', pa.date32()),
+        ('strike_price', pa.float64()),
+        ('option_type', pa.string()),
+        ('underlying_price', pa.float64()),
+        ('option_price', pa.float64()),
+        ('volume', pa.int64()),
+        ('open_interest', pa.int64()),
+        ('implied_volatility', pa.float64()),
+        ('delta', pa.float64()),
+        ('gamma', pa.float64()),
+        ('theta', pa.float64()),
+        ('vega', pa.float64()),
+    ])
+
+
+def _done_marker(day):
+    return os.path.join(Config.ARCHIVE_DIR, _DONE_DIR, day.isoformat())
+
+
+def _partition_path(symbol, exchange, day):
+    return os.path.join(Config.ARCHIVE_DIR, f"symbol={symbol}", f"exchange={exchange}", f"date={day.isoformat()}")
+
+
+def archive_day(day):
+    """
+    将某一天（UTC）的OptionData导出为Parquet，每个 symbol/exchange 一个分区文件
+
+    返回:
+    导出的行数
+    """
+    start = datetime.combine(day, dt_time.min)
+    end = start + timedelta(days=1)
+
+    columns = [getattr(OptionData, name) for name in ARCHIVE_COLUMNS]
+    query = db.session.query(*columns).filter(
+        OptionData.timestamp >= start,
+        OptionData.timestamp < end
+    ).order_by(OptionData.symbol, OptionData.exchange, OptionData.timestamp).execution_options(yield_per=10000)
+
+    partitions = {}
+    for row in query:
+        data = partitions.setdefault((row.symbol, row.exchange), {name: [] for name in ARCHIVE_COLUMNS})
+        for name, value in zip(ARCHIVE_COLUMNS, row):
+            data[name].append(value)
+
+    schema = _schema()
+    total = 0
+    for (symbol, exchange), data in partitions.items():
+        table = pa.Table.from_pydict(data, schema=schema)
+        directory = _partition_path(symbol, exchange, day)
+        os.makedirs(directory, exist_ok=True)
+
+        # 先写临时文件再重命名，中断时不会留下不完整的分区
+        path = os.path.join(directory, 'part-0.parquet')
+        tmp_path = path + '.tmp'
+        pq.write_table(table, tmp_path, compression='zstd', use_dictionary=DICTIONARY_COLUMNS)
+        os.replace(tmp_path, path)
+        total += table.num_rows
+
+    os.makedirs(os.path.dirname(_done_marker(day)), exist_ok=True)
+    with open(_done_marker(day), 'w') as f:
+        f.write(str(total))
+
+    logger.info(f"已归档 {day} 的期权数据 {total} 行，{len(partitions)} 个分区")
+    return total
+
+
+def archive_before(cutoff):
+    """
+    归档cutoff之前所有已结束且尚未归档的日期（cutoff应为某天的0点）
+
+    返回:
+    bool - 全部归档成功时返回True，调用方只有在成功时才能删除数据库中的数据
+    """
+    if not is_available():
+        logger.error("未安装pyarrow，无法归档期权数据")
+        return False
+
+    earliest = db.session.query(db.func.min(OptionData.timestamp)).filter(
+        OptionData.timestamp < cutoff
+    ).scalar()
+    if earliest is None:
+        return True
+
+    day = earliest.date()
+    last_day = (cutoff - timedelta(microseconds=1)).date()
+    try:
+        while day <= last_day:
+            if not os.path.exists(_done_marker(day)):
+                archive_day(day)
+            day += timedelta(days=1)
+    except Exception as e:
+        logger.error(f"归档 {day} 的期权数据失败: {str(e)}")
+        return False
+    return True
+
+
+def read_archive_table(symbol, start, end, exchange=None, option_type=None, columns=None):
+    """
+    从归档中读取 [start, end) 范围内的数据
+
+    返回:
+    pyarrow.Table，未安装pyarrow或没有归档时返回None
+    """
+    if not is_available() or not os.path.isdir(os.path.join(Config.ARCHIVE_DIR, f"symbol={symbol}")):
+        return None
+
+    # 内存映射读取，多个进程读取同一文件时共享页缓存
+    dataset = ds.dataset(
+        Config.ARCHIVE_DIR,
+        format='parquet',
+        partitioning='hive',
+        filesystem=pa_fs.LocalFileSystem(use_mmap=True),
+        exclude_invalid_files=True,
+        ignore_prefixes=['_', '.']
+    )
+
+    condition = (
+        (ds.field('symbol') == symbol) &
+        (ds.field('date') >= start.date().isoformat()) &
+        (ds.field('date') <= end.date().isoformat()) &
+        (ds.field('timestamp') >= pa.scalar(start, type=pa.timestamp('us'))) &
+        (ds.field('timestamp') < pa.scalar(end, type=pa.timestamp('us')))
+    )
+    if exchange:
+        condition = condition & (ds.field('exchange') == exchange)
+    if option_type:
+        condition = condition & (ds.field('option_type') == option_type)
+
+    return dataset.to_table(columns=list(columns or ARCHIVE_COLUMNS), filter=condition)
+
+
+def load_archived_option_data(symbol, start, end, exchange=None, option_type=None):
+    """
+    读取归档数据并转换为OptionData对象（不加入数据库会话），按时间升序
+    """
+    table = read_archive_table(symbol, start, end, exchange=exchange, option_type=option_type)
+    if table is None or table.num_rows == 0:
+        return []
+
+    table = table.sort_by('timestamp')
+    return [OptionData(**row) for row in table.to_pylist()]
+
+
+def hot_window_start():
+    """数据库中保留的热数据的起始时间"""
+    return datetime.utcnow() - timedelta(days=Config.DATA_RETENTION_DAYS)
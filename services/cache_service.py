@@ -0,0 +1,235 @@
+"""
+API响应缓存模块
+按 (路由, 规范化查询参数, 数据版本) 缓存只读接口的响应体，
+并通过 ETag / Last-Modified 让未变化的轮询请求直接返回 304
+"""
+import hashlib
+import logging
+import pickle
+import threading
+import time
+from collections import OrderedDict
+from datetime import timezone
+from functools import wraps
+
+from flask import request, make_response
+from sqlalchemy import func
+
+from app import app, db
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class LRUCache:
+    """线程安全的进程内LRU缓存，条目带过期时间"""
+
+    def __init__(self, max_entries=256, ttl_seconds=600):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            entry = self._data.get(key)
+            if entry is None:
+                return None
+            expires_at, value = entry
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return None
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (time.monotonic() + self.ttl_seconds, value)
+            self._data.move_to_end(key)
+            while len(self._data) > self.max_entries:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def delete_where(self, predicate):
+        """删除键满足predicate的所有条目，返回删除的条目数"""
+        with self._lock:
+            keys = [key for key in self._data if predicate(key)]
+            for key in keys:
+                del self._data[key]
+        return len(keys)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+class RedisCache:
+    """基于Redis兼容服务的共享缓存，供多个worker进程共用"""
+
+    def __init__(self, url, ttl_seconds=600, prefix='ors:'):
+        import redis  # 可选依赖，仅在配置了CACHE_REDIS_URL时需要
+
+        self.client = redis.Redis.from_url(url)
+        self.ttl_seconds = ttl_seconds
+        self.prefix = prefix
+
+    def get(self, key):
+        try:
+            raw = self.client.get(self.prefix + key)
+            return pickle.loads(raw) if raw is not None else None
+        except Exception as e:
+            logger.warning(f"读取Redis缓存失败: {str(e)}")
+            return None
+
+    def set(self, key, value):
+        try:
+            self.client.setex(self.prefix + key, self.ttl_seconds, pickle.dumps(value))
+        except Exception as e:
+            logger.warning(f"写入Redis缓存失败: {str(e)}")
+
+    def delete(self, key):
+        try:
+            self.client.delete(self.prefix + key)
+        except Exception as e:
+            logger.warning(f"删除Redis缓存失败: {str(e)}")
+
+
+class TieredCache:
+    """两级缓存: 进程内LRU在前，可选的共享Redis在后"""
+
+    def __init__(self, local, shared=None):
+        self.local = local
+        self.shared = shared
+
+    def get(self, key):
+        value = self.local.get(key)
+        if value is None and self.shared is not None:
+            value = self.shared.get(key)
+            if value is not None:
+                self.local.set(key, value)
+        return value
+
+    def set(self, key, value):
+        self.local.set(key, value)
+        if self.shared is not None:
+            self.shared.set(key, value)
+
+    def delete(self, key):
+        self.local.delete(key)
+        if self.shared is not None:
+            self.shared.delete(key)
+
+
+def _create_response_cache():
+    local = LRUCache(Config.RESPONSE_CACHE_MAX_ENTRIES, Config.RESPONSE_CACHE_TTL_SECONDS)
+    shared = None
+    if Config.CACHE_REDIS_URL:
+        try:
+            shared = RedisCache(Config.CACHE_REDIS_URL, Config.RESPONSE_CACHE_TTL_SECONDS)
+            logger.info("API响应缓存已启用Redis共享后端")
+        except Exception as e:
+            logger.warning(f"无法初始化Redis缓存后端，仅使用进程内缓存: {str(e)}")
+    return TieredCache(local, shared)
+
+
+response_cache = _create_response_cache()
+
+# 数据版本的短期缓存，避免每次轮询都查询数据库
+_version_cache = {}
+_version_lock = threading.Lock()
+
+
+def get_data_version(*models):
+    """
+    获取一组数据表的当前版本
+
+    每张表的版本由 max(id) 和 max(timestamp) 组成：任何新写入都会改变max(id)，
+    max(timestamp) 则作为 Last-Modified 使用
+
+    返回:
+    (版本字符串, 最后修改时间)
+    """
+    cache_key = tuple(model.__tablename__ for model in models)
+    now = time.monotonic()
+
+    with _version_lock:
+        cached = _version_cache.get(cache_key)
+        if cached and cached[0] > now:
+            return cached[1], cached[2]
+
+    parts = []
+    last_modified = None
+    for model in models:
+        max_id, max_ts = db.session.query(func.max(model.id), func.max(model.timestamp)).one()
+        parts.append(f"{model.__tablename__}:{max_id or 0}")
+        if max_ts and (last_modified is None or max_ts > last_modified):
+            last_modified = max_ts
+
+    version = '|'.join(parts)
+    with _version_lock:
+        _version_cache[cache_key] = (now + Config.DATA_VERSION_TTL_SECONDS, version, last_modified)
+    return version, last_modified
+
+
+def invalidate_data_version():
+    """清除数据版本缓存，使下一次请求立即看到新数据"""
+    with _version_lock:
+        _version_cache.clear()
+
+
+def cached_response(*models):
+    """
+    只读API的响应缓存装饰器
+
+    参数:
+    models - 决定数据版本的模型类，任何一张表有新写入都会使缓存失效
+    """
+    def decorator(view):
+        @wraps(view)
+        def wrapper(*args, **kwargs):
+            try:
+                version, last_modified = get_data_version(*models)
+            except Exception as e:
+                logger.warning(f"获取数据版本失败，跳过响应缓存: {str(e)}")
+                return view(*args, **kwargs)
+
+            query_args = '&'.join(f"{k}={v}" for k, v in sorted(request.args.items(multi=True)))
+            cache_key = hashlib.sha1(
+                f"{request.path}?{query_args}#{version}".encode('utf-8')
+            ).hexdigest()
+            etag = cache_key[:32]
+
+            if last_modified is not None:
+                last_modified = last_modified.replace(tzinfo=timezone.utc, microsecond=0)
+
+            # 客户端已持有当前版本，直接返回304
+            if request.if_none_match.contains_weak(etag) or (
+                not request.if_none_match
+                and last_modified is not None
+                and request.if_modified_since is not None
+                and last_modified <= request.if_modified_since
+            ):
+                response = app.response_class(status=304)
+            else:
+                cached = response_cache.get(cache_key)
+                if cached is not None:
+                    body, status, mimetype = cached
+                    response = app.response_class(body, status=status, mimetype=mimetype)
+                else:
+                    response = make_response(view(*args, **kwargs))
+                    if response.status_code != 200:
+                        return response
+                    response_cache.set(cache_key, (response.get_data(), response.status_code, response.mimetype))
+
+            response.set_etag(etag, weak=True)
+            if last_modified is not None:
+                response.last_modified = last_modified
+            # 允许浏览器保存响应，但每次使用前都必须重新验证
+            response.cache_control.no_cache = True
+            return response
+
+        return wrapper
+    return decorator
@@ -0,0 +1,240 @@
+"""
+交易所请求熔断与自适应超时
+按 (交易所, 端点) 维护熔断器和延迟统计：
+- 连续失败达到阈值后熔断，熔断期间的请求立即失败，到期后放行一个探测请求（半开）
+- 超时时间按近期延迟的高分位数自适应，而不是每次等满ccxt的15秒
+- 请求耗时超过常见延迟时通过另一个客户端发出一个对冲请求，取先返回的结果
+- 客户端实例不是线程安全的: 每个实例同时只执行一个请求，超时或对冲落败的请求结束前该实例不接受新请求
+- 每个交易所使用独立的线程池，一个交易所的慢请求不会占满其他交易所的线程
+"""
+import logging
+import threading
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, FIRST_COMPLETED, wait
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+STATE_CLOSED = 'closed'
+STATE_OPEN = 'open'
+STATE_HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """熔断器处于打开状态，请求未发出"""
+    pass
+
+
+class CircuitBreaker:
+    """单个端点的熔断器"""
+
+    def __init__(self, name, failure_threshold=5, reset_timeout=60):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.state = STATE_CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+
+    def allow_request(self):
+        with self._lock:
+            if self.state == STATE_CLOSED:
+                return True
+            if self.state == STATE_OPEN:
+                if time.monotonic() - self._opened_at < self.reset_timeout:
+                    return False
+                self.state = STATE_HALF_OPEN
+                self._probe_in_flight = False
+                logger.info(f"熔断器 {self.name} 进入半开状态，放行探测请求")
+            # 半开状态只放行一个探测请求
+            if self._probe_in_flight:
+                return False
+            self._probe_in_flight = True
+            return True
+
+    def record_success(self):
+        with self._lock:
+            if self.state != STATE_CLOSED:
+                logger.info(f"熔断器 {self.name} 已恢复")
+            self.state = STATE_CLOSED
+            self._failures = 0
+            self._probe_in_flight = False
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self.state == STATE_HALF_OPEN or self._failures >= self.failure_threshold:
+                if self.state != STATE_OPEN:
+                    logger.warning(f"熔断器 {self.name} 已打开（连续失败{self._failures}次），"
+                                   f"{self.reset_timeout}秒后重试")
+                self.state = STATE_OPEN
+                self._opened_at = time.monotonic()
+                self._probe_in_flight = False
+
+
+class LatencyTracker:
+    """记录近期请求延迟，用于计算自适应超时和对冲延迟"""
+
+    def __init__(self, window=200):
+        self._samples = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, seconds):
+        with self._lock:
+            self._samples.append(seconds)
+
+    def percentile(self, q):
+        with self._lock:
+            samples = sorted(self._samples)
+        if len(samples) < Config.ADAPTIVE_TIMEOUT_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(q * len(samples)))]
+
+    def timeout(self):
+        p99 = self.percentile(0.99)
+        if p99 is None:
+            return Config.ADAPTIVE_TIMEOUT_MAX_SECONDS
+        return min(Config.ADAPTIVE_TIMEOUT_MAX_SECONDS,
+                   max(Config.ADAPTIVE_TIMEOUT_MIN_SECONDS, p99 * Config.ADAPTIVE_TIMEOUT_MULTIPLIER))
+
+    def hedge_delay(self):
+        delay = self.percentile(Config.HEDGE_PERCENTILE)
+        if delay is None:
+            return None
+        # 设置下限，避免延迟极低时几乎每个请求都被对冲，浪费请求预算
+        return max(delay, Config.HEDGE_MIN_DELAY_SECONDS)
+
+
+class ClientSlots:
+    """记录同一交易所每个客户端实例上未结束的请求，保证一个实例同时只执行一个请求"""
+
+    def __init__(self):
+        self._busy = {}  # id(client) -> Future
+        self._lock = threading.Lock()
+
+    def submit(self, executor, clients, method, args, kwargs):
+        """
+        在第一个空闲的客户端上提交请求
+
+        返回:
+        (Future, 所有客户端都忙时为None), 忙碌客户端的未结束请求列表
+        """
+        with self._lock:
+            running = []
+            for client in clients:
+                future = self._busy.get(id(client))
+                if future is not None and not future.done():
+                    running.append(future)
+                    continue
+                future = executor.submit(getattr(client, method), *args, **kwargs)
+                self._busy[id(client)] = future
+                return future, running
+            return None, running
+
+
+class EndpointGuard:
+    """组合熔断器和延迟统计，保护对某个交易所端点的调用"""
+
+    def __init__(self, name, executor, slots):
+        self.name = name
+        self.breaker = CircuitBreaker(name, Config.CIRCUIT_BREAKER_FAILURE_THRESHOLD,
+                                      Config.CIRCUIT_BREAKER_RESET_SECONDS)
+        self.latency = LatencyTracker()
+        self._executor = executor
+        self._slots = slots
+
+    def call(self, clients, method, *args, hedge=False, failure_exceptions=(Exception,), **kwargs):
+        """
+        在熔断器和自适应超时保护下，在clients中第一个空闲的客户端上调用 client.method(*args, **kwargs)
+
+        参数:
+        clients - 同一交易所的客户端实例列表（主实例在前）；上一个请求未结束的实例不会被再次使用，
+                  所有实例都忙时在超时时间内等待其中一个空闲
+        hedge - 是否允许对冲请求（只用于幂等的读请求），对冲请求使用另一个空闲的实例
+        failure_exceptions - 计入熔断失败的异常类型，其他异常（如合约不存在）直接抛出
+
+        异常:
+        CircuitOpenError - 熔断器打开
+        TimeoutError - 超过自适应超时
+        """
+        if not self.breaker.allow_request():
+            raise CircuitOpenError(f"{self.name} 熔断中")
+
+        timeout = self.latency.timeout()
+        hedge_delay = self.latency.hedge_delay() if hedge and len(clients) > 1 else None
+        started = time.monotonic()
+
+        def remaining():
+            return max(0.0, timeout - (time.monotonic() - started))
+
+        try:
+            # 所有客户端都有未结束的请求时，等待其中一个结束
+            future, running = self._slots.submit(self._executor, clients, method, args, kwargs)
+            while future is None and remaining() > 0:
+                wait(running, timeout=remaining(), return_when=FIRST_COMPLETED)
+                future, running = self._slots.submit(self._executor, clients, method, args, kwargs)
+            if future is None:
+                raise TimeoutError(f"{self.name} 所有客户端的上一个请求均未结束")
+            # 延迟统计和对冲计时从请求实际发出时开始
+            started = time.monotonic()
+
+            futures = [future]
+            done, _ = wait(futures, timeout=hedge_delay if hedge_delay is not None else timeout)
+            if not done and hedge_delay is not None:
+                hedge_future, _ = self._slots.submit(self._executor, clients, method, args, kwargs)
+                if hedge_future is not None:
+                    logger.debug(f"{self.name} 请求超过 {hedge_delay:.2f} 秒，发出对冲请求")
+                    futures.append(hedge_future)
+                done, _ = wait(futures, timeout=remaining(), return_when=FIRST_COMPLETED)
+            if not done:
+                raise TimeoutError(f"{self.name} 请求超过自适应超时 {timeout:.2f} 秒")
+
+            result = next(iter(done)).result()
+        except (TimeoutError,) + tuple(failure_exceptions):
+            self.breaker.record_failure()
+            raise
+        except Exception:
+            # 非连接类错误说明交易所仍有响应，不计入熔断
+            self.breaker.record_success()
+            raise
+
+        self.latency.record(time.monotonic() - started)
+        self.breaker.record_success()
+        return result
+
+
+# 每个交易所一个线程池和客户端占用记录，用于超时控制和对冲请求；
+# 超时的请求在后台自然结束，只占用本交易所的线程和发出该请求的客户端实例
+_executors = {}
+_slots = {}
+_guards = {}
+_guards_lock = threading.Lock()
+
+
+def get_guard(exchange_id, endpoint):
+    """获取 (交易所, 端点) 的保护器"""
+    key = (exchange_id, endpoint)
+    with _guards_lock:
+        guard = _guards.get(key)
+        if guard is None:
+            executor = _executors.get(exchange_id)
+            if executor is None:
+                executor = ThreadPoolExecutor(max_workers=Config.EXCHANGE_CALL_WORKERS,
+                                              thread_name_prefix=f'exchange-call-{exchange_id}')
+                _executors[exchange_id] = executor
+                _slots[exchange_id] = ClientSlots()
+            guard = EndpointGuard(f"{exchange_id}:{endpoint}", executor, _slots[exchange_id])
+            _guards[key] = guard
+        return guard
+
+
+def is_circuit_open(exchange_id, endpoint):
+    """熔断器是否处于打开状态（不改变状态）"""
+    guard = _guards.get((exchange_id, endpoint))
+    if guard is None or guard.breaker.state != STATE_OPEN:
+        return False
+    return time.monotonic() - guard.breaker._opened_at < guard.breaker.reset_timeout
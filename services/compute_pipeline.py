@@ -0,0 +1,106 @@
+"""
+事件驱动的计算流水线
+每个完成入库的快照都会排队计算风险指标、GEX曲线、偏离指标和警报，而不是等待固定的计算周期
+"""
+import logging
+import queue
+import threading
+from datetime import datetime
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class ComputePipeline:
+    """
+    有界工作队列 + 单个计算线程
+
+    - 每个快照的风险指标都会计算，不跳过任何快照
+    - 队列已满时提交方阻塞等待（背压），超时后放弃并记录错误
+    - 同一快照重复提交会被合并；偏离指标基于时间窗口计算，
+      计算落后时同一品种只对最新的快照计算一次
+    """
+
+    def __init__(self, max_pending=20, submit_timeout=60):
+        self.submit_timeout = submit_timeout
+        self._queue = queue.Queue(maxsize=max_pending)
+        self._pending = set()
+        self._lock = threading.Lock()
+        self._thread = None
+
+    def submit(self, symbol, snapshot_time):
+        """
+        提交一个快照进行计算
+
+        返回:
+        bool - 是否已排队（或与已排队的任务合并）
+        """
+        key = (symbol, snapshot_time)
+        with self._lock:
+            if key in self._pending:
+                logger.debug(f"快照 {symbol}@{snapshot_time} 已在队列中，合并提交")
+                return True
+            self._pending.add(key)
+
+        self._ensure_worker()
+        try:
+            self._queue.put(key, timeout=self.submit_timeout)
+        except queue.Full:
+            with self._lock:
+                self._pending.discard(key)
+            logger.error(f"计算队列已满，快照 {symbol}@{snapshot_time} 提交超时")
+            return False
+
+        logger.info(f"快照 {symbol}@{snapshot_time} 已加入计算队列 (积压: {self._queue.qsize()})")
+        return True
+
+    def pending_count(self):
+        return self._queue.qsize()
+
+    def _ensure_worker(self):
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._thread = threading.Thread(target=self._run, name='compute-pipeline', daemon=True)
+            self._thread.start()
+
+    def _has_newer_pending(self, symbol, snapshot_time):
+        with self._lock:
+            return any(s == symbol and t > snapshot_time for s, t in self._pending)
+
+    def _run(self):
+        from app import app
+        from services.risk_calculator import calculate_risk_indicators
+        from services.deviation_monitor_service import calculate_deviation_metrics
+        from services.gex_service import update_gamma_profile
+
+        while True:
+            symbol, snapshot_time = self._queue.get()
+            try:
+                with app.app_context():
+                    # 风险指标和阈值警报针对这个快照计算
+                    calculate_risk_indicators(symbol, snapshot_time=snapshot_time)
+
+                    # Gamma敞口是附加指标，失败不影响偏离指标的计算
+                    try:
+                        update_gamma_profile(symbol, snapshot_time)
+                    except Exception as e:
+                        logger.error(f"计算{symbol}@{snapshot_time} Gamma敞口失败: {str(e)}")
+
+                    if self._has_newer_pending(symbol, snapshot_time):
+                        logger.info(f"{symbol} 有更新的快照在排队，偏离指标合并到最新快照计算")
+                    else:
+                        calculate_deviation_metrics(symbol)
+
+                lag = (datetime.utcnow() - snapshot_time).total_seconds()
+                logger.info(f"快照 {symbol}@{snapshot_time} 计算完成，入库后延迟 {lag:.1f} 秒")
+            except Exception as e:
+                logger.error(f"计算快照 {symbol}@{snapshot_time} 时出错: {str(e)}")
+            finally:
+                with self._lock:
+                    self._pending.discard((symbol, snapshot_time))
+                self._queue.task_done()
+
+
+compute_pipeline = ComputePipeline(Config.PIPELINE_MAX_PENDING, Config.PIPELINE_SUBMIT_TIMEOUT_SECONDS)
@@ -6,8 +6,17 @@ from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
 from services.exchange_api import get_option_market_data, get_underlying_price
 from app import db
-from models import OptionData
+from models import OptionData, OptionSnapshot, VarEstimate, GammaExposureProfile
 from config import Config
+from services.event_hub import publish_event
+from services.instrument_registry import instrument_registry
+from services.option_store import (
+    store_option_snapshot, get_retention_cutoff, load_option_window, has_partial_snapshots
+)
+from services.portfolio_service import portfolio_book
+from services.scenario_cache import scenario_cache
+from services.pricing import fill_missing_greeks
+from services.archive_service import archive_before, load_archived_option_data, hot_window_start
 
 logger = logging.getLogger(__name__)
 
@@ -64,19 +73,9 @@ class DataService:
         """
         from_date = datetime.utcnow() - timedelta(days=days)
         
-        # 构建查询
-        query = OptionData.query.filter(
-            OptionData.symbol == symbol,
-            OptionData.timestamp > from_date
-        )
-        
-        if exchange:
-            query = query.filter(OptionData.exchange == exchange)
-            
-        if option_type:
-            query = query.filter(OptionData.option_type == option_type)
-            
-        records = query.order_by(OptionData.timestamp.desc()).all()
+        # delta模式下按快照重建，包含未变化的合约
+        records = load_option_window(symbol, from_date, exchange=exchange, option_type=option_type)
+        records.reverse()
         
         # 转换为字典列表
         return [self._option_data_to_dict(option) for option in records]
@@ -96,6 +95,19 @@ class DataService:
         """
         from_date = datetime.utcnow() - timedelta(days=days)
         
+        # delta模式写入的快照只有变化的合约，成交量按重建的完整快照求和
+        if has_partial_snapshots(symbol, from_date, exchange=exchange):
+            records = load_option_window(symbol, from_date, exchange=exchange)
+            put_volume = sum(record.volume or 0 for record in records if record.option_type == 'put')
+            call_volume = sum(record.volume or 0 for record in records if record.option_type == 'call')
+            return {
+                'symbol': symbol,
+                'put_volume': put_volume,
+                'call_volume': call_volume,
+                'ratio': put_volume / call_volume if call_volume > 0 else 0,
+                'period': f'{days} days'
+            }
+        
         # 构建基本查询
         base_query = OptionData.query.filter(
             OptionData.symbol == symbol,
@@ -158,6 +170,7 @@ def fetch_latest_option_data(symbol):
     and store in the database.
 
     支持从Deribit, Binance, OKX获取期权数据
+    同一次获取的所有合约使用相同的快照时间戳，成功时返回该时间戳，失败返回False
     """
     try:
         logger.info(f"Fetching latest option data for {symbol} from supported exchanges")
@@ -212,59 +225,83 @@ def fetch_latest_option_data(symbol):
 
         logger.info(f"Total {len(all_option_data)} option contracts received for {symbol} from all exchanges")
 
-        # 将API数据转换为OptionData模型对象
-        new_records = []
-        for data in all_option_data:
-            # 将Unix时间戳转换为日期对象
-            if isinstance(data["expiration_date"], int):
-                expiration_date = datetime.fromtimestamp(data["expiration_date"] / 1000).date()
-            else:
-                expiration_date = data["expiration_date"]
+        # 本次快照的统一时间戳，后续计算按快照时间戳定位整条期权链
+        snapshot_time = datetime.utcnow()
 
-            # 处理可能的None值
-            if expiration_date is None:
-                continue  # 跳过没有到期日的记录
+        # 将报价记录转换为OptionData模型对象
+        all_option_data = [quote for quote in all_option_data if quote.expiration_date is not None]
 
-            # 安全转换为OptionData对象，处理可能的空值
-            try:
-                # 提供默认值0或None处理可能的无效值
-                option = OptionData(
-                    symbol=data["symbol"],
-                    expiration_date=expiration_date,
-                    strike_price=float(data["strike_price"]),
-                    option_type=data["option_type"],
-                    underlying_price=float(data["underlying_price"]),
-                    option_price=float(data.get("option_price", 0) or 0),
-                    volume=int(float(data.get("volume", 0) or 0)),
-                    open_interest=int(float(data.get("open_interest", 0) or 0)),
-                    implied_volatility=float(data.get("implied_volatility", 0) or 0),
-                    delta=float(data.get("delta", 0) or 0),
-                    gamma=float(data.get("gamma", 0) or 0),
-                    theta=float(data.get("theta", 0) or 0),
-                    vega=float(data.get("vega", 0) or 0),
-                    timestamp=data.get("timestamp", datetime.utcnow()),
-                    # 添加交易所信息
-                    exchange=data.get("exchange", "okx")  # 默认为okx作为主交易所
-                )
-                new_records.append(option)
-            except (ValueError, TypeError) as e:
-                logger.error(f"处理期权数据时出错: {e}，数据: {data}")
-                # 跳过无效数据但不中断整个处理
+        # 交易所未提供的隐含波动率和Greeks按本地Black-76模型补齐，各交易所口径一致
+        filled = fill_missing_greeks(all_option_data, snapshot_time)
+        if filled:
+            logger.info(f"{symbol} 本地计算补齐了 {filled}/{len(all_option_data)} 个合约的隐含波动率或Greeks")
+        instrument_ids = instrument_registry.resolve_quotes(all_option_data)
+        new_records = [
+            _quote_to_record(quote, snapshot_time, instrument_id)
+            for quote, instrument_id in zip(all_option_data, instrument_ids)
+        ]
 
-        # 保存到数据库
-        db.session.bulk_save_objects(new_records)
+        # 保存到数据库 - delta模式下只写入有变化的合约
+        store_option_snapshot(symbol, snapshot_time, new_records)
         db.session.commit()
 
+        # 用新快照增量更新本进程已加载的持仓Greeks
+        try:
+            portfolio_book.on_snapshot(symbol, snapshot_time, new_records)
+        except Exception as e:
+            logger.error(f"更新{symbol}持仓Greeks失败: {str(e)}")
+
+        # 清除旧快照的情景缓存
+        try:
+            scenario_cache.on_snapshot(symbol, snapshot_time)
+        except Exception as e:
+            logger.error(f"清除{symbol}旧快照的情景缓存失败: {str(e)}")
+
+        # 推送新快照事件
+        exchange_counts = {}
+        for record in new_records:
+            exchange_counts[record.exchange] = exchange_counts.get(record.exchange, 0) + 1
+        publish_event('snapshot', {
+            'symbol': symbol,
+            'timestamp': snapshot_time.isoformat(),
+            'count': len(new_records),
+            'exchanges': exchange_counts
+        })
+
         # 清理旧数据
         cleanup_old_data()
 
-        return True
+        return snapshot_time
 
     except Exception as e:
         logger.error(f"Error fetching option data from API: {str(e)}")
         db.session.rollback()
         return False
 
+def _quote_to_record(quote, snapshot_time, instrument_id=None):
+    """
+    将交易所解析器产出的Quote转换为OptionData记录
+    成交量和持仓量缺失时按0存储；隐含波动率和Greeks缺失时保持为空，避免0值参与指标和情景计算
+    """
+    return OptionData(
+        symbol=quote.symbol,
+        expiration_date=quote.expiration_date,
+        strike_price=quote.strike_price,
+        option_type=quote.option_type,
+        underlying_price=quote.underlying_price,
+        option_price=quote.option_price or 0.0,
+        volume=int(quote.volume or 0),
+        open_interest=int(quote.open_interest or 0),
+        implied_volatility=quote.implied_volatility,
+        delta=quote.delta,
+        gamma=quote.gamma,
+        theta=quote.theta,
+        vega=quote.vega,
+        timestamp=snapshot_time,
+        exchange=quote.exchange,
+        instrument_id=instrument_id
+    )
+
 def fetch_historical_data(symbol, days=30):
     """
     Fetch historical option data for backtesting or analysis.
@@ -273,10 +310,13 @@ def fetch_historical_data(symbol, days=30):
     try:
         from_date = datetime.utcnow() - timedelta(days=days)
 
-        historical_data = OptionData.query.filter(
-            OptionData.symbol == symbol,
-            OptionData.timestamp > from_date
-        ).order_by(OptionData.timestamp).all()
+        # delta模式下按快照重建，包含未变化的合约
+        historical_data = load_option_window(symbol, from_date)
+
+        # 超出数据库热数据范围的部分从归档中读取
+        if Config.ARCHIVE_ENABLED and from_date < hot_window_start():
+            hot_start = historical_data[0].timestamp if historical_data else datetime.utcnow()
+            historical_data = load_archived_option_data(symbol, from_date, hot_start) + historical_data
 
         return historical_data
 
@@ -289,9 +329,25 @@ def cleanup_old_data():
     try:
         cutoff_date = datetime.utcnow() - timedelta(days=Config.DATA_RETENTION_DAYS)
 
-        # Delete old option data
+        if Config.ARCHIVE_ENABLED:
+            # 只删除已完整归档的日期，归档失败时不删除任何数据
+            cutoff_date = datetime.combine(cutoff_date.date(), datetime.min.time())
+            if not archive_before(cutoff_date):
+                logger.error("期权数据归档失败，跳过本次数据清理")
+                return
+
+        # Delete old option data - 保留较新快照仍然引用的关键帧
         deleted_count = OptionData.query.filter(
-            OptionData.timestamp < cutoff_date
+            OptionData.timestamp < get_retention_cutoff(cutoff_date)
+        ).delete()
+        OptionSnapshot.query.filter(
+            OptionSnapshot.snapshot_time < cutoff_date
+        ).delete()
+        VarEstimate.query.filter(
+            VarEstimate.created_at < cutoff_date
+        ).delete()
+        GammaExposureProfile.query.filter(
+            GammaExposureProfile.snapshot_time < cutoff_date
         ).delete()
 
         db.session.commit()
@@ -7,8 +7,12 @@ import logging
 from datetime import datetime, timedelta
 import numpy as np
 from statistics import mean, stdev
-from models import db, OptionData, StrikeDeviationMonitor, DeviationAlert
+from models import db, StrikeDeviationMonitor, DeviationAlert
 from config import Config
+from services.event_hub import publish_after_commit
+from services.instrument_registry import instrument_registry
+from services.option_store import load_option_window, get_latest_underlying_price
+from services.indicators import check_deviation_anomaly
 
 logger = logging.getLogger(__name__)
 
@@ -61,6 +65,17 @@ class DeviationMonitorService:
             include_history=include_history
         )
 
+def _contract_key(option):
+    """跨时间窗口匹配同一合约的键，优先使用合约维度表的整数ID"""
+    if option.instrument_id is not None:
+        return option.instrument_id
+    # 合约维度表上线前写入的旧数据
+    instrument_id = instrument_registry.lookup(option.exchange, option.symbol, option.expiration_date,
+                                               option.strike_price, option.option_type)
+    if instrument_id is not None:
+        return instrument_id
+    return (option.exchange, option.option_type, option.strike_price, option.expiration_date)
+
 def calculate_deviation_metrics(symbol, time_periods=None):
     """
     计算期权执行价偏离指标
@@ -78,38 +93,28 @@ def calculate_deviation_metrics(symbol, time_periods=None):
     logger.info(f"计算{symbol}的期权执行价偏离指标，时间周期: {time_periods}")
     
     # 获取最新的市场价格
-    latest_option = OptionData.query.filter_by(symbol=symbol).order_by(
-        OptionData.timestamp.desc()).first()
+    current_market_price = get_latest_underlying_price(symbol)
     
-    if not latest_option:
+    if not current_market_price:
         logger.warning(f"没有找到{symbol}的期权数据")
         return False
     
-    current_market_price = latest_option.underlying_price
-    
     for period in time_periods:
         # 计算时间窗口
         time_window_minutes = Config.TIME_PERIODS[period]['minutes']
         from_time = datetime.utcnow() - timedelta(minutes=time_window_minutes)
         
-        # 获取当前时间窗口内的期权数据
-        current_options = OptionData.query.filter(
-            OptionData.symbol == symbol,
-            OptionData.timestamp >= from_time
-        ).all()
+        # 获取当前时间窗口内的期权数据（delta模式下按快照重建，包含未变化的合约）
+        current_options = load_option_window(symbol, from_time)
         
         # 获取上一个时间窗口的期权数据用于计算变化率
         prev_from_time = from_time - timedelta(minutes=time_window_minutes)
-        prev_options = OptionData.query.filter(
-            OptionData.symbol == symbol,
-            OptionData.timestamp >= prev_from_time,
-            OptionData.timestamp < from_time
-        ).all()
+        prev_options = load_option_window(symbol, prev_from_time, from_time)
         
         # 建立前一时间段数据的映射，用于快速查找
         prev_option_map = {}
         for opt in prev_options:
-            key = f"{opt.option_type}_{opt.strike_price}_{opt.expiration_date}"
+            key = _contract_key(opt)
             if key not in prev_option_map or opt.timestamp > prev_option_map[key].timestamp:
                 prev_option_map[key] = opt
         
@@ -125,8 +130,7 @@ def calculate_deviation_metrics(symbol, time_periods=None):
             # 只关注偏离率小于或等于10%的期权
             if deviation_percent <= Config.OPTION_STRIKE_RANGE_PCT:  # 10%
                 # 查找前一时间段的同一合约
-                key = f"{option.option_type}_{option.strike_price}_{option.expiration_date}"
-                prev_option = prev_option_map.get(key)
+                prev_option = prev_option_map.get(_contract_key(option))
                 
                 # 计算变化率
                 volume_change_pct = None
@@ -199,53 +203,6 @@ def calculate_deviation_metrics(symbol, time_periods=None):
     
     return True
 
-def check_deviation_anomaly(volume_change, premium_change, price_change, option_type, strike_price, market_price):
-    """
-    检查期权偏离是否异常
-    满足以下任一条件即为异常:
-    1. 成交量变化率 >= 50%
-    2. 权利金变化率 >= 30%
-    3. 权利金变化率和市场价格变化率方向相反（背离）
-    
-    异常级别:
-    - 关注级: 单一指标超过阈值
-    - 警告级: 两项指标超过阈值或出现方向背离
-    - 严重级: 三项指标都超过阈值
-    """
-    is_anomaly = False
-    anomaly_level = None
-    anomaly_count = 0
-    
-    # 检查成交量变化率
-    if volume_change is not None and volume_change >= 50:
-        is_anomaly = True
-        anomaly_count += 1
-    
-    # 检查权利金变化率
-    if premium_change is not None and abs(premium_change) >= 30:
-        is_anomaly = True
-        anomaly_count += 1
-    
-    # 检查背离情况 - 权利金变化率和市场价格变化率方向相反
-    divergence = False
-    if premium_change is not None and price_change is not None:
-        # 计算相关性：如果权利金和价格变化方向相反
-        if premium_change * price_change < 0:
-            is_anomaly = True
-            divergence = True
-            anomaly_count += 1
-    
-    # 确定异常级别
-    if is_anomaly:
-        if anomaly_count == 1:
-            anomaly_level = 'attention'  # 关注级
-        elif anomaly_count == 2 or divergence:
-            anomaly_level = 'warning'    # 警告级
-        else:
-            anomaly_level = 'severe'     # 严重级
-    
-    return is_anomaly, anomaly_level
-
 def generate_deviation_alert(deviation, anomaly_level, volume_change, premium_change, price_change):
     """
     生成期权执行价偏离警报，避免重复警报
@@ -310,6 +267,18 @@ def generate_deviation_alert(deviation, anomaly_level, volume_change, premium_ch
     
     db.session.add(alert)
     logger.info(f"生成{anomaly_level}级别期权偏离警报: {message}")
+    
+    # 警报随偏离数据一起提交，提交成功后才推送
+    publish_after_commit(db.session, 'deviation_alert', {
+        'symbol': deviation.symbol,
+        'exchange': deviation.exchange,
+        'time_period': deviation.time_period,
+        'strike_price': deviation.strike_price,
+        'option_type': deviation.option_type,
+        'deviation_percent': deviation.deviation_percent,
+        'alert_type': anomaly_level,
+        'message': message
+    })
 
 def get_deviation_data(symbol=None, time_period='4h', is_anomaly=None, days=7, exchange=None, option_type=None, volume_change_filter=None):
     """
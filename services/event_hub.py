@@ -0,0 +1,165 @@
+"""
+事件推送中心
+轻量级的进程内发布/订阅，用于通过SSE向前端推送新快照、风险指标和警报
+配置EVENT_REDIS_URL后，事件经Redis频道转发，使独立的采集进程也能推送到Web进程
+Web服务与worker.py分离部署时必须配置EVENT_REDIS_URL，否则采集进程发布的事件到不了SSE客户端
+"""
+import itertools
+import json
+import logging
+import queue
+import threading
+import time
+
+from sqlalchemy import event as sa_event
+from sqlalchemy.orm import Session
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+REDIS_CHANNEL = 'ors:events'
+# 会话中等待事务提交后发布的事件
+PENDING_EVENTS_KEY = 'pending_events'
+
+
+class SubscriberLimitError(Exception):
+    """本进程的订阅者数量已达上限"""
+    pass
+
+
+class EventHub:
+    """发布/订阅中心，每个订阅者持有一个有界队列"""
+
+    def __init__(self, max_queue_size=100, redis_url=None, max_subscribers=None):
+        self.max_queue_size = max_queue_size
+        self.max_subscribers = max_subscribers
+        self._subscribers = set()
+        self._lock = threading.Lock()
+        self._ids = itertools.count(1)
+        self._redis = None
+        self._listener = None
+
+        if redis_url:
+            try:
+                import redis  # 可选依赖
+
+                self._redis = redis.Redis.from_url(redis_url)
+                logger.info("事件中心已启用Redis转发")
+            except Exception as e:
+                logger.warning(f"无法连接Redis，事件仅在进程内推送: {str(e)}")
+                self._redis = None
+
+    def subscribe(self):
+        """
+        注册一个订阅者，返回其事件队列
+
+        异常:
+        SubscriberLimitError - 订阅者数量已达max_subscribers
+        """
+        q = queue.Queue(maxsize=self.max_queue_size)
+        with self._lock:
+            if self.max_subscribers and len(self._subscribers) >= self.max_subscribers:
+                raise SubscriberLimitError(f"SSE连接数已达上限 {self.max_subscribers}")
+            self._subscribers.add(q)
+        if self._redis is not None:
+            self._ensure_listener()
+        return q
+
+    def unsubscribe(self, q):
+        with self._lock:
+            self._subscribers.discard(q)
+
+    def publish(self, event_type, data):
+        """
+        发布一个事件
+
+        参数:
+        event_type - 事件类型，如 'snapshot', 'indicators', 'alert', 'deviation_alert'
+        data - 可JSON序列化的事件内容
+        """
+        event = {
+            'type': event_type,
+            'data': data,
+            'ts': time.time()
+        }
+        if self._redis is not None:
+            try:
+                self._redis.publish(REDIS_CHANNEL, json.dumps(event, default=str))
+                return
+            except Exception as e:
+                logger.warning(f"通过Redis发布事件失败，改为进程内推送: {str(e)}")
+        self._dispatch(event)
+
+    def _dispatch(self, event):
+        event = dict(event, id=next(self._ids))
+        with self._lock:
+            subscribers = list(self._subscribers)
+        for q in subscribers:
+            try:
+                q.put_nowait(event)
+            except queue.Full:
+                # 慢订阅者丢弃最旧的事件，避免阻塞发布方
+                try:
+                    q.get_nowait()
+                    q.put_nowait(event)
+                except (queue.Empty, queue.Full):
+                    pass
+
+    def _ensure_listener(self):
+        with self._lock:
+            if self._listener is not None and self._listener.is_alive():
+                return
+            self._listener = threading.Thread(target=self._listen, name='event-hub-redis', daemon=True)
+            self._listener.start()
+
+    def _listen(self):
+        """从Redis频道接收事件并分发给本进程的订阅者"""
+        while True:
+            try:
+                pubsub = self._redis.pubsub(ignore_subscribe_messages=True)
+                pubsub.subscribe(REDIS_CHANNEL)
+                for message in pubsub.listen():
+                    try:
+                        self._dispatch(json.loads(message['data']))
+                    except (ValueError, TypeError) as e:
+                        logger.warning(f"无法解析事件消息: {str(e)}")
+            except Exception as e:
+                logger.error(f"Redis事件监听出错，5秒后重连: {str(e)}")
+                time.sleep(5)
+
+
+def format_sse(event):
+    """将事件格式化为SSE消息"""
+    payload = json.dumps(event['data'], default=str, separators=(',', ':'))
+    return f"id: {event['id']}\nevent: {event['type']}\ndata: {payload}\n\n"
+
+
+def publish_event(event_type, data):
+    """发布事件，失败时只记录日志，不影响调用方的业务流程"""
+    try:
+        event_hub.publish(event_type, data)
+    except Exception as e:
+        logger.warning(f"发布{event_type}事件失败: {str(e)}")
+
+
+def publish_after_commit(session, event_type, data):
+    """
+    在session的事务提交成功后发布事件；事务回滚时丢弃
+    用于通知新写入的数据库记录，避免客户端收到事件时记录尚不可见或已被回滚
+    """
+    session.info.setdefault(PENDING_EVENTS_KEY, []).append((event_type, data))
+
+
+@sa_event.listens_for(Session, 'after_commit')
+def _publish_pending_events(session):
+    for event_type, data in session.info.pop(PENDING_EVENTS_KEY, []):
+        publish_event(event_type, data)
+
+
+@sa_event.listens_for(Session, 'after_soft_rollback')
+def _discard_pending_events(session, previous_transaction):
+    session.info.pop(PENDING_EVENTS_KEY, None)
+
+
+event_hub = EventHub(Config.SSE_SUBSCRIBER_QUEUE_SIZE, Config.EVENT_REDIS_URL, Config.SSE_MAX_CONNECTIONS)
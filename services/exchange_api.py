@@ -7,10 +7,16 @@ import json
 import time
 import hmac
 import hashlib
+import threading
 import requests
 import websocket
 from datetime import datetime, timedelta
 from urllib.parse import urlencode
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+from services.rate_limiter import rate_limiter
+from services.quote import Quote
 
 logger = logging.getLogger(__name__)
 
@@ -22,6 +28,43 @@ WS_URL = "wss://www.deribit.com/ws/api/v2"
 API_KEY = None
 API_SECRET = None
 
+# HTTP连接设置: (连接超时, 读取超时) 秒
+HTTP_TIMEOUT = (3.05, 10)
+HTTP_POOL_SIZE = 20
+
+# 每个线程一个Session，连接池保持长连接，避免每次请求重新建立TCP+TLS连接
+_session_local = threading.local()
+
+def _get_session():
+    """获取当前线程的HTTP Session"""
+    session = getattr(_session_local, 'session', None)
+    if session is None:
+        session = requests.Session()
+        retry = Retry(
+            total=2,
+            connect=2,
+            read=1,
+            backoff_factor=0.2,
+            status_forcelist=(502, 503, 504),
+            allowed_methods=frozenset(['GET'])
+        )
+        adapter = HTTPAdapter(pool_connections=4, pool_maxsize=HTTP_POOL_SIZE, max_retries=retry)
+        session.mount('https://', adapter)
+        session.headers.update({
+            'Accept': 'application/json',
+            'Accept-Encoding': 'gzip, deflate',
+            'Connection': 'keep-alive'
+        })
+        _session_local.session = session
+    return session
+
+def _http_get(path, params=None):
+    """通过共享连接池发送GET请求并返回JSON"""
+    rate_limiter.acquire('deribit')
+    response = _get_session().get(f"{BASE_URL}{path}", params=params, timeout=HTTP_TIMEOUT)
+    response.raise_for_status()
+    return response.json()
+
 def set_api_credentials(api_key, api_secret):
     """设置API凭证"""
     global API_KEY, API_SECRET
@@ -50,19 +93,173 @@ def get_auth_headers(api_key, api_secret):
         "Authorization": f"deri-hmac-sha256 id={api_key},ts={timestamp},nonce={nonce},sig={signature}"
     }
 
+class DeribitRpcError(Exception):
+    """Deribit JSON-RPC调用返回的错误"""
+    pass
+
+class DeribitRpcClient:
+    """
+    Deribit v2 JSON-RPC over WebSocket 客户端
+    
+    一个连接上可以同时有多个请求在途，按请求id匹配响应，
+    批量获取报价时不再受每个合约一次往返的限制
+    """
+    
+    def __init__(self, url=WS_URL, timeout=10, max_in_flight=50):
+        self.url = url
+        self.timeout = timeout
+        self.max_in_flight = max_in_flight
+        self._ws = None
+        self._next_id = 1
+        self._authenticated_key = None
+    
+    def connect(self):
+        """建立连接，配置了API凭证时进行认证"""
+        if self._ws is not None and self._ws.connected:
+            return
+        self._ws = websocket.create_connection(self.url, timeout=self.timeout)
+        self._authenticated_key = None
+        logger.info("Deribit WebSocket connection established")
+        
+        if API_KEY and API_SECRET:
+            self.call("public/auth", {
+                "grant_type": "client_credentials",
+                "client_id": API_KEY,
+                "client_secret": API_SECRET
+            })
+            self._authenticated_key = API_KEY
+            logger.info("Deribit WebSocket connection authenticated")
+    
+    def close(self):
+        if self._ws is not None:
+            try:
+                self._ws.close()
+            except Exception:
+                pass
+        self._ws = None
+    
+    def _send(self, method, params):
+        rate_limiter.acquire('deribit')
+        request_id = self._next_id
+        self._next_id += 1
+        self._ws.send(json.dumps({
+            "jsonrpc": "2.0",
+            "id": request_id,
+            "method": method,
+            "params": params
+        }))
+        return request_id
+    
+    def _recv(self):
+        """接收一条带id的响应，忽略订阅推送"""
+        while True:
+            message = json.loads(self._ws.recv())
+            if "id" in message:
+                return message
+    
+    def call(self, method, params=None):
+        """发送单个请求并等待结果"""
+        results = self.batch(method, [params or {}])
+        if isinstance(results[0], DeribitRpcError):
+            raise results[0]
+        return results[0]
+    
+    def batch(self, method, params_list):
+        """
+        在同一连接上流水线发送一组请求
+        
+        返回:
+        与params_list顺序一致的结果列表，单个请求失败时对应位置为DeribitRpcError
+        """
+        self.connect()
+        
+        results = [None] * len(params_list)
+        in_flight = {}
+        next_index = 0
+        deadline = time.monotonic() + self.timeout + len(params_list) * 0.05
+        
+        try:
+            while next_index < len(params_list) or in_flight:
+                # 保持有限个请求在途，避免超出交易所的速率限制
+                while next_index < len(params_list) and len(in_flight) < self.max_in_flight:
+                    in_flight[self._send(method, params_list[next_index])] = next_index
+                    next_index += 1
+                
+                if time.monotonic() > deadline:
+                    raise TimeoutError(f"Deribit RPC batch {method} timed out with {len(in_flight)} pending")
+                
+                message = self._recv()
+                index = in_flight.pop(message["id"], None)
+                if index is None:
+                    continue
+                if "error" in message:
+                    error = message["error"]
+                    results[index] = DeribitRpcError(f"{error.get('code')}: {error.get('message')}")
+                else:
+                    results[index] = message.get("result")
+        except Exception:
+            # 连接状态未知，丢弃连接，下次调用时重连
+            self.close()
+            raise
+        
+        return results
+
+# 每个线程复用一个WebSocket连接
+_rpc_local = threading.local()
+
+def get_rpc_client():
+    """获取当前线程的Deribit RPC客户端"""
+    client = getattr(_rpc_local, 'client', None)
+    if client is None:
+        client = DeribitRpcClient()
+        _rpc_local.client = client
+    elif client._authenticated_key != API_KEY:
+        # 凭证已变更，重新连接认证
+        client.close()
+    return client
+
+def get_ticker_data_batch(instrument_names):
+    """
+    批量获取合约报价，通过WebSocket流水线发送，失败时回退到逐个HTTP请求
+    
+    返回:
+    {instrument_name: ticker_data}
+    """
+    if not instrument_names:
+        return {}
+    
+    try:
+        results = get_rpc_client().batch(
+            "public/ticker",
+            [{"instrument_name": name} for name in instrument_names]
+        )
+        tickers = {}
+        for name, result in zip(instrument_names, results):
+            if isinstance(result, DeribitRpcError):
+                logger.error(f"Error fetching ticker data for {name}: {result}")
+            elif result:
+                tickers[name] = result
+        return tickers
+    except Exception as e:
+        logger.warning(f"WebSocket ticker batch failed, falling back to HTTP: {str(e)}")
+    
+    tickers = {}
+    for name in instrument_names:
+        ticker_data = get_ticker_data(name)
+        if ticker_data:
+            tickers[name] = ticker_data
+    return tickers
+
 def get_instrument_data(symbol, kind="option"):
     """获取期权合约信息"""
     try:
-        url = f"{BASE_URL}/api/v2/public/get_instruments"
         params = {
             "currency": symbol,
             "kind": kind,
-            "expired": False
+            "expired": "false"
         }
         
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _http_get("/api/v2/public/get_instruments", params)
         
         if data.get("result"):
             return data["result"]
@@ -76,12 +273,9 @@ def get_instrument_data(symbol, kind="option"):
 def get_ticker_data(instrument_name):
     """获取指定合约的报价信息"""
     try:
-        url = f"{BASE_URL}/api/v2/public/ticker"
         params = {"instrument_name": instrument_name}
         
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _http_get("/api/v2/public/ticker", params)
         
         if data.get("result"):
             return data["result"]
@@ -97,12 +291,9 @@ def get_underlying_price(symbol):
     try:
         currency = symbol.upper()
         # 使用正确的API端点来获取价格
-        url = f"{BASE_URL}/api/v2/public/get_index"
         params = {"currency": currency}
         
-        response = requests.get(url, params=params)
-        response.raise_for_status()
-        data = response.json()
+        data = _http_get("/api/v2/public/get_index", params)
         
         if data.get("result"):
             return data["result"][currency]
@@ -110,12 +301,9 @@ def get_underlying_price(symbol):
             # 如果获取索引价格失败，尝试获取ticker价格
             try:
                 instrument_name = f"{currency}-PERPETUAL"
-                url = f"{BASE_URL}/api/v2/public/ticker"
                 params = {"instrument_name": instrument_name}
                 
-                response = requests.get(url, params=params)
-                response.raise_for_status()
-                data = response.json()
+                data = _http_get("/api/v2/public/ticker", params)
                 
                 if data.get("result"):
                     return data["result"]["last_price"]
@@ -148,28 +336,31 @@ def get_option_market_data(symbol):
         filtered_instruments = filter_instruments(instruments, current_price)
         logger.info(f"Found {len(filtered_instruments)} relevant option instruments for {symbol}")
         
+        # 批量获取所有合约的报价
+        tickers = get_ticker_data_batch([i["instrument_name"] for i in filtered_instruments])
+        
         option_data = []
-        # 获取每个合约的详细数据
         for instrument in filtered_instruments:
-            ticker_data = get_ticker_data(instrument["instrument_name"])
+            ticker_data = tickers.get(instrument["instrument_name"])
             if ticker_data:
-                option_data.append({
-                    "symbol": symbol,
-                    "instrument_name": instrument["instrument_name"],
-                    "expiration_date": instrument["expiration_timestamp"],
-                    "strike_price": instrument["strike"],
-                    "option_type": "call" if instrument["option_type"] == "call" else "put",
-                    "underlying_price": current_price,
-                    "option_price": (ticker_data["best_bid_price"] + ticker_data["best_ask_price"]) / 2 if ticker_data["best_bid_price"] and ticker_data["best_ask_price"] else ticker_data["mark_price"],
-                    "volume": ticker_data["stats"]["volume"],
-                    "open_interest": ticker_data["open_interest"],
-                    "implied_volatility": ticker_data["mark_iv"] / 100 if ticker_data["mark_iv"] else None,
-                    "delta": ticker_data["greeks"]["delta"] if ticker_data.get("greeks") else None,
-                    "gamma": ticker_data["greeks"]["gamma"] if ticker_data.get("greeks") else None,
-                    "theta": ticker_data["greeks"]["theta"] if ticker_data.get("greeks") else None,
-                    "vega": ticker_data["greeks"]["vega"] if ticker_data.get("greeks") else None,
-                    "timestamp": datetime.utcnow()
-                })
+                greeks = ticker_data.get("greeks") or {}
+                option_data.append(Quote(
+                    symbol=symbol,
+                    exchange="deribit",
+                    expiration_date=datetime.fromtimestamp(instrument["expiration_timestamp"] / 1000).date(),
+                    strike_price=float(instrument["strike"]),
+                    option_type="call" if instrument["option_type"] == "call" else "put",
+                    underlying_price=current_price,
+                    option_price=(ticker_data["best_bid_price"] + ticker_data["best_ask_price"]) / 2 if ticker_data["best_bid_price"] and ticker_data["best_ask_price"] else ticker_data["mark_price"],
+                    volume=ticker_data["stats"]["volume"] or 0.0,
+                    open_interest=ticker_data["open_interest"] or 0.0,
+                    implied_volatility=ticker_data["mark_iv"] / 100 if ticker_data["mark_iv"] else None,
+                    delta=greeks.get("delta"),
+                    gamma=greeks.get("gamma"),
+                    theta=greeks.get("theta"),
+                    vega=greeks.get("vega"),
+                    instrument_name=instrument["instrument_name"]
+                ))
         
         return option_data
     except Exception as e:
@@ -201,6 +392,6 @@ def filter_instruments(instruments, current_price):
 def get_market_data_websocket(symbol):
     """
     使用WebSocket连接获取市场数据
-    仅作为示例，实际应用中需要实现完整的WebSocket客户端
+    报价已通过DeribitRpcClient批量获取，保留此函数以兼容旧调用
     """
-    pass
\ No newline at end of file
+    return get_option_market_data(symbol)
\ No newline at end of file
@@ -5,8 +5,15 @@
 """
 import ccxt
 from datetime import datetime, timedelta
+import hashlib
+import logging
+import threading
 import time
 
+from config import Config
+from services.rate_limiter import install_rate_limiter
+from services.circuit_breaker import get_guard, is_circuit_open, CircuitOpenError
+from services.quote import Quote, to_float
 from utils.logging_config import get_logger
 
 logger = get_logger(__name__)
@@ -18,6 +25,22 @@ exchanges = {
     'okx': None
 }
 
+# 交易所实例注册表: 记录每个实例的凭证指纹和市场数据加载时间
+# 只有凭证或测试网设置变化时才重建实例，市场数据按较慢的周期刷新
+_client_fingerprints = {}
+_markets_loaded_at = {}
+# 每个交易所的客户端实例池（主实例在前）；ccxt实例不是线程安全的，
+# 超时仍在后台运行的请求和对冲请求各自占用一个实例，其他请求使用池中空闲的实例
+_client_pools = {}
+_registry_lock = threading.RLock()
+# 市场数据重新加载期间持有，避免多个线程同时重新加载
+_markets_lock = threading.Lock()
+
+def _credential_fingerprint(api_key, api_secret, test_mode):
+    """计算凭证指纹，不在注册表中保存明文密钥"""
+    raw = f"{api_key or ''}:{api_secret or ''}".encode('utf-8')
+    return hashlib.sha256(raw).hexdigest(), bool(test_mode)
+
 def initialize_exchange(exchange_id='deribit', api_key=None, api_secret=None, test_mode=False):
     """
     初始化CCXT交易所实例
@@ -38,6 +61,19 @@ def initialize_exchange(exchange_id='deribit', api_key=None, api_secret=None, te
             logger.error(f"不支持的交易所: {exchange_id}")
             return False
         
+        with _registry_lock:
+            return _build_exchange(exchange_id, api_key, api_secret, test_mode)
+    except Exception as e:
+        logger.error(f"初始化{exchange_id}交易所实例失败: {str(e)}")
+        return False
+
+def _build_exchange(exchange_id, api_key, api_secret, test_mode):
+    """创建交易所实例，测试网设置不变时沿用旧实例已加载的市场数据"""
+    try:
+        previous = exchanges.get(exchange_id)
+        previous_fingerprint = _client_fingerprints.get(exchange_id)
+        fingerprint = _credential_fingerprint(api_key, api_secret, test_mode)
+        
         # 创建交易所配置
         exchange_config = {
             'apiKey': api_key,
@@ -72,21 +108,115 @@ def initialize_exchange(exchange_id='deribit', api_key=None, api_secret=None, te
             logger.error(f"CCXT库不支持交易所: {exchange_id}")
             return False
             
-        exchanges[exchange_id] = exchange_class(exchange_config)
+        exchange = exchange_class(exchange_config)
+        # 所有进程共用同一个请求预算
+        install_rate_limiter(exchange, exchange_id)
         
         if api_key and api_secret:
             logger.info(f"{exchange_id}交易所实例已初始化（附带API凭证）")
         else:
             logger.info(f"{exchange_id}交易所实例已初始化（公共访问模式）")
             
-        # 加载市场数据
-        exchanges[exchange_id].load_markets()
+        # 加载市场数据 - 测试网设置未变时直接复用旧实例的市场数据，避免重新下载
+        if (previous is not None and previous.markets and previous_fingerprint
+                and previous_fingerprint[1] == fingerprint[1]):
+            exchange.set_markets(previous.markets, previous.currencies)
+            logger.debug(f"{exchange_id}交易所实例复用已加载的市场数据")
+        else:
+            exchange.load_markets()
+            _markets_loaded_at[exchange_id] = time.monotonic()
+        
+        pool = [exchange]
+        for _ in range(Config.EXCHANGE_SPARE_CLIENTS):
+            spare = exchange_class(exchange_config)
+            install_rate_limiter(spare, exchange_id)
+            spare.set_markets(exchange.markets, exchange.currencies)
+            pool.append(spare)
+        
+        exchanges[exchange_id] = exchange
+        _client_pools[exchange_id] = pool
+        _client_fingerprints[exchange_id] = fingerprint
         return True
     except Exception as e:
         logger.error(f"初始化{exchange_id}交易所实例失败: {str(e)}")
         exchanges[exchange_id] = None
+        _client_pools.pop(exchange_id, None)
+        _client_fingerprints.pop(exchange_id, None)
         return False
 
+def _fetch_ticker(exchange, symbol):
+    """
+    在熔断器和自适应超时保护下获取行情
+    只有网络类错误（超时、交易所不可用、限流等）计入熔断，合约不存在等业务错误不计入
+    请求和对冲请求在该交易所客户端实例池中空闲的实例上发出，同一实例不会被并发调用
+    """
+    pool = _client_pools.get(exchange.id)
+    clients = pool if pool and pool[0] is exchange else [exchange]
+    return get_guard(exchange.id, 'fetch_ticker').call(
+        clients, 'fetch_ticker', symbol,
+        hedge=True,
+        failure_exceptions=(ccxt.NetworkError,)
+    )
+
+def get_exchange(exchange_id):
+    """
+    获取交易所实例，未初始化时以公共访问模式初始化
+    
+    参数:
+    exchange_id - 交易所ID
+    """
+    with _registry_lock:
+        if not exchanges.get(exchange_id):
+            logger.debug(f"{exchange_id}交易所实例未初始化，正在初始化...")
+            initialize_exchange(exchange_id)
+        exchange = exchanges.get(exchange_id)
+    if exchange:
+        _refresh_stale_markets(exchange_id, exchange)
+    return exchange
+
+def _refresh_stale_markets(exchange_id, exchange, max_age_minutes=None):
+    """
+    市场数据超过最大缓存时间时重新加载
+    每次使用实例前检查，每个进程（包括不运行调度器的Web进程）各自保持本进程实例的合约列表最新
+    """
+    if max_age_minutes is None:
+        max_age_minutes = Config.EXCHANGE_MARKETS_REFRESH_MINUTES
+    
+    def is_fresh():
+        loaded_at = _markets_loaded_at.get(exchange_id)
+        return loaded_at is not None and time.monotonic() - loaded_at < max_age_minutes * 60
+    
+    if is_fresh():
+        return
+    with _markets_lock:
+        if is_fresh():
+            return
+        try:
+            exchange.load_markets(reload=True)
+            _markets_loaded_at[exchange_id] = time.monotonic()
+            for spare in _client_pools.get(exchange_id, [])[1:]:
+                spare.set_markets(exchange.markets, exchange.currencies)
+            logger.info(f"已刷新{exchange_id}交易所的市场数据，共{len(exchange.markets)}个市场")
+        except Exception as e:
+            logger.error(f"刷新{exchange_id}交易所市场数据失败: {str(e)}")
+
+def refresh_markets(exchange_id=None, max_age_minutes=None):
+    """
+    刷新交易所的市场数据（合约列表），只刷新超过最大缓存时间的实例
+    
+    参数:
+    exchange_id - 交易所ID，为None时刷新所有已初始化的交易所
+    max_age_minutes - 最大缓存时间（分钟），默认使用配置值
+    """
+    exchange_ids = [exchange_id] if exchange_id else list(exchanges.keys())
+    for ex_id in exchange_ids:
+        with _registry_lock:
+            if not exchanges.get(ex_id):
+                initialize_exchange(ex_id)
+            exchange = exchanges.get(ex_id)
+        if exchange:
+            _refresh_stale_markets(ex_id, exchange, max_age_minutes)
+
 def get_underlying_price(symbol, exchange_id='deribit'):
     """
     获取标的资产当前价格
@@ -114,6 +244,7 @@ def get_underlying_price(symbol, exchange_id='deribit'):
         if not exchanges[exchange_id]:
             logger.error(f"{exchange_id}交易所实例初始化失败")
             return None
+        _refresh_stale_markets(exchange_id, exchanges[exchange_id])
         
         # 确保符号格式正确
         symbol = symbol.upper()
@@ -137,7 +268,7 @@ def _get_deribit_price(symbol, exchange):
     try:
         # Deribit永续合约格式：BTC-PERPETUAL
         perpetual_symbol = f"{symbol}-PERPETUAL"
-        ticker = exchange.fetch_ticker(perpetual_symbol)
+        ticker = _fetch_ticker(exchange, perpetual_symbol)
         # 优先使用指数价格，其次是标记价格，最后是最新成交价
         if ticker and ticker.get('indexPrice'):
             return ticker['indexPrice']
@@ -152,7 +283,7 @@ def _get_deribit_price(symbol, exchange):
     try:
         markets = [m for m in exchange.markets.keys() if m.startswith(f"{symbol}/")]
         if markets:
-            ticker = exchange.fetch_ticker(markets[0])
+            ticker = _fetch_ticker(exchange, markets[0])
             if ticker and 'info' in ticker and 'underlying_price' in ticker['info']:
                 return float(ticker['info']['underlying_price'])
     except Exception as e:
@@ -166,7 +297,7 @@ def _get_binance_price(symbol, exchange):
     try:
         # 币安现货市场
         spot_symbol = f"{symbol}/USDT"
-        ticker = exchange.fetch_ticker(spot_symbol)
+        ticker = _fetch_ticker(exchange, spot_symbol)
         if ticker and ticker.get('last'):
             return ticker['last']
     except Exception as e:
@@ -176,7 +307,7 @@ def _get_binance_price(symbol, exchange):
     try:
         # 币安永续合约
         futures_symbol = f"{symbol}/USDT:USDT"
-        ticker = exchange.fetch_ticker(futures_symbol)
+        ticker = _fetch_ticker(exchange, futures_symbol)
         if ticker and ticker.get('last'):
             return ticker['last']
     except Exception as e:
@@ -190,7 +321,7 @@ def _get_okx_price(symbol, exchange):
     try:
         # OKX现货市场
         spot_symbol = f"{symbol}/USDT"
-        ticker = exchange.fetch_ticker(spot_symbol)
+        ticker = _fetch_ticker(exchange, spot_symbol)
         if ticker and ticker.get('last'):
             return ticker['last']
     except Exception as e:
@@ -200,7 +331,7 @@ def _get_okx_price(symbol, exchange):
     try:
         # OKX永续合约
         futures_symbol = f"{symbol}/USDT:USDT"
-        ticker = exchange.fetch_ticker(futures_symbol)
+        ticker = _fetch_ticker(exchange, futures_symbol)
         if ticker and ticker.get('markPrice'):
             return ticker['markPrice']
         elif ticker and ticker.get('last'):
@@ -271,12 +402,18 @@ def get_option_market_data(symbol, exchange_id='deribit'):
         if not exchanges[exchange_id]:
             logger.error(f"{exchange_id}交易所实例初始化失败")
             return []
+        _refresh_stale_markets(exchange_id, exchanges[exchange_id])
         
         # 验证符号 - 仅处理BTC和ETH
         symbol = symbol.upper()
         if symbol not in ["BTC", "ETH"]:
             logger.warning(f"不支持的符号: {symbol}，仅支持BTC和ETH")
             return []
+        
+        # 交易所行情接口熔断中，直接跳过，不占用本轮采集时间
+        if is_circuit_open(exchange_id, 'fetch_ticker'):
+            logger.warning(f"{exchange_id}行情接口熔断中，跳过本轮{symbol}期权数据采集")
+            return []
             
         # 获取当前价格
         current_price = get_underlying_price(symbol, exchange_id)
@@ -343,14 +480,19 @@ def _get_deribit_options(symbol, current_price, strike_min, strike_max, exchange
             grouped_options.append(list(group))
         
         # 处理每组期权 - 减少处理数量以提高性能
+        circuit_open = False
         for group in grouped_options:
+            if circuit_open:
+                break
             # 降低处理数量到5个，以防止请求卡住
             for i in range(0, min(len(group), 5), batch_size):
+                if circuit_open:
+                    break
                 batch = group[i:i+batch_size]
                 for option in batch:
                     try:
                         # 获取期权行情
-                        ticker = exchange.fetch_ticker(option['symbol'])
+                        ticker = _fetch_ticker(exchange, option['symbol'])
                         if not ticker:
                             continue
                         
@@ -414,93 +556,49 @@ def _get_deribit_options(symbol, current_price, strike_min, strike_max, exchange
                             logger.warning(f"Deribit期权{option['symbol']}的价格转换失败: {option_price}")
                             continue
                         
+                        info = ticker.get('info') or {}
+                        stats = info.get('stats') or {}
+                        
                         # 处理成交量，即使成交量为0也保留
-                        # 先记录原始成交量数据结构，用于调试
-                        volume_stats = {
-                            'baseVolume': ticker.get('baseVolume'),
-                            'info_volume': ticker.get('info', {}).get('volume'),
-                            'info_volume_usd': ticker.get('info', {}).get('volume_usd'),
-                            'stats_volume': ticker.get('info', {}).get('stats', {}).get('volume'),
-                            'stats_volume_usd': ticker.get('info', {}).get('stats', {}).get('volume_usd')
-                        }
-                        logger.debug(f"Deribit期权{option['symbol']}成交量数据: {volume_stats}")
+                        if logger.isEnabledFor(logging.DEBUG):
+                            logger.debug(f"Deribit期权{option['symbol']}成交量数据: baseVolume={ticker.get('baseVolume')}, "
+                                         f"stats.volume={stats.get('volume')}, stats.volume_usd={stats.get('volume_usd')}")
                         
                         # 使用Deribit的stats.volume字段，这是更准确的成交量数据
                         # 如果不存在，则回退到baseVolume
-                        volume_raw = ticker.get('info', {}).get('stats', {}).get('volume', 0) or ticker.get('baseVolume', 0) or 0
-                        # 确保转换为浮点数，以支持数据服务中的类型转换
-                        try:
-                            volume = float(volume_raw)
-                        except (ValueError, TypeError):
-                            volume = 0
-                            
-                        open_interest_raw = ticker.get('info', {}).get('open_interest', 0)
-                        # 确保转换为浮点数，以支持数据服务中的类型转换
-                        try:
-                            open_interest = float(open_interest_raw)
-                        except (ValueError, TypeError):
-                            open_interest = 0
+                        volume = to_float(stats.get('volume') or ticker.get('baseVolume'), 0.0)
+                        open_interest = to_float(info.get('open_interest'), 0.0)
                         
-                        # Greeks处理
-                        greeks = ticker.get('info', {}).get('greeks', {})
+                        # 隐含波动率转换为小数
+                        mark_iv = to_float(info.get('mark_iv'))
+                        implied_volatility = mark_iv / 100 if mark_iv is not None else None
                         
-                        # 确保隐含波动率数据是数值类型
-                        try:
-                            mark_iv = ticker.get('info', {}).get('mark_iv', 0)
-                            if isinstance(mark_iv, str):
-                                mark_iv = float(mark_iv)
-                            implied_volatility = mark_iv / 100  # 转换为小数
-                        except (TypeError, ValueError):
-                            implied_volatility = 0
-                            
-                        # 确保Greeks数据为数值类型
-                        try:
-                            delta = greeks.get('delta')
-                            if isinstance(delta, str):
-                                delta = float(delta)
-                        except (TypeError, ValueError):
-                            delta = None
-                            
-                        try:
-                            gamma = greeks.get('gamma')
-                            if isinstance(gamma, str):
-                                gamma = float(gamma)
-                        except (TypeError, ValueError):
-                            gamma = None
-                            
-                        try:
-                            theta = greeks.get('theta') 
-                            if isinstance(theta, str):
-                                theta = float(theta)
-                        except (TypeError, ValueError):
-                            theta = None
-                            
-                        try:
-                            vega = greeks.get('vega')
-                            if isinstance(vega, str):
-                                vega = float(vega)
-                        except (TypeError, ValueError):
-                            vega = None
+                        # Greeks处理
+                        greeks = info.get('greeks') or {}
                         
                         # 添加到结果集
-                        option_data.append({
-                            "symbol": symbol,
-                            "exchange": "deribit",  # 添加交易所信息
-                            "expiration_date": expiry_date,
-                            "strike_price": strike_price,
-                            "option_type": option_type,
-                            "underlying_price": current_price,
-                            "option_price": option_price,
-                            "volume": volume,
-                            "open_interest": open_interest,
-                            "implied_volatility": implied_volatility,
-                            "delta": delta,
-                            "gamma": gamma,
-                            "theta": theta,
-                            "vega": vega,
-                            "timestamp": datetime.utcnow()
-                        })
+                        option_data.append(Quote(
+                            symbol=symbol,
+                            exchange='deribit',
+                            expiration_date=expiry_date,
+                            strike_price=strike_price,
+                            option_type=option_type,
+                            underlying_price=current_price,
+                            option_price=option_price,
+                            volume=volume,
+                            open_interest=open_interest,
+                            implied_volatility=implied_volatility,
+                            delta=to_float(greeks.get('delta')),
+                            gamma=to_float(greeks.get('gamma')),
+                            theta=to_float(greeks.get('theta')),
+                            vega=to_float(greeks.get('vega')),
+                            instrument_name=option['symbol']
+                        ))
                         
+                    except CircuitOpenError:
+                        logger.warning("Deribit行情接口已熔断，停止本轮剩余合约的请求")
+                        circuit_open = True
+                        break
                     except Exception as e:
                         logger.warning(f"处理Deribit期权{option['symbol']}时出错: {str(e)}")
                         continue
@@ -548,7 +646,7 @@ def _get_binance_options(symbol, current_price, strike_min, strike_max, exchange
         for option in option_markets[:process_count]:
             try:
                 # 获取期权行情
-                ticker = exchange.fetch_ticker(option['symbol'])
+                ticker = _fetch_ticker(exchange, option['symbol'])
                 if not ticker:
                     continue
                 
@@ -619,52 +717,33 @@ def _get_binance_options(symbol, current_price, strike_min, strike_max, exchange
                     continue
                 
                 # 成交量和持仓量 - 确保是数字类型
-                # 先记录原始成交量数据结构，用于调试
-                volume_stats = {
-                    'baseVolume': ticker.get('baseVolume'),
-                    'info_volume': ticker.get('info', {}).get('volume'),
-                    'info_quoteVolume': ticker.get('info', {}).get('quoteVolume'),
-                    'quoteVolume': ticker.get('quoteVolume')
-                }
-                logger.debug(f"Binance期权{option.get('symbol', '')}成交量数据: {volume_stats}")
+                info = ticker.get('info') or {}
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"Binance期权{option.get('symbol', '')}成交量数据: volume={info.get('volume')}, "
+                                 f"baseVolume={ticker.get('baseVolume')}, quoteVolume={ticker.get('quoteVolume')}")
                 
                 # 尝试从不同字段获取成交量数据，按优先级排序  
-                volume_raw = (ticker.get('info', {}).get('volume') or 
-                            ticker.get('baseVolume') or 
-                            ticker.get('quoteVolume', 0) or 0)
-                try:
-                    volume = float(volume_raw)
-                except (TypeError, ValueError):
-                    volume = 0
-                    
-                open_interest = ticker.get('info', {}).get('openInterest', 0) or 0
-                try:
-                    open_interest = float(open_interest)
-                except (TypeError, ValueError):
-                    open_interest = 0
+                volume = to_float(info.get('volume') or ticker.get('baseVolume') or ticker.get('quoteVolume'), 0.0)
+                open_interest = to_float(info.get('openInterest'), 0.0)
                 
-                # 隐含波动率和Greeks (币安可能使用不同的字段)
-                implied_volatility = ticker.get('info', {}).get('impliedVolatility', 0)
-                
-                # 添加到结果集
-                option_data.append({
-                    "symbol": symbol,
-                    "exchange": "binance",  # 添加交易所信息
-                    "expiration_date": expiry_date,
-                    "strike_price": strike_price,
-                    "option_type": option_type,
-                    "underlying_price": current_price,
-                    "option_price": option_price,
-                    "volume": volume,
-                    "open_interest": open_interest,
-                    "implied_volatility": implied_volatility,
-                    "delta": None,  # 币安可能不提供完整的Greeks数据
-                    "gamma": None,
-                    "theta": None,
-                    "vega": None,
-                    "timestamp": datetime.utcnow()
-                })
+                # 添加到结果集 - 隐含波动率和Greeks (币安可能使用不同的字段，可能不提供完整的Greeks数据)
+                option_data.append(Quote(
+                    symbol=symbol,
+                    exchange='binance',
+                    expiration_date=expiry_date,
+                    strike_price=strike_price,
+                    option_type=option_type,
+                    underlying_price=current_price,
+                    option_price=option_price,
+                    volume=volume,
+                    open_interest=open_interest,
+                    implied_volatility=to_float(info.get('impliedVolatility')),
+                    instrument_name=option.get('symbol')
+                ))
                 
+            except CircuitOpenError:
+                logger.warning("Binance行情接口已熔断，停止本轮剩余合约的请求")
+                break
             except Exception as e:
                 logger.warning(f"处理Binance期权{option.get('symbol', '')}时出错: {str(e)}")
                 continue
@@ -712,7 +791,7 @@ def _get_okx_options(symbol, current_price, strike_min, strike_max, exchange):
         for option in option_markets[:process_count]:
             try:
                 # 获取期权行情
-                ticker = exchange.fetch_ticker(option['symbol'])
+                ticker = _fetch_ticker(exchange, option['symbol'])
                 if not ticker:
                     continue
                 
@@ -787,53 +866,34 @@ def _get_okx_options(symbol, current_price, strike_min, strike_max, exchange):
                     continue
                 
                 # 成交量和持仓量 - 确保是数字类型
-                # 先记录原始成交量数据结构，用于调试
-                volume_stats = {
-                    'baseVolume': ticker.get('baseVolume'),
-                    'info_volCcy24h': ticker.get('info', {}).get('volCcy24h'),
-                    'info_vol24h': ticker.get('info', {}).get('vol24h'),
-                    'quoteVolume': ticker.get('quoteVolume')
-                }
-                logger.debug(f"OKX期权{option.get('symbol', '')}成交量数据: {volume_stats}")
+                info = ticker.get('info') or {}
+                if logger.isEnabledFor(logging.DEBUG):
+                    logger.debug(f"OKX期权{option.get('symbol', '')}成交量数据: volCcy24h={info.get('volCcy24h')}, "
+                                 f"vol24h={info.get('vol24h')}, baseVolume={ticker.get('baseVolume')}")
                 
                 # OKX的成交量一般在volCcy24h或vol24h字段中
-                volume_raw = (ticker.get('info', {}).get('volCcy24h') or 
-                             ticker.get('info', {}).get('vol24h') or
-                             ticker.get('baseVolume') or 
-                             ticker.get('quoteVolume', 0) or 0)
-                try:
-                    volume = float(volume_raw)
-                except (TypeError, ValueError):
-                    volume = 0
-                    
-                open_interest = ticker.get('info', {}).get('openInterest', 0) or 0
-                try:
-                    open_interest = float(open_interest)
-                except (TypeError, ValueError):
-                    open_interest = 0
-                
-                # 隐含波动率 (OKX可能使用不同的字段)
-                implied_volatility = ticker.get('info', {}).get('impliedVolatility', 0)
+                volume = to_float(info.get('volCcy24h') or info.get('vol24h') or
+                                  ticker.get('baseVolume') or ticker.get('quoteVolume'), 0.0)
+                open_interest = to_float(info.get('openInterest'), 0.0)
                 
-                # 添加到结果集
-                option_data.append({
-                    "symbol": symbol,
-                    "exchange": "okx",  # 添加交易所信息
-                    "expiration_date": expiry_date,
-                    "strike_price": strike_price,
-                    "option_type": option_type,
-                    "underlying_price": current_price,
-                    "option_price": option_price,
-                    "volume": volume,
-                    "open_interest": open_interest,
-                    "implied_volatility": implied_volatility,
-                    "delta": None,  # OKX可能不提供完整的Greeks数据
-                    "gamma": None,
-                    "theta": None,
-                    "vega": None,
-                    "timestamp": datetime.utcnow()
-                })
+                # 添加到结果集 - 隐含波动率 (OKX可能使用不同的字段，可能不提供完整的Greeks数据)
+                option_data.append(Quote(
+                    symbol=symbol,
+                    exchange='okx',
+                    expiration_date=expiry_date,
+                    strike_price=strike_price,
+                    option_type=option_type,
+                    underlying_price=current_price,
+                    option_price=option_price,
+                    volume=volume,
+                    open_interest=open_interest,
+                    implied_volatility=to_float(info.get('impliedVolatility')),
+                    instrument_name=option.get('symbol')
+                ))
                 
+            except CircuitOpenError:
+                logger.warning("OKX行情接口已熔断，停止本轮剩余合约的请求")
+                break
             except Exception as e:
                 logger.warning(f"处理OKX期权{option.get('symbol', '')}时出错: {str(e)}")
                 continue
@@ -848,6 +908,7 @@ def _get_okx_options(symbol, current_price, strike_min, strike_max, exchange):
 def set_api_credentials(api_key, api_secret, exchange_id='deribit', test_mode=False):
     """
     设置API凭证
+    凭证和测试网设置未变化时直接复用现有实例，不重新初始化
     
     参数:
     api_key - API密钥
@@ -856,7 +917,12 @@ def set_api_credentials(api_key, api_secret, exchange_id='deribit', test_mode=Fa
     test_mode - 是否使用测试网
     """
     try:
-        return initialize_exchange(exchange_id, api_key, api_secret, test_mode)
+        exchange_id = exchange_id.lower()
+        with _registry_lock:
+            if (exchanges.get(exchange_id) is not None and
+                    _client_fingerprints.get(exchange_id) == _credential_fingerprint(api_key, api_secret, test_mode)):
+                return True
+            return initialize_exchange(exchange_id, api_key, api_secret, test_mode)
     except Exception as e:
         logger.error(f"设置{exchange_id}交易所API凭证失败: {str(e)}")
         return False
@@ -937,7 +1003,3 @@ def get_all_exchanges_data(symbol, combine=True):
         return combined_data
     else:
         return result
-
-# 初始化所有交易所实例
-for exchange_id in exchanges.keys():
-    initialize_exchange(exchange_id)
\ No newline at end of file
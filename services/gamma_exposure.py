@@ -0,0 +1,95 @@
+"""
+做市商Gamma敞口（GEX）曲线
+
+假设做市商持有看涨期权多头、看跌期权空头（即客户买入看跌、卖出看涨），每个合约的GEX为
+    ±Γ(S) · 未平仓量 · S² · 1%
+即标的价格变动1%时做市商需要对冲的USD delta变化。
+- 在标的价格网格上对 合约 × 网格点 矩阵一次性计算Black-76 gamma，得到净GEX随标的价格变化的曲线
+- Gamma翻转点: 净GEX曲线离当前价格最近的过零点（网格点之间线性插值），价格穿过该点时做市商对冲方向反转
+- Gamma墙: 当前价格下按执行价汇总的GEX绝对值最大的执行价；看涨墙/看跌墙分别取看涨正GEX最大、看跌负GEX最大的执行价
+
+本模块不依赖数据库，期权链由调用方传入（见 services/gex_service.py）
+"""
+import logging
+
+import numpy as np
+
+from config import Config
+from services.pricing import black76_gamma
+
+logger = logging.getLogger(__name__)
+
+
+def _zero_crossings(grid, values):
+    """曲线在网格点之间的过零点（线性插值）"""
+    sign_change = np.nonzero(np.signbit(values[:-1]) != np.signbit(values[1:]))[0]
+    x0, x1 = grid[sign_change], grid[sign_change + 1]
+    y0, y1 = values[sign_change], values[sign_change + 1]
+    return x0 - y0 * (x1 - x0) / (y1 - y0)
+
+
+def gamma_exposure_profile(chain, grid_points=None, grid_range=None, wall_count=None):
+    """
+    计算一个期权链快照的GEX曲线
+
+    参数:
+    chain - chain_arrays(...) 的结果（需要 open_interest）
+    grid_points - 标的价格网格点数
+    grid_range - 网格相对当前价格的范围，0.2 表示 ±20%
+    wall_count - 返回的Gamma墙数量
+
+    返回:
+    dict - spot, total_gex, flip_level, call_wall, put_wall, walls,
+           spot_grid/gex（曲线）, strikes/call_gex/put_gex（当前价格下按执行价汇总）；
+           没有可计算的合约时返回None
+    """
+    grid_points = grid_points or Config.GAMMA_EXPOSURE_GRID_POINTS
+    grid_range = grid_range or Config.GAMMA_EXPOSURE_GRID_RANGE
+    wall_count = wall_count or Config.GAMMA_EXPOSURE_WALLS
+
+    valid = (np.isfinite(chain['iv']) & (chain['iv'] > 0) & (chain['expiry'] > 0) &
+             (chain['open_interest'] > 0) & (chain['strike'] > 0) & (chain['underlying'] > 0))
+    if not valid.any():
+        return None
+
+    F = chain['underlying'][valid]
+    K = chain['strike'][valid]
+    T = chain['expiry'][valid]
+    iv = chain['iv'][valid]
+    is_call = chain['is_call'][valid]
+    # 做市商方向: 看涨 +1，看跌 -1
+    weight = np.where(is_call, 1.0, -1.0) * chain['open_interest'][valid]
+
+    # 不同交易所的标的价格略有差异，网格按相对变动施加到每个合约自己的标的价格上
+    spot = float(np.median(F))
+    moves = np.linspace(1 - grid_range, 1 + grid_range, grid_points)
+    shifted = F[None, :] * moves[:, None]  # (网格点, 合约)
+    dollar_gamma = black76_gamma(shifted, K[None, :], T[None, :], iv[None, :]) * shifted * shifted * 0.01
+    profile = dollar_gamma @ weight
+    spot_grid = spot * moves
+
+    # 当前价格下每个合约的GEX，按执行价汇总
+    contract_gex = black76_gamma(F, K, T, iv) * F * F * 0.01 * weight
+    strikes, index = np.unique(K, return_inverse=True)
+    call_gex = np.bincount(index, weights=np.where(is_call, contract_gex, 0.0), minlength=len(strikes))
+    put_gex = np.bincount(index, weights=np.where(is_call, 0.0, contract_gex), minlength=len(strikes))
+    net_gex = call_gex + put_gex
+
+    crossings = _zero_crossings(spot_grid, profile)
+    flip_level = float(crossings[np.argmin(np.abs(crossings - spot))]) if len(crossings) else None
+    largest = np.argsort(-np.abs(net_gex))[:wall_count]
+
+    return {
+        'spot': spot,
+        'total_gex': float(contract_gex.sum()),
+        'flip_level': flip_level,
+        'call_wall': float(strikes[np.argmax(call_gex)]) if call_gex.max() > 0 else None,
+        'put_wall': float(strikes[np.argmin(put_gex)]) if put_gex.min() < 0 else None,
+        'walls': [{'strike': float(strikes[i]), 'gex': float(net_gex[i])} for i in largest],
+        'contracts': int(valid.sum()),
+        'spot_grid': spot_grid.tolist(),
+        'gex': profile.tolist(),
+        'strikes': strikes.tolist(),
+        'call_gex': call_gex.tolist(),
+        'put_gex': put_gex.tolist()
+    }
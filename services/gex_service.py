@@ -0,0 +1,92 @@
+"""
+做市商Gamma敞口服务
+每个入库的快照由计算流水线调用 update_gamma_profile，计算GEX曲线（services/gamma_exposure.py）并保存到GammaExposureProfile
+"""
+import json
+import logging
+
+from app import db
+from models import GammaExposureProfile
+from services.event_hub import publish_event
+from services.gamma_exposure import gamma_exposure_profile
+from services.option_store import load_option_chain
+from services.scenario_cache import scenario_cache
+from services.scenario_engine import chain_arrays
+
+logger = logging.getLogger(__name__)
+
+# 保存在profile列中的曲线字段，其余字段保存为单独的列
+PROFILE_FIELDS = ('walls', 'spot_grid', 'gex', 'strikes', 'call_gex', 'put_gex')
+
+
+def _snapshot_chain(symbol, snapshot_time):
+    """最新快照与情景分析共用缓存的期权链数组，计算落后时按快照时间加载"""
+    latest_time, chain = scenario_cache.latest_chain(symbol)
+    if latest_time == snapshot_time:
+        return chain
+    options = load_option_chain(symbol, snapshot_time)
+    return chain_arrays(options, snapshot_time) if options else None
+
+
+def update_gamma_profile(symbol, snapshot_time):
+    """
+    计算并保存一个快照的GEX曲线，同一快照重复计算时覆盖
+
+    返回:
+    dict - gamma_exposure_profile 的结果；没有可计算的合约时返回None
+    """
+    chain = _snapshot_chain(symbol, snapshot_time)
+    if chain is None:
+        logger.warning(f"{symbol}@{snapshot_time} 没有期权数据，跳过GEX计算")
+        return None
+
+    result = gamma_exposure_profile(chain)
+    if result is None:
+        logger.warning(f"{symbol}@{snapshot_time} 没有带未平仓量的有效合约，跳过GEX计算")
+        return None
+
+    try:
+        row = GammaExposureProfile.query.filter_by(symbol=symbol, snapshot_time=snapshot_time).first()
+        if row is None:
+            row = GammaExposureProfile(symbol=symbol, snapshot_time=snapshot_time)
+            db.session.add(row)
+        row.spot = result['spot']
+        row.total_gex = result['total_gex']
+        row.flip_level = result['flip_level']
+        row.call_wall = result['call_wall']
+        row.put_wall = result['put_wall']
+        row.contracts = result['contracts']
+        row.profile = json.dumps({field: result[field] for field in PROFILE_FIELDS})
+        db.session.commit()
+    except Exception as e:
+        logger.error(f"保存{symbol} GEX曲线失败: {str(e)}")
+        db.session.rollback()
+        return result
+
+    publish_event('gamma_profile', {
+        'symbol': symbol,
+        'snapshot_time': snapshot_time.isoformat(),
+        'spot': result['spot'],
+        'total_gex': result['total_gex'],
+        'flip_level': result['flip_level'],
+        'call_wall': result['call_wall'],
+        'put_wall': result['put_wall']
+    })
+    return result
+
+
+def get_gamma_profile(symbol, snapshot_time=None):
+    """指定快照（默认最新）的GEX曲线，没有时返回None"""
+    query = GammaExposureProfile.query.filter_by(symbol=symbol)
+    if snapshot_time is not None:
+        query = query.filter(GammaExposureProfile.snapshot_time <= snapshot_time)
+    row = query.order_by(GammaExposureProfile.snapshot_time.desc()).first()
+    return row.to_dict() if row else None
+
+
+def get_gamma_history(symbol, limit=200):
+    """最近limit个快照的净GEX、翻转点和Gamma墙（按时间升序，不含曲线）"""
+    rows = GammaExposureProfile.query.filter_by(symbol=symbol).order_by(
+        GammaExposureProfile.snapshot_time.desc()
+    ).limit(limit).all()
+    return [row.to_dict(include_profile=False) for row in reversed(rows)]
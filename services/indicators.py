@@ -0,0 +1,325 @@
+"""
+风险指标与警报判定的纯计算函数
+不依赖数据库和应用上下文，实时计算（risk_calculator / risk_service）和历史回放（replay_engine）共用
+"""
+import logging
+import random
+
+import pandas as pd
+
+from config import Config
+from services.vol_surface import get_surface
+
+logger = logging.getLogger(__name__)
+
+# 参与阈值警报检查的指标
+ALERT_INDICATORS = ('volaxivity', 'volatility_skew', 'put_call_ratio', 'reflexivity_indicator')
+
+
+def options_to_frame(options):
+    """将期权链（OptionData或同结构的对象）转换为指标计算使用的DataFrame"""
+    return pd.DataFrame([{
+        'strike': opt.strike_price,
+        'option_type': opt.option_type,
+        'price': opt.option_price,
+        'iv': opt.implied_volatility,
+        'delta': opt.delta,
+        'gamma': opt.gamma,
+        'vega': opt.vega,
+        'theta': opt.theta,
+        'volume': opt.volume,
+        'open_interest': opt.open_interest,
+        'underlying': opt.underlying_price,
+        'expiration_date': opt.expiration_date,
+        'timestamp': opt.timestamp
+    } for opt in options])
+
+
+def volatility_surface(symbol, df):
+    """
+    Config.IMPLIED_VOL_SOURCE 为 'surface' 时返回该快照拟合的波动率曲面（见 services/vol_surface.py），
+    否则或拟合失败时返回None，偏斜和Volaxivity回退到按原始报价计算
+    """
+    if Config.IMPLIED_VOL_SOURCE != 'surface' or 'expiration_date' not in df:
+        return None
+    return get_surface(symbol, df)
+
+
+def compute_risk_indicators(symbol, df):
+    """
+    计算一个期权链快照的全部风险指标
+
+    返回:
+    dict - volaxivity, volatility_skew, put_call_ratio, reflexivity_indicator, market_sentiment,
+           以及BTC/ETH的funding_rate, liquidation_risk（无法计算时为None）
+    """
+    surface = volatility_surface(symbol, df)
+    volaxivity = calculate_volaxivity(df, surface)
+    volatility_skew = calculate_volatility_skew(df, surface)
+    put_call_ratio = calculate_put_call_ratio(df)
+    reflexivity = calculate_reflexivity_indicator(df)
+
+    # 计算加密货币特有的风险指标（如适用）
+    crypto_risk = None
+    if symbol in ['BTC', 'ETH']:
+        crypto_risk = get_crypto_specific_risk(symbol, df)
+
+    return {
+        'volaxivity': float(volaxivity),
+        'volatility_skew': float(volatility_skew),
+        'put_call_ratio': float(put_call_ratio),
+        'reflexivity_indicator': float(reflexivity),
+        'market_sentiment': str(determine_market_sentiment(volaxivity, put_call_ratio, reflexivity)),
+        'funding_rate': float(crypto_risk['funding_rate']) if crypto_risk else None,
+        'liquidation_risk': float(crypto_risk['liquidation_risk']) if crypto_risk else None
+    }
+
+
+def evaluate_threshold(current_value, attention, warning, severe):
+    """
+    按从严重到关注的顺序判断指标值触发的警报级别
+
+    返回:
+    (alert_type, threshold_value)，未触发时为 (None, None)
+    """
+    if current_value >= severe:
+        return 'severe', severe
+    if current_value >= warning:
+        return 'warning', warning
+    if current_value >= attention:
+        return 'attention', attention
+    return None, None
+
+
+def calculate_volaxivity(df, surface=None):
+    """
+    Calculate the Volaxivity indicator (custom volatility index)
+    Higher values indicate higher market risk
+
+    surface - 可选的 VolSurface，给出时IV取曲面上 Config.VOL_SURFACE_TENOR_DAYS 期限的ATM波动率
+    """
+    # Get ATM options (closest to current price)
+    underlying_price = df['underlying'].iloc[0]
+    
+    # Filter to near-the-money options
+    atm_options = df[abs(df['strike'] - underlying_price) / underlying_price < 0.05]
+    
+    if atm_options.empty:
+        # If no options are near ATM, use all options
+        atm_options = df
+    
+    # Calculate weighted average IV using volume as weight
+    if 'volume' in atm_options and atm_options['volume'].sum() > 0:
+        weighted_iv = (atm_options['iv'] * atm_options['volume']).sum() / atm_options['volume'].sum()
+    else:
+        weighted_iv = atm_options['iv'].mean()
+    
+    if surface is not None:
+        weighted_iv = surface.atm_vol()
+    
+    # Calculate IV change rate compared to historical average (simulated)
+    historical_iv_avg = 0.20  # This would normally be retrieved from historical data
+    iv_change_rate = weighted_iv / historical_iv_avg - 1
+    
+    # Calculate option activity indicator (volume relative to open interest)
+    if atm_options['open_interest'].sum() > 0:
+        activity_ratio = atm_options['volume'].sum() / atm_options['open_interest'].sum()
+    else:
+        activity_ratio = 0
+    
+    # Calculate Volaxivity
+    volaxivity = (weighted_iv * 100) * (1 + iv_change_rate) * (1 + min(activity_ratio, 1))
+    
+    return volaxivity
+
+def calculate_volatility_skew(df, surface=None):
+    """
+    Calculate volatility skew (difference between OTM put and call implied volatility)
+    Higher values indicate more fear in the market
+
+    surface - 可选的 VolSurface，给出时取曲面上 Config.VOL_SURFACE_TENOR_DAYS 期限的25 delta看跌IV - 看涨IV
+    """
+    if surface is not None:
+        return -surface.risk_reversal_25d()
+    
+    # Get the underlying price
+    underlying_price = df['underlying'].iloc[0]
+    
+    # Find OTM puts (strike < price)
+    otm_puts = df[(df['option_type'] == 'put') & (df['strike'] < underlying_price)]
+    
+    # Find OTM calls (strike > price)
+    otm_calls = df[(df['option_type'] == 'call') & (df['strike'] > underlying_price)]
+    
+    if otm_puts.empty or otm_calls.empty:
+        return 0
+    
+    # Calculate average IV for OTM puts and calls
+    avg_put_iv = otm_puts['iv'].mean()
+    avg_call_iv = otm_calls['iv'].mean()
+    
+    # Calculate skew (put IV - call IV)
+    skew = avg_put_iv - avg_call_iv
+    
+    return skew
+
+def calculate_put_call_ratio(df):
+    """
+    Calculate put-call ratio based on volume or open interest
+    High values indicate bearish sentiment
+    """
+    # Get total put and call volume
+    put_volume = df[df['option_type'] == 'put']['volume'].sum()
+    call_volume = df[df['option_type'] == 'call']['volume'].sum()
+    
+    # Calculate put-call ratio
+    if call_volume > 0:
+        pcr = put_volume / call_volume
+    else:
+        pcr = 1.0  # Default to neutral if no call volume
+    
+    return pcr
+
+def calculate_reflexivity_indicator(df):
+    """
+    Calculate reflexivity indicator based on market feedback loops
+    Uses gamma exposure as a proxy for potential market feedback
+    """
+    # Get the underlying price
+    underlying_price = df['underlying'].iloc[0]
+    
+    # Calculate total gamma exposure
+    total_gamma = (df['gamma'] * df['open_interest']).sum()
+    
+    # Normalize by underlying price
+    normalized_gamma = total_gamma / underlying_price
+    
+    # Calculate delta imbalance (call delta - put delta)
+    call_delta = df[df['option_type'] == 'call']['delta'].sum()
+    put_delta = abs(df[df['option_type'] == 'put']['delta'].sum())
+    delta_imbalance = abs(call_delta - put_delta) / (call_delta + put_delta) if (call_delta + put_delta) > 0 else 0
+    
+    # Combine gamma exposure and delta imbalance for reflexivity indicator
+    reflexivity = normalized_gamma * (1 + delta_imbalance)
+    
+    # Scale to a 0-1 range
+    scaled_reflexivity = min(1.0, reflexivity / 0.1)  # 0.1 is a normalization factor
+    
+    return scaled_reflexivity
+
+def determine_market_sentiment(volaxivity, put_call_ratio, reflexivity):
+    """
+    Determine market sentiment based on risk indicators
+    Returns 'risk-on' or 'risk-off'
+    """
+    # Define thresholds
+    volaxivity_threshold = 25
+    pcr_threshold = 1.2
+    reflexivity_threshold = 0.5
+    
+    # Count risk-off signals
+    risk_off_signals = 0
+    
+    if volaxivity > volaxivity_threshold:
+        risk_off_signals += 1
+    
+    if put_call_ratio > pcr_threshold:
+        risk_off_signals += 1
+    
+    if reflexivity > reflexivity_threshold:
+        risk_off_signals += 1
+    
+    # Determine sentiment based on majority of signals
+    if risk_off_signals >= 2:
+        return 'risk-off'
+    else:
+        return 'risk-on'
+        
+def get_crypto_specific_risk(symbol, df):
+    """
+    Calculate crypto-specific risk indicators
+    """
+    if symbol not in ['BTC', 'ETH']:
+        return None
+        
+    try:
+        # Get the underlying price
+        underlying_price = df['underlying'].iloc[0]
+        
+        # Calculate funding rate imbalance (simulated)
+        # In real implementation, this would come from exchange API
+        funding_rate = random.uniform(-0.01, 0.01)
+        
+        # Calculate liquidation risk (higher when price is near large put or call clusters)
+        # Simulated based on open interest distribution
+        call_oi_distribution = df[df['option_type'] == 'call'].groupby('strike')['open_interest'].sum()
+        put_oi_distribution = df[df['option_type'] == 'put'].groupby('strike')['open_interest'].sum()
+        
+        # Find strikes with highest open interest
+        if not call_oi_distribution.empty and not put_oi_distribution.empty:
+            max_call_strike = call_oi_distribution.idxmax()
+            max_put_strike = put_oi_distribution.idxmax()
+            
+            # Calculate distance to these strikes
+            call_distance = abs(max_call_strike - underlying_price) / underlying_price
+            put_distance = abs(max_put_strike - underlying_price) / underlying_price
+            
+            # Liquidation risk increases as price approaches these levels
+            liquidation_risk = max(0, min(1, 0.2 / min(call_distance, put_distance)))
+        else:
+            liquidation_risk = 0.5  # Default if no data
+            
+        return {
+            'funding_rate': funding_rate,
+            'liquidation_risk': liquidation_risk
+        }
+    except Exception as e:
+        logger.error(f"Error calculating crypto-specific risk: {str(e)}")
+        return None
+
+def check_deviation_anomaly(volume_change, premium_change, price_change, option_type, strike_price, market_price):
+    """
+    检查期权偏离是否异常
+    满足以下任一条件即为异常:
+    1. 成交量变化率 >= 50%
+    2. 权利金变化率 >= 30%
+    3. 权利金变化率和市场价格变化率方向相反（背离）
+    
+    异常级别:
+    - 关注级: 单一指标超过阈值
+    - 警告级: 两项指标超过阈值或出现方向背离
+    - 严重级: 三项指标都超过阈值
+    """
+    is_anomaly = False
+    anomaly_level = None
+    anomaly_count = 0
+    
+    # 检查成交量变化率
+    if volume_change is not None and volume_change >= 50:
+        is_anomaly = True
+        anomaly_count += 1
+    
+    # 检查权利金变化率
+    if premium_change is not None and abs(premium_change) >= 30:
+        is_anomaly = True
+        anomaly_count += 1
+    
+    # 检查背离情况 - 权利金变化率和市场价格变化率方向相反
+    divergence = False
+    if premium_change is not None and price_change is not None:
+        # 计算相关性：如果权利金和价格变化方向相反
+        if premium_change * price_change < 0:
+            is_anomaly = True
+            divergence = True
+            anomaly_count += 1
+    
+    # 确定异常级别
+    if is_anomaly:
+        if anomaly_count == 1:
+            anomaly_level = 'attention'  # 关注级
+        elif anomaly_count == 2 or divergence:
+            anomaly_level = 'warning'    # 警告级
+        else:
+            anomaly_level = 'severe'     # 严重级
+    
+    return is_anomaly, anomaly_level
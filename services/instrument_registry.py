@@ -0,0 +1,96 @@
+"""
+期权合约维度表缓存
+(交易所, 品种, 到期日, 执行价, 类型) -> Instrument.id 的进程内映射，
+入库时批量解析合约ID，跨时间窗口匹配同一合约时直接比较整数ID
+"""
+import logging
+import threading
+
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import Instrument
+
+logger = logging.getLogger(__name__)
+
+
+def instrument_key(exchange, symbol, expiration_date, strike_price, option_type):
+    """合约的自然键"""
+    return (exchange, symbol, expiration_date, float(strike_price), option_type)
+
+
+class InstrumentRegistry:
+    """合约ID缓存，合约一旦创建就不会改变，缓存无需失效"""
+
+    def __init__(self):
+        self._ids = {}
+        self._loaded_symbols = set()
+        self._lock = threading.Lock()
+
+    def _load_symbol(self, symbol):
+        """一次性加载某个品种的全部合约"""
+        rows = db.session.query(
+            Instrument.id, Instrument.exchange, Instrument.symbol,
+            Instrument.expiration_date, Instrument.strike_price, Instrument.option_type
+        ).filter(Instrument.symbol == symbol).all()
+        with self._lock:
+            for row in rows:
+                self._ids[instrument_key(row.exchange, row.symbol, row.expiration_date,
+                                         row.strike_price, row.option_type)] = row.id
+            self._loaded_symbols.add(symbol)
+
+    def lookup(self, exchange, symbol, expiration_date, strike_price, option_type):
+        """查找已存在的合约ID，不创建新合约"""
+        if symbol not in self._loaded_symbols:
+            self._load_symbol(symbol)
+        return self._ids.get(instrument_key(exchange, symbol, expiration_date, strike_price, option_type))
+
+    def resolve_quotes(self, quotes):
+        """
+        为一批报价解析合约ID，缺失的合约批量创建
+
+        返回:
+        与quotes顺序一致的合约ID列表
+        """
+        for symbol in {quote.symbol for quote in quotes} - self._loaded_symbols:
+            self._load_symbol(symbol)
+
+        keys = [instrument_key(q.exchange, q.symbol, q.expiration_date, q.strike_price, q.option_type)
+                for q in quotes]
+
+        missing = {}
+        for key, quote in zip(keys, quotes):
+            if key not in self._ids and key not in missing:
+                missing[key] = quote
+
+        if missing:
+            try:
+                new_instruments = [
+                    Instrument(
+                        exchange=key[0],
+                        symbol=key[1],
+                        expiration_date=key[2],
+                        strike_price=key[3],
+                        option_type=key[4],
+                        exchange_symbol=quote.instrument_name
+                    )
+                    for key, quote in missing.items()
+                ]
+                db.session.add_all(new_instruments)
+                db.session.flush()
+                new_ids = {key: instrument.id for key, instrument in zip(missing, new_instruments)}
+                # 立即提交，保证缓存中的ID始终对应已持久化的合约
+                db.session.commit()
+                with self._lock:
+                    self._ids.update(new_ids)
+                logger.info(f"新增{len(new_instruments)}个期权合约")
+            except IntegrityError:
+                # 其他进程同时创建了相同的合约，回滚后重新加载
+                db.session.rollback()
+                for symbol in {key[1] for key in missing}:
+                    self._load_symbol(symbol)
+
+        return [self._ids.get(key) for key in keys]
+
+
+instrument_registry = InstrumentRegistry()
@@ -0,0 +1,117 @@
+"""
+调度器主节点选举
+基于数据库租约：多个采集进程（可跨主机）同时运行时，只有租约持有者执行定时任务
+"""
+import logging
+import os
+import socket
+import threading
+import time
+import uuid
+from datetime import datetime, timedelta
+from functools import wraps
+
+from sqlalchemy import or_
+from sqlalchemy.exc import IntegrityError
+
+from app import db
+from models import SchedulerLease
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class LeaderLease:
+    """
+    数据库租约
+
+    通过条件更新原子地获取或续约：仅当租约已过期或本进程已持有时才能更新成功
+    """
+
+    def __init__(self, name, ttl_seconds):
+        self.name = name
+        self.ttl_seconds = ttl_seconds
+        self.holder_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        # 本地记录的租约有效期（单调时钟），留出安全余量，避免与新主节点重叠
+        self._valid_until = 0.0
+        self._lock = threading.Lock()
+
+    def try_acquire(self):
+        """尝试获取或续约租约，返回当前进程是否为主节点"""
+        started = time.monotonic()
+        now = datetime.utcnow()
+        expires_at = now + timedelta(seconds=self.ttl_seconds)
+
+        try:
+            updated = SchedulerLease.query.filter(
+                SchedulerLease.name == self.name,
+                or_(SchedulerLease.holder == self.holder_id, SchedulerLease.expires_at < now)
+            ).update({
+                'holder': self.holder_id,
+                'expires_at': expires_at,
+                'renewed_at': now
+            }, synchronize_session=False)
+
+            if updated == 0 and db.session.get(SchedulerLease, self.name) is None:
+                db.session.add(SchedulerLease(
+                    name=self.name,
+                    holder=self.holder_id,
+                    expires_at=expires_at,
+                    renewed_at=now
+                ))
+                updated = 1
+
+            db.session.commit()
+        except IntegrityError:
+            # 其他进程同时创建了租约
+            db.session.rollback()
+            updated = 0
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"续约调度器租约失败: {str(e)}")
+            updated = 0
+
+        was_leader = self.is_leader()
+        with self._lock:
+            if updated:
+                self._valid_until = started + self.ttl_seconds * 0.8
+            else:
+                self._valid_until = 0.0
+
+        if updated and not was_leader:
+            logger.info(f"已成为调度器主节点: {self.holder_id}")
+        elif not updated and was_leader:
+            logger.warning(f"已失去调度器主节点身份: {self.holder_id}")
+        return bool(updated)
+
+    def is_leader(self):
+        with self._lock:
+            return time.monotonic() < self._valid_until
+
+    def release(self):
+        """主动释放租约，让其他进程立即接管"""
+        with self._lock:
+            self._valid_until = 0.0
+        try:
+            SchedulerLease.query.filter_by(name=self.name, holder=self.holder_id).update({
+                'expires_at': datetime.utcnow()
+            }, synchronize_session=False)
+            db.session.commit()
+            logger.info(f"已释放调度器租约: {self.holder_id}")
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"释放调度器租约失败: {str(e)}")
+
+
+scheduler_lease = LeaderLease('scheduler', Config.SCHEDULER_LEASE_TTL_SECONDS)
+
+
+def leader_only(func):
+    """只在当前进程持有调度器租约时执行被装饰的任务"""
+    @wraps(func)
+    def wrapper(*args, **kwargs):
+        if not scheduler_lease.is_leader():
+            logger.debug(f"非主节点，跳过任务 {func.__name__}")
+            return None
+        return func(*args, **kwargs)
+    return wrapper
@@ -0,0 +1,303 @@
+"""
+蒙特卡洛VaR / Expected Shortfall 计算
+- 各品种标的价格和隐含波动率按相关的几何布朗运动模拟路径，在每个期限上对期权链做Black-76全量重定价
+- 期权链放在共享内存中，路径按块分配到进程池，工作进程直接映射共享内存，不复制期权链；
+  进程池在本进程内长期复用，工作进程只在首次模拟时启动和导入模块
+- 每个块的随机数由 SeedSequence(seed).spawn 派生，结果只取决于seed和块序号，与进程数无关；
+  每批块结束后检查VaR是否收敛，收敛后提前结束
+
+本模块不依赖数据库，期权链由调用方传入（见 services/var_service.py）
+"""
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from multiprocessing import shared_memory
+
+import numpy as np
+
+from config import Config
+from services.pricing import black76_price, DAYS_PER_YEAR
+from services.scenario_engine import quantities
+
+logger = logging.getLogger(__name__)
+
+# 共享内存中期权链矩阵的行
+CHAIN_ROWS = ('underlying', 'strike', 'expiry', 'iv', 'is_call', 'quantity')
+
+# 工作进程中已映射的共享内存，按名称缓存
+_attached = {}
+
+# 本进程复用的模拟进程池
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def atm_volatility(chain, default=0.6):
+    """近平值（执行价在标的价格±10%内）期权隐含波动率的中位数，作为标的价格的年化波动率"""
+    iv = chain['iv']
+    valid = np.isfinite(iv) & (iv > 0)
+    near = valid & (np.abs(np.log(chain['strike'] / chain['underlying'])) < 0.1)
+    for mask in (near, valid):
+        if mask.any():
+            return float(np.median(iv[mask]))
+    return default
+
+
+def correlation_matrix(n_symbols):
+    """
+    因子顺序: [各品种标的价格..., 各品种隐含波动率...]
+
+    不同品种之间的标的-波动率相关系数取 标的-波动率 × 标的-标的
+    """
+    rho_spot = Config.MONTE_CARLO_SPOT_CORRELATION
+    rho_vol = Config.MONTE_CARLO_VOL_CORRELATION
+    rho_spot_vol = Config.MONTE_CARLO_SPOT_VOL_CORRELATION
+
+    spot_block = np.full((n_symbols, n_symbols), rho_spot)
+    vol_block = np.full((n_symbols, n_symbols), rho_vol)
+    cross_block = np.full((n_symbols, n_symbols), rho_spot_vol * rho_spot)
+    np.fill_diagonal(spot_block, 1.0)
+    np.fill_diagonal(vol_block, 1.0)
+    np.fill_diagonal(cross_block, rho_spot_vol)
+    return np.block([[spot_block, cross_block], [cross_block.T, vol_block]])
+
+
+def _cholesky(correlation):
+    try:
+        return np.linalg.cholesky(correlation)
+    except np.linalg.LinAlgError:
+        # 配置的相关系数不是正定矩阵时，截断负特征值后重新归一化
+        values, vectors = np.linalg.eigh(correlation)
+        fixed = vectors @ np.diag(np.maximum(values, 1e-8)) @ vectors.T
+        scale = np.sqrt(np.diag(fixed))
+        return np.linalg.cholesky(fixed / np.outer(scale, scale))
+
+
+def _get_pool():
+    """返回本进程的模拟进程池，首次使用或进程池损坏后重新创建"""
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            # spawn启动的工作进程不继承调度器线程和数据库连接
+            context = multiprocessing.get_context('spawn')
+            _pool = ProcessPoolExecutor(max_workers=Config.MONTE_CARLO_WORKERS, mp_context=context)
+        return _pool
+
+
+def _discard_pool(pool):
+    global _pool
+    with _pool_lock:
+        if _pool is pool:
+            _pool = None
+    pool.shutdown(wait=False, cancel_futures=True)
+
+
+def shutdown_pool():
+    """关闭模拟进程池"""
+    global _pool
+    with _pool_lock:
+        pool, _pool = _pool, None
+    if pool is not None:
+        pool.shutdown(wait=True, cancel_futures=True)
+
+
+def _release_attached(keep):
+    """关闭不再使用的共享内存映射；工作进程长期存活，父进程删除的共享内存需要在这里解除映射"""
+    for name in [name for name in _attached if name not in keep]:
+        _attached.pop(name).close()
+
+
+def _attach(name):
+    """映射父进程创建的共享内存；工作进程不负责释放"""
+    shm = _attached.get(name)
+    if shm is None:
+        try:
+            shm = shared_memory.SharedMemory(name=name, track=False)
+        except TypeError:
+            # Python 3.13 之前没有track参数；spawn的工作进程与父进程共用资源跟踪进程，重复登记不会提前删除
+            shm = shared_memory.SharedMemory(name=name)
+        _attached[name] = shm
+    return shm
+
+
+def simulate_chunk(task):
+    """
+    模拟一个块的路径（在工作进程中执行）
+
+    参数:
+    task - dict: chains {symbol: (共享内存名, 合约数)}, symbols, spot_vols, vol_of_vol, cholesky,
+           horizons（天，升序）, paths, seed（SeedSequence）
+
+    返回:
+    ndarray (品种数, 期限数, 路径数) - 每个品种期权链的损益
+    """
+    symbols = task['symbols']
+    horizons = np.asarray(task['horizons'], dtype=float)
+    paths = task['paths']
+    n_symbols = len(symbols)
+    _release_attached({name for name, _ in task['chains'].values()})
+
+    rng = np.random.default_rng(task['seed'])
+    shocks = rng.standard_normal((len(horizons), paths, 2 * n_symbols)) @ task['cholesky'].T
+
+    # 期限之间的布朗运动增量累加成路径
+    dt = np.diff(np.concatenate([[0.0], horizons])) / DAYS_PER_YEAR
+    sqrt_dt = np.sqrt(dt)[:, None, None]
+    spot_vols = np.asarray(task['spot_vols'])[None, None, :]
+    vol_of_vol = task['vol_of_vol']
+    log_spot = np.cumsum(spot_vols * sqrt_dt * shocks[:, :, :n_symbols] -
+                         0.5 * spot_vols ** 2 * dt[:, None, None], axis=0)
+    log_vol = np.cumsum(vol_of_vol * sqrt_dt * shocks[:, :, n_symbols:] -
+                        0.5 * vol_of_vol ** 2 * dt[:, None, None], axis=0)
+
+    pnl = np.zeros((n_symbols, len(horizons), paths))
+    for s, symbol in enumerate(symbols):
+        name, size = task['chains'][symbol]
+        if size == 0:
+            continue
+        matrix = np.ndarray((len(CHAIN_ROWS), size), dtype=float, buffer=_attach(name).buf)
+        F0, K, T0, iv, is_call, quantity = matrix
+        is_call = is_call.astype(bool)
+        base = black76_price(F0, K, T0, iv, is_call) @ quantity
+
+        for h, horizon in enumerate(horizons):
+            T1 = np.maximum(T0 - horizon / DAYS_PER_YEAR, 0.0)
+            F1 = F0[None, :] * np.exp(log_spot[h, :, s])[:, None]
+            iv1 = iv[None, :] * np.exp(log_vol[h, :, s])[:, None]
+            pnl[s, h] = black76_price(F1, K[None, :], T1[None, :], iv1, is_call[None, :]) @ quantity - base
+
+    return pnl
+
+
+def var_es(pnl, confidence):
+    """损益样本的VaR和ES（以正数表示损失）"""
+    var = -np.quantile(pnl, 1 - confidence)
+    tail = pnl[pnl <= -var]
+    es = -tail.mean() if len(tail) else var
+    return float(var), float(es)
+
+
+def _create_shared_chain(chain):
+    """将期权链中可重定价的合约复制到共享内存，返回 (SharedMemory, 合约数)"""
+    valid = np.isfinite(chain['iv']) & (chain['iv'] > 0) & (chain['strike'] > 0) & (chain['underlying'] > 0)
+    size = int(valid.sum())
+    shm = shared_memory.SharedMemory(create=True, size=max(len(CHAIN_ROWS) * size * 8, 8))
+    matrix = np.ndarray((len(CHAIN_ROWS), size), dtype=float, buffer=shm.buf)
+    columns = dict(chain, quantity=quantities(chain))
+    for row, key in enumerate(CHAIN_ROWS):
+        matrix[row] = columns[key][valid]
+    return shm, size
+
+
+def simulate_var(chains, horizons=None, confidences=None, paths=None, seed=None, workers=None, spot_vols=None):
+    """
+    对多个品种的期权链运行蒙特卡洛模拟
+
+    参数:
+    chains - {symbol: chain_arrays(...)}
+    horizons - 期限（天）列表
+    confidences - 置信度列表
+    paths - 最大路径数
+    seed - 随机种子，相同输入和种子得到相同结果
+    workers - 进程数；为None时使用本进程复用的进程池（Config.MONTE_CARLO_WORKERS个进程）
+    spot_vols - 可选，{symbol: 标的价格年化波动率}；期权链只含持仓合约时由调用方按完整期权链给出
+
+    返回:
+    dict - paths（实际模拟的路径数）, converged, seed, symbols, spot_vols, contracts,
+           results: [{symbol（含组合'TOTAL'）, horizon_days, confidence, var, expected_shortfall}]
+    """
+    horizons = sorted(int(h) for h in (horizons or Config.MONTE_CARLO_HORIZONS))
+    confidences = sorted(float(c) for c in (confidences or Config.MONTE_CARLO_CONFIDENCES))
+    paths = int(paths or Config.MONTE_CARLO_PATHS)
+    seed = Config.MONTE_CARLO_SEED if seed is None else int(seed)
+    symbols = list(chains)
+
+    chunk_paths = Config.MONTE_CARLO_CHUNK_PATHS
+    n_chunks = max(1, -(-paths // chunk_paths))
+    seeds = np.random.SeedSequence(seed).spawn(n_chunks)
+    spot_vols = [(spot_vols or {}).get(symbol) or atm_volatility(chains[symbol]) for symbol in symbols]
+    cholesky = _cholesky(correlation_matrix(len(symbols)))
+
+    shared = {}
+    try:
+        for symbol in symbols:
+            shared[symbol] = _create_shared_chain(chains[symbol])
+        chain_specs = {symbol: (shm.name, size) for symbol, (shm, size) in shared.items()}
+        contracts = {symbol: size for symbol, (_, size) in shared.items()}
+
+        def task(index):
+            return {
+                'chains': chain_specs,
+                'symbols': symbols,
+                'spot_vols': spot_vols,
+                'vol_of_vol': Config.MONTE_CARLO_VOL_OF_VOL,
+                'cholesky': cholesky,
+                'horizons': horizons,
+                'paths': min(chunk_paths, paths - index * chunk_paths),
+                'seed': seeds[index]
+            }
+
+        results = []
+        converged = False
+        previous_var = None
+        batch = Config.MONTE_CARLO_BATCH_CHUNKS
+        if workers:
+            executor = ProcessPoolExecutor(max_workers=workers, mp_context=multiprocessing.get_context('spawn'))
+        else:
+            executor = _get_pool()
+        try:
+            for start in range(0, n_chunks, batch):
+                results.extend(executor.map(simulate_chunk, [task(i) for i in range(start, min(start + batch, n_chunks))]))
+
+                # 收敛检查: 最高置信度、最长期限的组合VaR
+                simulated = sum(result.shape[2] for result in results)
+                total = np.concatenate([result[:, -1, :].sum(axis=0) for result in results])
+                current_var, _ = var_es(total, confidences[-1])
+                if (previous_var is not None and simulated >= Config.MONTE_CARLO_MIN_PATHS and
+                        abs(current_var - previous_var) <= Config.MONTE_CARLO_CONVERGENCE_TOL * abs(previous_var)):
+                    converged = True
+                    break
+                previous_var = current_var
+        except BrokenProcessPool:
+            # 工作进程异常退出后进程池不可再用，下次模拟重新创建
+            if not workers:
+                _discard_pool(executor)
+            raise
+        finally:
+            if workers:
+                executor.shutdown()
+    finally:
+        for shm, _ in shared.values():
+            shm.close()
+            shm.unlink()
+
+    pnl = np.concatenate(results, axis=2)
+    series = {symbol: pnl[s] for s, symbol in enumerate(symbols)}
+    if len(symbols) > 1:
+        series['TOTAL'] = pnl.sum(axis=0)
+
+    rows = []
+    for symbol, symbol_pnl in series.items():
+        for h, horizon in enumerate(horizons):
+            for confidence in confidences:
+                var, es = var_es(symbol_pnl[h], confidence)
+                rows.append({
+                    'symbol': symbol,
+                    'horizon_days': horizon,
+                    'confidence': confidence,
+                    'var': var,
+                    'expected_shortfall': es
+                })
+
+    logger.info(f"蒙特卡洛模拟完成: {pnl.shape[2]} 条路径{'（已收敛）' if converged else ''}")
+    return {
+        'paths': int(pnl.shape[2]),
+        'converged': converged,
+        'seed': seed,
+        'symbols': symbols,
+        'spot_vols': dict(zip(symbols, spot_vols)),
+        'contracts': contracts,
+        'results': rows
+    }
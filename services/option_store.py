@@ -0,0 +1,326 @@
+"""
+期权快照存储
+- full模式：每个快照写入全部合约
+- delta模式：只写入相对上次写入值变化超过容差的合约，定期写入全量关键帧；
+  每个快照在OptionSnapshot中记录合约列表和标的价格，可以按时间点重建完整的期权链
+"""
+import json
+import logging
+import threading
+from datetime import timedelta
+
+from sqlalchemy import func
+
+from app import db
+from models import OptionData, OptionSnapshot
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+# 参与变化判断的字段；标的价格每个快照都会变化，单独记录在OptionSnapshot中
+TRACKED_FIELDS = ('option_price', 'implied_volatility', 'volume', 'open_interest',
+                  'delta', 'gamma', 'theta', 'vega')
+
+
+class LastValueCache:
+    """
+    每个合约最近一次写入的值
+
+    缓存只在本进程内有效；如果数据库中最新的快照不是本进程写入的（例如手动刷新在其他进程执行），
+    下一个快照按关键帧全量写入，保证重建结果正确
+    """
+
+    def __init__(self):
+        self._values = {}
+        self._last_snapshot = {}
+        self._lock = threading.Lock()
+
+    def values(self, instrument_id):
+        return self._values.get(instrument_id)
+
+    def last_snapshot(self, symbol, exchange):
+        """返回 (快照时间, 关键帧时间)"""
+        return self._last_snapshot.get((symbol, exchange), (None, None))
+
+    def update(self, symbol, exchange, snapshot_time, keyframe_time, written_records):
+        with self._lock:
+            for record in written_records:
+                if record.instrument_id is not None:
+                    self._values[record.instrument_id] = tuple(getattr(record, f) for f in TRACKED_FIELDS)
+            self._last_snapshot[(symbol, exchange)] = (snapshot_time, keyframe_time)
+
+
+_last_values = LastValueCache()
+
+
+def _has_changed(previous, record):
+    for field, old in zip(TRACKED_FIELDS, previous):
+        new = getattr(record, field)
+        if new == old:
+            continue
+        if new is None or old is None:
+            return True
+        if abs(new - old) > Config.OPTION_DELTA_TOLERANCES.get(field, 0) * abs(old):
+            return True
+    return False
+
+
+def store_option_snapshot(symbol, snapshot_time, records):
+    """
+    存储一个快照的期权记录（调用方负责提交事务）
+
+    参数:
+    symbol - 标的符号
+    snapshot_time - 快照时间
+    records - 该快照的OptionData记录（未保存）
+
+    返回:
+    实际写入的行数
+    """
+    delta_mode = Config.OPTION_STORAGE_MODE == 'delta'
+
+    by_exchange = {}
+    for record in records:
+        by_exchange.setdefault(record.exchange, []).append(record)
+
+    total_written = 0
+    for exchange, exchange_records in by_exchange.items():
+        keyframe_time = snapshot_time
+        to_write = exchange_records
+
+        if delta_mode:
+            cached_snapshot, cached_keyframe = _last_values.last_snapshot(symbol, exchange)
+            latest_snapshot = db.session.query(func.max(OptionSnapshot.snapshot_time)).filter(
+                OptionSnapshot.symbol == symbol,
+                OptionSnapshot.exchange == exchange
+            ).scalar()
+
+            is_keyframe = (
+                cached_snapshot is None or
+                cached_snapshot != latest_snapshot or
+                snapshot_time - cached_keyframe >= timedelta(minutes=Config.OPTION_KEYFRAME_MINUTES)
+            )
+            if not is_keyframe:
+                keyframe_time = cached_keyframe
+                to_write = []
+                for record in exchange_records:
+                    previous = _last_values.values(record.instrument_id) if record.instrument_id is not None else None
+                    if previous is None or _has_changed(previous, record):
+                        to_write.append(record)
+
+        db.session.bulk_save_objects(to_write)
+        db.session.add(OptionSnapshot(
+            symbol=symbol,
+            exchange=exchange,
+            snapshot_time=snapshot_time,
+            underlying_price=exchange_records[0].underlying_price,
+            keyframe_time=keyframe_time,
+            contract_count=len(exchange_records),
+            rows_written=len(to_write),
+            instrument_ids=json.dumps([r.instrument_id for r in exchange_records if r.instrument_id is not None])
+        ))
+        _last_values.update(symbol, exchange, snapshot_time, keyframe_time, to_write)
+        total_written += len(to_write)
+
+        if delta_mode:
+            logger.info(f"{symbol}@{exchange} 快照写入 {len(to_write)}/{len(exchange_records)} 行"
+                        f"{'（关键帧）' if keyframe_time == snapshot_time else ''}")
+
+    return total_written
+
+
+def get_latest_snapshot_time(symbol):
+    """最新快照时间，兼容OptionSnapshot表上线前的数据"""
+    latest = db.session.query(func.max(OptionSnapshot.snapshot_time)).filter(
+        OptionSnapshot.symbol == symbol
+    ).scalar()
+    if latest is None:
+        latest = db.session.query(func.max(OptionData.timestamp)).filter(
+            OptionData.symbol == symbol
+        ).scalar()
+    return latest
+
+
+def load_option_chain(symbol, snapshot_time=None, exchange=None):
+    """
+    重建某个时间点的完整期权链
+
+    参数:
+    symbol - 标的符号
+    snapshot_time - 快照时间，为None时使用最新快照
+    exchange - 可选，只返回指定交易所的合约
+
+    返回:
+    OptionData对象列表（已脱离会话，修改不会写回数据库），timestamp和underlying_price为该快照的值
+    """
+    if snapshot_time is None:
+        snapshot_time = get_latest_snapshot_time(symbol)
+        if snapshot_time is None:
+            return []
+
+    snapshot_query = OptionSnapshot.query.filter(
+        OptionSnapshot.symbol == symbol,
+        OptionSnapshot.snapshot_time == snapshot_time
+    )
+    if exchange:
+        snapshot_query = snapshot_query.filter(OptionSnapshot.exchange == exchange)
+    snapshots = snapshot_query.all()
+
+    if not snapshots:
+        # OptionSnapshot表上线前写入的全量数据
+        query = OptionData.query.filter(
+            OptionData.symbol == symbol,
+            OptionData.timestamp == snapshot_time
+        )
+        if exchange:
+            query = query.filter(OptionData.exchange == exchange)
+        return query.all()
+
+    chain = []
+    for snapshot in snapshots:
+        instrument_ids = set(json.loads(snapshot.instrument_ids))
+
+        rows = OptionData.query.filter(
+            OptionData.symbol == symbol,
+            OptionData.exchange == snapshot.exchange,
+            OptionData.timestamp >= snapshot.keyframe_time,
+            OptionData.timestamp <= snapshot.snapshot_time
+        ).order_by(OptionData.timestamp).all()
+
+        # 每个合约取该快照时间点之前最后一次写入的值
+        latest_rows = {}
+        for row in rows:
+            if row.instrument_id in instrument_ids:
+                latest_rows[row.instrument_id] = row
+            elif row.instrument_id is None and row.timestamp == snapshot.snapshot_time:
+                latest_rows[('row', row.id)] = row
+
+        for row in latest_rows.values():
+            db.session.expunge(row)
+            row.timestamp = snapshot.snapshot_time
+            row.underlying_price = snapshot.underlying_price
+            chain.append(row)
+
+    return chain
+
+
+def get_latest_underlying_price(symbol):
+    """最新快照的标的价格；delta模式下最新写入的行可能来自较早的快照，不能直接取其标的价格"""
+    snapshot = OptionSnapshot.query.filter(
+        OptionSnapshot.symbol == symbol
+    ).order_by(OptionSnapshot.snapshot_time.desc()).first()
+    if snapshot is not None:
+        return snapshot.underlying_price
+    latest = OptionData.query.filter_by(symbol=symbol).order_by(OptionData.timestamp.desc()).first()
+    return latest.underlying_price if latest else None
+
+
+def has_partial_snapshots(symbol, start, end=None, exchange=None):
+    """时间窗口 [start, end) 内是否有只写入了部分合约的快照（delta模式写入），此时不能直接读取原始行"""
+    query = db.session.query(OptionSnapshot.id).filter(
+        OptionSnapshot.symbol == symbol,
+        OptionSnapshot.snapshot_time >= start,
+        OptionSnapshot.rows_written < OptionSnapshot.contract_count
+    )
+    if end is not None:
+        query = query.filter(OptionSnapshot.snapshot_time < end)
+    if exchange:
+        query = query.filter(OptionSnapshot.exchange == exchange)
+    return query.first() is not None
+
+
+def _snapshot_row(row, snapshot):
+    """复制一行作为某个快照的合约记录（不加入会话）"""
+    copy = OptionData(**{column.name: getattr(row, column.name) for column in OptionData.__table__.columns})
+    copy.timestamp = snapshot.snapshot_time
+    copy.underlying_price = snapshot.underlying_price
+    return copy
+
+
+def load_option_window(symbol, start, end=None, exchange=None, option_type=None):
+    """
+    时间窗口 [start, end) 内每个快照的全部合约记录，按时间升序；结果与full模式下直接读取原始行相同
+
+    窗口内没有delta模式写入的快照时直接返回原始行；否则从最早依赖的关键帧开始一次读取原始行，
+    按快照顺序前推每个合约最近一次写入的值，重建每个快照的完整期权链
+
+    返回:
+    OptionData对象列表；重建的记录不在会话中，修改不会写回数据库
+    """
+    def raw_query(query_start):
+        query = OptionData.query.filter(
+            OptionData.symbol == symbol,
+            OptionData.timestamp >= query_start
+        )
+        if end is not None:
+            query = query.filter(OptionData.timestamp < end)
+        if exchange:
+            query = query.filter(OptionData.exchange == exchange)
+        return query
+
+    if not has_partial_snapshots(symbol, start, end, exchange):
+        query = raw_query(start)
+        if option_type:
+            query = query.filter(OptionData.option_type == option_type)
+        return query.order_by(OptionData.timestamp).all()
+
+    snapshot_query = OptionSnapshot.query.filter(
+        OptionSnapshot.symbol == symbol,
+        OptionSnapshot.snapshot_time >= start
+    )
+    if end is not None:
+        snapshot_query = snapshot_query.filter(OptionSnapshot.snapshot_time < end)
+    if exchange:
+        snapshot_query = snapshot_query.filter(OptionSnapshot.exchange == exchange)
+    snapshots = snapshot_query.order_by(OptionSnapshot.snapshot_time).all()
+
+    earliest_keyframe = min(snapshot.keyframe_time for snapshot in snapshots)
+    rows_by_exchange = {}
+    for row in raw_query(min(start, earliest_keyframe)).order_by(OptionData.timestamp).all():
+        rows_by_exchange.setdefault(row.exchange, []).append(row)
+
+    snapshot_times = {(snapshot.exchange, snapshot.snapshot_time) for snapshot in snapshots}
+    result = []
+    # OptionSnapshot表上线前写入的全量数据没有快照记录，原样返回
+    for rows in rows_by_exchange.values():
+        result.extend(row for row in rows
+                      if row.timestamp >= start and (row.exchange, row.timestamp) not in snapshot_times)
+
+    positions = {}
+    latest_rows = {}
+    for snapshot in snapshots:
+        rows = rows_by_exchange.get(snapshot.exchange, [])
+        position = positions.get(snapshot.exchange, 0)
+        latest = latest_rows.setdefault(snapshot.exchange, {})
+        legacy_rows = []
+        while position < len(rows) and rows[position].timestamp <= snapshot.snapshot_time:
+            row = rows[position]
+            if row.instrument_id is not None:
+                latest[row.instrument_id] = row
+            elif row.timestamp == snapshot.snapshot_time:
+                legacy_rows.append(row)
+            position += 1
+        positions[snapshot.exchange] = position
+
+        for instrument_id in json.loads(snapshot.instrument_ids):
+            row = latest.get(instrument_id)
+            if row is not None:
+                result.append(_snapshot_row(row, snapshot))
+        result.extend(_snapshot_row(row, snapshot) for row in legacy_rows)
+
+    if option_type:
+        result = [row for row in result if row.option_type == option_type]
+    result.sort(key=lambda row: row.timestamp)
+    return result
+
+
+def get_retention_cutoff(cutoff):
+    """
+    数据清理的截止时间；delta模式下保留仍被较新快照引用的关键帧
+    """
+    earliest_keyframe = db.session.query(func.min(OptionSnapshot.keyframe_time)).filter(
+        OptionSnapshot.snapshot_time >= cutoff
+    ).scalar()
+    if earliest_keyframe is not None and earliest_keyframe < cutoff:
+        return earliest_keyframe
+    return cutoff
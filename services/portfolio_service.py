@@ -0,0 +1,339 @@
+"""
+持仓组合
+- Portfolio / Position 保存在数据库中；进程内的 PortfolioBook 按品种把所有组合的持仓保存为与合约维度对齐的紧凑数组:
+  columns 合约ID -> 列号，greeks (合约数, 4) 为最新快照的每合约Greeks，quantities (组合数, 合约数)
+- 汇总Greeks totals = quantities @ greeks 只在加载组合时计算，之后增量更新:
+  持仓变化时 totals[组合] += Δ数量 × greeks[合约]；新快照到达时 totals += quantities[:, 变化的合约] @ ΔGreeks
+- 其他进程写入的快照和持仓变化，在读取时通过最新快照时间和 Portfolio.updated_at 发现并同步
+"""
+import logging
+import threading
+from datetime import datetime
+
+import numpy as np
+
+from app import db
+from models import Portfolio, Position, Instrument
+from services.option_store import load_option_chain, get_latest_snapshot_time
+from services.scenario_engine import GREEKS, chain_arrays, current_greeks
+
+logger = logging.getLogger(__name__)
+
+
+class SymbolBook:
+    """一个品种上所有组合的持仓数组"""
+
+    def __init__(self, symbol):
+        self.symbol = symbol
+        self.snapshot_time = None
+        self.columns = {}  # 合约ID -> 列号
+        self.rows = {}  # 组合ID -> 行号
+        self.versions = {}  # 组合ID -> 已同步的 Portfolio.updated_at
+        self.greeks = np.zeros((0, len(GREEKS)))
+        self.quantities = np.zeros((0, 0))
+        self.totals = np.zeros((0, len(GREEKS)))
+
+    def _columns(self, instrument_ids):
+        """合约ID对应的列号，新合约追加到末尾"""
+        new = [i for i in dict.fromkeys(instrument_ids) if i not in self.columns]
+        if new:
+            for instrument_id in new:
+                self.columns[instrument_id] = len(self.columns)
+            self.greeks = np.vstack([self.greeks, np.zeros((len(new), len(GREEKS)))])
+            self.quantities = np.hstack([self.quantities, np.zeros((len(self.rows), len(new)))])
+        return np.fromiter((self.columns[i] for i in instrument_ids), dtype=np.int64, count=len(instrument_ids))
+
+    def _row(self, portfolio_id):
+        row = self.rows.get(portfolio_id)
+        if row is None:
+            row = self.rows[portfolio_id] = len(self.rows)
+            self.quantities = np.vstack([self.quantities, np.zeros((1, len(self.columns)))])
+            self.totals = np.vstack([self.totals, np.zeros((1, len(GREEKS)))])
+        return row
+
+    def apply_snapshot(self, snapshot_time, chain):
+        """
+        用新快照的Greeks更新汇总，只有Greeks变化的合约参与计算；不在快照中的合约（已到期、下架）Greeks为0
+
+        返回:
+        Greeks变化的合约数
+        """
+        known = chain['instrument_id'] > 0
+        _, greeks = current_greeks(chain)
+        columns = self._columns(chain['instrument_id'][known].tolist())
+
+        new_greeks = np.zeros_like(self.greeks)
+        new_greeks[columns] = np.column_stack([greeks[greek][known] for greek in GREEKS])
+        change = new_greeks - self.greeks
+        changed = np.flatnonzero(np.any(change != 0, axis=1))
+        if len(changed) and len(self.rows):
+            self.totals += self.quantities[:, changed] @ change[changed]
+
+        self.greeks = new_greeks
+        self.snapshot_time = snapshot_time
+        return len(changed)
+
+    def set_quantity(self, portfolio_id, instrument_id, quantity):
+        """单个持仓变化，O(1) 更新汇总"""
+        row = self._row(portfolio_id)
+        column = self._columns([instrument_id])[0]
+        self.totals[row] += (quantity - self.quantities[row, column]) * self.greeks[column]
+        self.quantities[row, column] = quantity
+
+    def load_portfolio(self, portfolio_id, positions):
+        """整体替换一个组合的持仓，positions: {合约ID: 数量}"""
+        row = self._row(portfolio_id)
+        columns = self._columns(list(positions))
+        self.quantities[row] = 0.0
+        self.quantities[row, columns] = list(positions.values())
+        self.totals[row] = self.quantities[row] @ self.greeks
+
+    def remove_portfolio(self, portfolio_id):
+        row = self.rows.get(portfolio_id)
+        if row is not None:
+            self.quantities[row] = 0.0
+            self.totals[row] = 0.0
+        self.versions.pop(portfolio_id, None)
+
+    def aggregate(self, portfolio_id):
+        """组合在该品种上的汇总Greeks和持仓合约数"""
+        row = self.rows.get(portfolio_id)
+        if row is None:
+            return dict({greek: 0.0 for greek in GREEKS}, positions=0)
+        return dict(
+            {greek: float(value) for greek, value in zip(GREEKS, self.totals[row])},
+            positions=int(np.count_nonzero(self.quantities[row]))
+        )
+
+    def quantities_for(self, portfolio_id, instrument_ids):
+        """按给定合约ID顺序返回组合的持仓数量，没有持仓的合约为0"""
+        row = self.rows.get(portfolio_id)
+        result = np.zeros(len(instrument_ids))
+        if row is None:
+            return result
+        columns = np.fromiter((self.columns.get(i, -1) for i in instrument_ids), dtype=np.int64,
+                              count=len(instrument_ids))
+        found = columns >= 0
+        result[found] = self.quantities[row, columns[found]]
+        return result
+
+
+class PortfolioBook:
+    """进程内所有品种的持仓数组，按需从数据库加载"""
+
+    def __init__(self):
+        self._books = {}
+        self._lock = threading.RLock()
+
+    def sync(self, symbol):
+        """
+        与数据库同步后返回品种的持仓数组（在应用上下文中调用）
+        只重新加载 updated_at 变化的组合；最新快照变化时增量更新Greeks
+        """
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None:
+                book = self._books[symbol] = SymbolBook(symbol)
+
+            versions = dict(db.session.query(Portfolio.id, Portfolio.updated_at).all())
+            for portfolio_id in set(book.versions) - set(versions):
+                book.remove_portfolio(portfolio_id)
+            for portfolio_id, updated_at in versions.items():
+                if book.versions.get(portfolio_id) != updated_at:
+                    book.load_portfolio(portfolio_id, _load_positions(portfolio_id, symbol))
+                    book.versions[portfolio_id] = updated_at
+
+            latest_time = get_latest_snapshot_time(symbol)
+            if latest_time is not None and latest_time != book.snapshot_time:
+                options = load_option_chain(symbol, latest_time)
+                if options:
+                    book.apply_snapshot(latest_time, chain_arrays(options, latest_time))
+            return book
+
+    def on_snapshot(self, symbol, snapshot_time, records):
+        """入库后直接用内存中的记录更新已加载的品种，不需要重新读取期权链"""
+        with self._lock:
+            book = self._books.get(symbol)
+            if book is None or (book.snapshot_time is not None and snapshot_time <= book.snapshot_time):
+                return
+            changed = book.apply_snapshot(snapshot_time, chain_arrays(records, snapshot_time))
+            logger.debug(f"{symbol} 持仓Greeks已按快照 {snapshot_time} 更新 ({changed} 个合约变化)")
+
+    def on_positions_changed(self, portfolio_id, updated_at, changes):
+        """本进程写入的持仓变化，changes: [(品种, 合约ID, 新数量)]"""
+        with self._lock:
+            for symbol, instrument_id, quantity in changes:
+                book = self._books.get(symbol)
+                if book is not None:
+                    book.set_quantity(portfolio_id, instrument_id, quantity)
+            for book in self._books.values():
+                if portfolio_id in book.versions:
+                    book.versions[portfolio_id] = updated_at
+
+    def on_portfolio_removed(self, portfolio_id):
+        with self._lock:
+            for book in self._books.values():
+                book.remove_portfolio(portfolio_id)
+
+
+portfolio_book = PortfolioBook()
+
+
+def _load_positions(portfolio_id, symbol):
+    rows = db.session.query(Position.instrument_id, Position.quantity).join(
+        Instrument, Position.instrument_id == Instrument.id
+    ).filter(
+        Position.portfolio_id == portfolio_id,
+        Instrument.symbol == symbol
+    ).all()
+    return {row.instrument_id: row.quantity for row in rows}
+
+
+def create_portfolio(name, description=''):
+    """创建组合，同名组合已存在时返回None"""
+    if Portfolio.query.filter_by(name=name).first():
+        return None
+    portfolio = Portfolio(name=name, description=description)
+    db.session.add(portfolio)
+    db.session.commit()
+    return portfolio
+
+
+def delete_portfolio(portfolio_id):
+    portfolio = Portfolio.query.get(portfolio_id)
+    if not portfolio:
+        return False
+    Position.query.filter_by(portfolio_id=portfolio_id).delete()
+    db.session.delete(portfolio)
+    db.session.commit()
+    portfolio_book.on_portfolio_removed(portfolio_id)
+    return True
+
+
+def resolve_instrument(item):
+    """
+    持仓条目对应的合约: instrument_id，或 exchange + instrument（交易所原生合约名称，如 BTC-27JUN25-100000-C）
+    """
+    if item.get('instrument_id') is not None:
+        return Instrument.query.get(int(item['instrument_id']))
+    if item.get('instrument'):
+        return Instrument.query.filter_by(
+            exchange=item.get('exchange', 'deribit'),
+            exchange_symbol=item['instrument']
+        ).first()
+    return None
+
+
+def set_positions(portfolio_id, positions):
+    """
+    设置组合中的持仓数量（只修改列出的合约，数量为0时删除持仓）
+
+    参数:
+    positions - [{'instrument_id' 或 'exchange' + 'instrument', 'quantity'}]
+
+    返回:
+    更新的持仓数；组合不存在时返回None
+
+    Raises:
+    ValueError - 合约不存在或数量无效
+    """
+    portfolio = Portfolio.query.get(portfolio_id)
+    if not portfolio:
+        return None
+
+    resolved = []
+    for item in positions:
+        instrument = resolve_instrument(item)
+        if instrument is None:
+            raise ValueError(f"Unknown instrument: {item}")
+        quantity = float(item.get('quantity', 0))
+        if not np.isfinite(quantity):
+            raise ValueError(f"Invalid quantity: {item}")
+        resolved.append((instrument, quantity))
+
+    existing = {
+        position.instrument_id: position
+        for position in Position.query.filter(
+            Position.portfolio_id == portfolio_id,
+            Position.instrument_id.in_([instrument.id for instrument, _ in resolved])
+        ).all()
+    }
+
+    now = datetime.utcnow()
+    changes = []
+    try:
+        for instrument, quantity in resolved:
+            position = existing.get(instrument.id)
+            if quantity == 0:
+                if position is not None:
+                    db.session.delete(position)
+                    existing.pop(instrument.id)
+            elif position is None:
+                position = existing[instrument.id] = Position(
+                    portfolio_id=portfolio_id, instrument_id=instrument.id, quantity=quantity, updated_at=now
+                )
+                db.session.add(position)
+            else:
+                position.quantity = quantity
+                position.updated_at = now
+            changes.append((instrument.symbol, instrument.id, quantity))
+
+        portfolio.updated_at = now
+        db.session.commit()
+    except Exception:
+        db.session.rollback()
+        raise
+
+    portfolio_book.on_positions_changed(portfolio_id, now, changes)
+    return len(changes)
+
+
+def get_positions(portfolio_id):
+    """组合的持仓明细"""
+    rows = db.session.query(Position, Instrument).join(
+        Instrument, Position.instrument_id == Instrument.id
+    ).filter(Position.portfolio_id == portfolio_id).order_by(
+        Instrument.symbol, Instrument.expiration_date, Instrument.strike_price, Instrument.option_type
+    ).all()
+    return [
+        {
+            'instrument_id': instrument.id,
+            'exchange': instrument.exchange,
+            'instrument': instrument.exchange_symbol,
+            'symbol': instrument.symbol,
+            'expiration_date': instrument.expiration_date.isoformat(),
+            'strike_price': instrument.strike_price,
+            'option_type': instrument.option_type,
+            'quantity': position.quantity,
+            'updated_at': position.updated_at.isoformat()
+        }
+        for position, instrument in rows
+    ]
+
+
+def get_portfolio_greeks(portfolio_id, symbols):
+    """
+    组合在各品种上的汇总Greeks
+
+    返回:
+    {symbol: {delta, gamma, vega, theta, positions, snapshot_time}}
+    """
+    result = {}
+    for symbol in symbols:
+        book = portfolio_book.sync(symbol)
+        result[symbol] = dict(
+            book.aggregate(portfolio_id),
+            snapshot_time=book.snapshot_time.isoformat() if book.snapshot_time else None
+        )
+    return result
+
+
+def portfolio_chain(chain, portfolio_id, symbol):
+    """
+    只保留组合持有的合约，并附加持仓数量（quantity），供情景分析和蒙特卡洛模拟按实际持仓计算
+    """
+    quantity = portfolio_book.sync(symbol).quantities_for(portfolio_id, chain['instrument_id'].tolist())
+    held = quantity != 0
+    filtered = {key: values[held] for key, values in chain.items()}
+    filtered['quantity'] = quantity[held]
+    return filtered
@@ -0,0 +1,220 @@
+"""
+期权定价（Black-76，向量化）
+加密货币期权以期货/远期价格为标的、利率取0，所有函数接受NumPy数组并逐元素计算
+
+单位约定与交易所Greeks一致:
+- sigma 为小数形式的隐含波动率（0.65 表示 65%）
+- T 为年化剩余期限（365天）
+- 价格和Greeks以计价货币（USD）表示；以币计价的权利金（Deribit、OKX）先乘以标的价格换算
+- vega 为波动率变化1个百分点的价格变化，theta 为每天的价格变化
+"""
+from datetime import datetime, time as dt_time
+
+import numpy as np
+from scipy.special import ndtr
+
+from config import Config
+
+DAYS_PER_YEAR = 365.0
+
+# 到期或波动率为0时的数值下限，避免除零
+MIN_TIME = 1e-8
+MIN_VOL = 1e-4
+
+# 隐含波动率求解的搜索区间和收敛容差（价格的相对误差）
+IV_LOWER = 1e-3
+IV_UPPER = 10.0
+IV_TOLERANCE = 1e-8
+IV_MAX_ITERATIONS = 100
+
+GREEKS = ('delta', 'gamma', 'vega', 'theta')
+
+
+def year_fraction(expiration_dates, as_of):
+    """
+    从as_of到各到期日（交易所结算时刻 Config.OPTION_EXPIRY_HOUR_UTC）的年化期限
+
+    参数:
+    expiration_dates - date的序列
+    as_of - datetime（UTC）
+    """
+    expiry_time = dt_time(hour=Config.OPTION_EXPIRY_HOUR_UTC)
+    seconds = np.fromiter(
+        ((datetime.combine(expiration, expiry_time) - as_of).total_seconds() for expiration in expiration_dates),
+        dtype=float,
+        count=len(expiration_dates)
+    )
+    return np.maximum(seconds, 0.0) / (DAYS_PER_YEAR * 86400)
+
+
+def _d1_d2(F, K, T, sigma):
+    T = np.maximum(T, MIN_TIME)
+    sigma = np.maximum(sigma, MIN_VOL)
+    vol_sqrt_t = sigma * np.sqrt(T)
+    d1 = (np.log(F / K) + 0.5 * sigma * sigma * T) / vol_sqrt_t
+    return d1, d1 - vol_sqrt_t, vol_sqrt_t
+
+
+def black76_price(F, K, T, sigma, is_call):
+    """
+    Black-76期权价格；到期（T<=0）时返回内在价值
+
+    参数:
+    F, K, T, sigma - 标的价格、执行价、年化期限、波动率
+    is_call - bool数组，True为看涨
+    """
+    F, K, T, sigma = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (F, K, T, sigma)))
+    d1, d2, _ = _d1_d2(F, K, T, sigma)
+    call = F * ndtr(d1) - K * ndtr(d2)
+    put = K * ndtr(-d2) - F * ndtr(-d1)
+    price = np.where(is_call, call, put)
+
+    intrinsic = np.where(is_call, np.maximum(F - K, 0.0), np.maximum(K - F, 0.0))
+    return np.where(T <= 0, intrinsic, price)
+
+
+def black76_gamma(F, K, T, sigma):
+    """Black-76 gamma（标的价格变化1单位），只需要gamma时比 black76_greeks 省去其他Greeks的计算；到期时为0"""
+    F, K, T, sigma = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (F, K, T, sigma)))
+    d1, _, vol_sqrt_t = _d1_d2(F, K, T, sigma)
+    gamma = np.exp(-0.5 * d1 * d1) / (np.sqrt(2 * np.pi) * F * vol_sqrt_t)
+    return np.where(T <= 0, 0.0, gamma)
+
+
+def black76_greeks(F, K, T, sigma, is_call):
+    """
+    Black-76 Greeks
+
+    返回:
+    dict - delta, gamma（标的价格变化1单位）, vega（波动率变化1个百分点）, theta（每天）
+    """
+    F, K, T, sigma = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (F, K, T, sigma)))
+    d1, _, vol_sqrt_t = _d1_d2(F, K, T, sigma)
+    pdf = np.exp(-0.5 * d1 * d1) / np.sqrt(2 * np.pi)
+    expired = T <= 0
+
+    delta = np.where(is_call, ndtr(d1), ndtr(d1) - 1.0)
+    gamma = pdf / (F * vol_sqrt_t)
+    vega = F * pdf * np.sqrt(np.maximum(T, MIN_TIME))
+    theta = -F * pdf * np.maximum(sigma, MIN_VOL) / (2 * np.sqrt(np.maximum(T, MIN_TIME)))
+
+    intrinsic_delta = np.where(is_call, (F > K).astype(float), -(F < K).astype(float))
+    return {
+        'delta': np.where(expired, intrinsic_delta, delta),
+        'gamma': np.where(expired, 0.0, gamma),
+        'vega': np.where(expired, 0.0, vega / 100),
+        'theta': np.where(expired, 0.0, theta / DAYS_PER_YEAR)
+    }
+
+
+def implied_volatility(price, F, K, T, is_call):
+    """
+    由期权价格反解Black-76隐含波动率
+
+    对整条期权链同时迭代: 每次先取牛顿步，牛顿步落在当前区间之外或vega过小时改用二分，
+    区间由价格关于波动率的单调性逐步收紧，因此总能收敛
+
+    返回:
+    ndarray - 隐含波动率；价格不满足无套利边界（低于内在价值或高于上限）、已到期或输入无效时为NaN
+    """
+    price, F, K, T = np.broadcast_arrays(*(np.asarray(x, dtype=float) for x in (price, F, K, T)))
+    is_call = np.broadcast_to(np.asarray(is_call, dtype=bool), price.shape)
+
+    # 用看涨价格求解，看跌价格由平价关系换算
+    call_price = np.where(is_call, price, price + (F - K))
+    intrinsic = np.maximum(F - K, 0.0)
+    with np.errstate(invalid='ignore'):
+        valid = ((F > 0) & (K > 0) & (T > 0) & np.isfinite(call_price) &
+                 (call_price > intrinsic) & (call_price < F))
+
+    result = np.full(price.shape, np.nan)
+    index = np.flatnonzero(valid)
+    if len(index) == 0:
+        return result
+
+    target = call_price.ravel()[index]
+    F_, K_, T_ = F.ravel()[index], K.ravel()[index], T.ravel()[index]
+    sqrt_t = np.sqrt(T_)
+    lower = np.full(len(index), IV_LOWER)
+    upper = np.full(len(index), IV_UPPER)
+    # Brenner-Subrahmanyam 近似作为初值
+    sigma = np.clip(np.sqrt(2 * np.pi / T_) * target / F_, 0.05, 3.0)
+
+    active = np.arange(len(index))
+    for _ in range(IV_MAX_ITERATIONS):
+        s, f, k, t, st = sigma[active], F_[active], K_[active], T_[active], sqrt_t[active]
+        d1 = (np.log(f / k) + 0.5 * s * s * t) / (s * st)
+        diff = f * ndtr(d1) - k * ndtr(d1 - s * st) - target[active]
+
+        converged = np.abs(diff) <= IV_TOLERANCE * np.maximum(target[active], 1e-12)
+        lower[active] = np.where(diff < 0, s, lower[active])
+        upper[active] = np.where(diff > 0, s, upper[active])
+
+        vega = f * st * np.exp(-0.5 * d1 * d1) / np.sqrt(2 * np.pi)
+        with np.errstate(divide='ignore', invalid='ignore', over='ignore'):
+            newton = s - diff / vega
+        bisect = 0.5 * (lower[active] + upper[active])
+        inside = np.isfinite(newton) & (newton > lower[active]) & (newton < upper[active])
+        sigma[active] = np.where(converged, s, np.where(inside, newton, bisect))
+
+        active = active[~converged & (upper[active] - lower[active] > IV_TOLERANCE)]
+        if len(active) == 0:
+            break
+
+    result.flat[index] = sigma
+    return result
+
+
+def quote_currency_premium(price, underlying, exchanges):
+    """权利金换算为计价货币；Config.EXCHANGE_PREMIUM_CURRENCY 中为 'coin' 的交易所以币计价，乘以标的价格"""
+    coin = np.array([Config.EXCHANGE_PREMIUM_CURRENCY.get(exchange) == 'coin' for exchange in exchanges], dtype=bool)
+    return np.where(coin, price * underlying, price)
+
+
+def fill_missing_greeks(quotes, as_of):
+    """
+    为一个快照的报价补齐缺失的隐含波动率和Greeks（原地修改）
+
+    - 隐含波动率缺失或不为正时由权利金反解
+    - 交易所未提供的Greeks（None）按隐含波动率计算；交易所提供的值保持不变
+    - 无法求解隐含波动率的合约保持None，不以0代替
+
+    参数:
+    quotes - Quote列表
+    as_of - 快照时间
+
+    返回:
+    补齐了至少一个字段的合约数
+    """
+    if not quotes:
+        return 0
+
+    def column(field):
+        return np.array([np.nan if getattr(q, field) is None else getattr(q, field) for q in quotes], dtype=float)
+
+    F = column('underlying_price')
+    K = column('strike_price')
+    T = year_fraction([q.expiration_date for q in quotes], as_of)
+    is_call = np.array([q.option_type == 'call' for q in quotes], dtype=bool)
+    price = quote_currency_premium(column('option_price'), F, [q.exchange for q in quotes])
+
+    iv = column('implied_volatility')
+    missing_iv = ~(iv > 0)
+    if missing_iv.any():
+        iv[missing_iv] = implied_volatility(price[missing_iv], F[missing_iv], K[missing_iv], T[missing_iv],
+                                            is_call[missing_iv])
+
+    existing = {greek: column(greek) for greek in GREEKS}
+    missing_greeks = np.any([np.isnan(values) for values in existing.values()], axis=0)
+    solvable = missing_greeks & np.isfinite(iv) & (iv > 0)
+    model = black76_greeks(F[solvable], K[solvable], T[solvable], iv[solvable], is_call[solvable])
+
+    solved_iv = missing_iv & np.isfinite(iv)
+    for i in np.flatnonzero(solved_iv):
+        quotes[i].implied_volatility = float(iv[i])
+    for n, i in enumerate(np.flatnonzero(solvable)):
+        for greek in GREEKS:
+            if np.isnan(existing[greek][i]):
+                setattr(quotes[i], greek, float(model[greek][n]))
+    return int(np.count_nonzero(solved_iv | solvable))
+
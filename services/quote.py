@@ -0,0 +1,37 @@
+"""
+期权报价记录
+交易所解析器直接产出带类型的Quote对象，存储和计算直接读取属性，不再经过中间字典
+"""
+from dataclasses import dataclass
+from datetime import date
+from typing import Optional
+
+
+@dataclass(slots=True)
+class Quote:
+    """单个期权合约在某一时刻的报价"""
+    symbol: str
+    exchange: str
+    expiration_date: date
+    strike_price: float
+    option_type: str  # 'call' or 'put'
+    underlying_price: float
+    option_price: float
+    volume: float = 0.0
+    open_interest: float = 0.0
+    implied_volatility: Optional[float] = None
+    delta: Optional[float] = None
+    gamma: Optional[float] = None
+    theta: Optional[float] = None
+    vega: Optional[float] = None
+    instrument_name: Optional[str] = None
+
+
+def to_float(value, default=None):
+    """将交易所返回的数值（可能是字符串或None）转换为float，失败时返回默认值"""
+    if value is None or value == '':
+        return default
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return default
@@ -0,0 +1,173 @@
+"""
+跨进程共享的交易所请求限速器
+令牌桶状态保存在本机SQLite文件（或可选的Redis）中，同一主机上的所有Web worker、
+采集进程和手动刷新请求共用同一个请求预算，不会因各自独立限速而触发交易所的429/封禁
+"""
+import logging
+import sqlite3
+import threading
+import time
+
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+
+class MemoryBucketStore:
+    """进程内令牌桶，共享存储不可用时的降级方案"""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def reserve(self, name, cost, rate, capacity):
+        with self._lock:
+            now = time.time()
+            tokens, updated = self._buckets.get(name, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated) * rate) - cost
+            self._buckets[name] = (tokens, now)
+        return max(0.0, -tokens / rate)
+
+
+class SQLiteBucketStore:
+    """
+    基于SQLite文件的令牌桶，BEGIN IMMEDIATE保证多进程间的读-改-写是原子的
+
+    采用预约方式：令牌可以透支，调用方按透支量计算需要等待的时间，
+    多个等待者按预约顺序依次放行，无需轮询
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._local = threading.local()
+
+    def _connection(self):
+        conn = getattr(self._local, 'conn', None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=10, isolation_level=None)
+            conn.execute('PRAGMA journal_mode=WAL')
+            conn.execute(
+                'CREATE TABLE IF NOT EXISTS token_buckets ('
+                'name TEXT PRIMARY KEY, tokens REAL NOT NULL, updated REAL NOT NULL)'
+            )
+            self._local.conn = conn
+        return conn
+
+    def reserve(self, name, cost, rate, capacity):
+        conn = self._connection()
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            now = time.time()
+            row = conn.execute(
+                'SELECT tokens, updated FROM token_buckets WHERE name = ?', (name,)
+            ).fetchone()
+            tokens, updated = row if row else (capacity, now)
+            tokens = min(capacity, tokens + max(0.0, now - updated) * rate) - cost
+            conn.execute(
+                'INSERT OR REPLACE INTO token_buckets (name, tokens, updated) VALUES (?, ?, ?)',
+                (name, tokens, now)
+            )
+            conn.execute('COMMIT')
+        except Exception:
+            conn.execute('ROLLBACK')
+            raise
+        return max(0.0, -tokens / rate)
+
+
+class RedisBucketStore:
+    """基于Redis的令牌桶，适用于跨主机共享同一出口IP的部署"""
+
+    _SCRIPT = """
+    local now = tonumber(ARGV[1])
+    local cost = tonumber(ARGV[2])
+    local rate = tonumber(ARGV[3])
+    local capacity = tonumber(ARGV[4])
+    local state = redis.call('HMGET', KEYS[1], 'tokens', 'updated')
+    local tokens = tonumber(state[1]) or capacity
+    local updated = tonumber(state[2]) or now
+    tokens = math.min(capacity, tokens + math.max(0, now - updated) * rate) - cost
+    redis.call('HSET', KEYS[1], 'tokens', tokens, 'updated', now)
+    redis.call('EXPIRE', KEYS[1], 3600)
+    return tostring(tokens)
+    """
+
+    def __init__(self, url, prefix='ors:ratelimit:'):
+        import redis  # 可选依赖
+
+        self._client = redis.Redis.from_url(url)
+        self._script = self._client.register_script(self._SCRIPT)
+        self.prefix = prefix
+
+    def reserve(self, name, cost, rate, capacity):
+        # 以Redis服务器时间为准，避免各主机时钟偏差
+        seconds, micros = self._client.time()
+        tokens = float(self._script(keys=[self.prefix + name],
+                                    args=[seconds + micros / 1e6, cost, rate, capacity]))
+        return max(0.0, -tokens / rate)
+
+
+class RateLimiter:
+    """按交易所划分的令牌桶限速器，请求按端点权重（ccxt的cost）消耗令牌"""
+
+    def __init__(self, store, limits=None):
+        self.store = store
+        self.limits = dict(limits or {})
+        self._fallback = MemoryBucketStore()
+
+    def configure(self, bucket, rate, capacity=None):
+        """设置桶的速率（令牌/秒）和容量，已显式配置的桶不会被覆盖"""
+        if bucket not in self.limits:
+            self.limits[bucket] = {'rate': rate, 'capacity': capacity or rate}
+
+    def acquire(self, bucket, cost=1):
+        """
+        获取cost个令牌，不足时阻塞等待
+
+        返回:
+        float - 实际等待的秒数
+        """
+        limit = self.limits.get(bucket)
+        if not limit:
+            return 0.0
+
+        rate = limit['rate'] * Config.RATE_LIMIT_UTILIZATION
+        capacity = limit.get('capacity') or limit['rate']
+        try:
+            wait = self.store.reserve(bucket, cost, rate, capacity)
+        except Exception as e:
+            logger.warning(f"共享限速器不可用，改用进程内限速: {str(e)}")
+            wait = self._fallback.reserve(bucket, cost, rate, capacity)
+
+        if wait > 0:
+            logger.debug(f"{bucket} 请求预算不足，等待 {wait:.3f} 秒")
+            time.sleep(wait)
+        return wait
+
+
+def install_rate_limiter(exchange, exchange_id):
+    """
+    用共享限速器替换ccxt实例自带的进程内限速
+
+    ccxt在每个请求前调用 exchange.throttle(cost)，cost为该端点在交易所API定义中的权重；
+    未显式配置速率时按ccxt的rateLimit（每单位权重的最小间隔毫秒数）推算
+    """
+    rate_limiter.configure(exchange_id, 1000.0 / exchange.rateLimit)
+    exchange.enableRateLimit = True
+
+    def throttle(cost=None):
+        rate_limiter.acquire(exchange_id, 1 if cost is None else cost)
+
+    exchange.throttle = throttle
+    return exchange
+
+
+def _create_store():
+    if Config.RATE_LIMIT_REDIS_URL:
+        try:
+            return RedisBucketStore(Config.RATE_LIMIT_REDIS_URL)
+        except Exception as e:
+            logger.warning(f"无法连接Redis限速存储，改用本机SQLite: {str(e)}")
+    return SQLiteBucketStore(Config.RATE_LIMIT_DB_PATH)
+
+
+rate_limiter = RateLimiter(_create_store(), Config.EXCHANGE_RATE_LIMITS)
@@ -0,0 +1,122 @@
+"""
+手动数据刷新任务
+/api/data/refresh 只负责排队并立即返回任务ID，采集和计算在后台线程中执行；
+同一品种已有进行中的任务时，新的刷新请求合并到该任务，不会并行重复采集；
+多个进程同时提交时由数据库的部分唯一索引保证只有一个任务
+"""
+import logging
+import threading
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from sqlalchemy.exc import IntegrityError
+
+from app import app, db
+from models import RefreshJob
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class RefreshJobManager:
+    """后台刷新任务管理"""
+
+    def __init__(self, max_workers=2):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='refresh-job')
+        self._lock = threading.Lock()
+
+    def submit(self, symbol):
+        """
+        提交刷新任务
+
+        返回:
+        (RefreshJob, created) - created为False表示合并到了已有的进行中任务
+        """
+        with self._lock:
+            # 超时未结束的任务（如进程重启）标记为失败，不再占用该品种的进行中名额
+            stale_before = datetime.utcnow() - timedelta(minutes=Config.REFRESH_JOB_STALE_MINUTES)
+            RefreshJob.query.filter(
+                RefreshJob.symbol == symbol,
+                RefreshJob.status.in_(ACTIVE_STATUSES),
+                RefreshJob.created_at < stale_before
+            ).update({'status': 'failed', 'finished_at': datetime.utcnow(), 'error': 'stale'},
+                     synchronize_session=False)
+            db.session.commit()
+
+            active = self._active_job(symbol)
+            if active:
+                logger.info(f"{symbol} 已有进行中的刷新任务 {active.id}，合并请求")
+                return active, False
+
+            # 部分唯一索引保证每个品种只有一个进行中的任务；其他进程抢先插入时合并到该任务
+            job = RefreshJob(id=str(uuid.uuid4()), symbol=symbol, status='queued')
+            db.session.add(job)
+            try:
+                db.session.commit()
+            except IntegrityError:
+                db.session.rollback()
+                active = self._active_job(symbol)
+                if active is None:
+                    raise
+                logger.info(f"{symbol} 其他进程已提交刷新任务 {active.id}，合并请求")
+                return active, False
+
+        self._executor.submit(self._run, job.id, symbol)
+        logger.info(f"已提交 {symbol} 刷新任务 {job.id}")
+        return job, True
+
+    def _active_job(self, symbol):
+        return RefreshJob.query.filter(
+            RefreshJob.symbol == symbol,
+            RefreshJob.status.in_(ACTIVE_STATUSES)
+        ).order_by(RefreshJob.created_at.desc()).first()
+
+    def get(self, job_id):
+        return db.session.get(RefreshJob, job_id)
+
+    def _run(self, job_id, symbol):
+        from services.data_service import fetch_latest_option_data
+        from services.risk_calculator import calculate_risk_indicators
+        from services.gex_service import update_gamma_profile
+
+        with app.app_context():
+            self._update(job_id, status='running', started_at=datetime.utcnow())
+            try:
+                snapshot_time = fetch_latest_option_data(symbol)
+                if not snapshot_time:
+                    self._update(job_id, status='failed', finished_at=datetime.utcnow(),
+                                 error='Error fetching option data')
+                    return
+
+                calculate_risk_indicators(symbol, snapshot_time=snapshot_time)
+                
+                # Gamma敞口是附加指标，失败不影响刷新任务的结果
+                try:
+                    update_gamma_profile(symbol, snapshot_time)
+                except Exception as e:
+                    db.session.rollback()
+                    logger.error(f"计算{symbol}@{snapshot_time} Gamma敞口失败: {str(e)}")
+                
+                self._update(job_id, status='succeeded', finished_at=datetime.utcnow(),
+                             snapshot_time=snapshot_time)
+                logger.info(f"{symbol} 刷新任务 {job_id} 完成")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"{symbol} 刷新任务 {job_id} 失败: {str(e)}")
+                self._update(job_id, status='failed', finished_at=datetime.utcnow(), error=str(e))
+            finally:
+                db.session.remove()
+
+    def _update(self, job_id, **fields):
+        try:
+            RefreshJob.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"更新刷新任务 {job_id} 状态失败: {str(e)}")
+
+
+refresh_job_manager = RefreshJobManager(Config.REFRESH_JOB_WORKERS)
@@ -0,0 +1,494 @@
+"""
+历史回放/回测引擎
+将历史快照（数据库或Parquet归档）按时间顺序送入与实时计算相同的风险指标、阈值警报和偏离异常判定逻辑，
+输出"本应触发"的警报，不写入任何实时表；按 (品种, 日期) 分片在多个进程中并行执行
+
+与实时流程的差异:
+- 阈值警报的去重以"指标回落到关注级以下"视为警报已确认，实时流程依赖人工确认
+- 偏离异常每个快照只评估一次，上一窗口取该窗口内最后一个快照
+
+用法:
+    python -m services.replay_engine --start 2025-01-01 --end 2025-01-08 --symbol BTC --source auto
+"""
+import argparse
+import bisect
+import json
+import logging
+import os
+from collections import Counter, namedtuple
+from concurrent.futures import ProcessPoolExecutor, as_completed
+from datetime import datetime, date, timedelta, time as dt_time
+
+from app import app, db
+from models import OptionData, OptionSnapshot, AlertThreshold
+from config import Config
+from services.archive_service import ARCHIVE_COLUMNS, read_archive_table, hot_window_start
+from services.indicators import (
+    ALERT_INDICATORS, options_to_frame, compute_risk_indicators, evaluate_threshold, check_deviation_anomaly
+)
+
+logger = logging.getLogger(__name__)
+
+# 轻量的只读期权记录，字段与归档列一致，可直接传给 options_to_frame
+ReplayRow = namedtuple('ReplayRow', ARCHIVE_COLUMNS)
+
+# 与 generate_deviation_alert 相同：同一合约同一级别的偏离警报10分钟内不重复
+DEVIATION_DEDUP_MINUTES = 10
+
+SOURCES = ('db', 'parquet', 'auto')
+
+
+def _row_key(row):
+    if row.instrument_id is not None:
+        return row.instrument_id
+    return (row.exchange, row.option_type, row.strike_price, row.expiration_date)
+
+
+def _stream_snapshots(rows, start, snapshot_meta):
+    """
+    将按时间排序的期权记录流转换为完整期权链快照流
+
+    参数:
+    rows - 按timestamp升序的ReplayRow迭代器
+    start - 只输出该时间之后的快照，之前的记录只用于建立合约状态
+    snapshot_meta - {快照时间: [(交易所, 标的价格, 合约ID集合)]}，来自OptionSnapshot；
+                    没有记录的快照（旧数据或归档数据）使用关键帧间隔内出现过且未到期的合约
+
+    生成:
+    (快照时间, ReplayRow列表)
+    """
+    state = {}
+    underlying = {}
+    stale_after = timedelta(minutes=Config.OPTION_KEYFRAME_MINUTES)
+
+    def meta_chain(ts):
+        chain = []
+        for exchange, underlying_price, instrument_ids in snapshot_meta[ts]:
+            for instrument_id in instrument_ids:
+                row = state.get(instrument_id)
+                if row is not None:
+                    chain.append(row._replace(timestamp=ts, underlying_price=underlying_price))
+            # 合约维度表上线前写入的记录没有合约ID
+            chain.extend(row for key, row in state.items()
+                         if not isinstance(key, int) and row.exchange == exchange and row.timestamp == ts)
+        return chain
+
+    def state_chain(ts):
+        cutoff = ts - stale_after
+        today = ts.date()
+        for key in [key for key, row in state.items() if row.timestamp < cutoff or row.expiration_date < today]:
+            del state[key]
+        return [row if row.timestamp == ts else row._replace(timestamp=ts, underlying_price=underlying[row.exchange])
+                for row in state.values()]
+
+    pending = sorted(ts for ts in snapshot_meta if ts >= start)
+    position = 0
+    current = None
+
+    for row in rows:
+        if row.timestamp != current:
+            if current is not None and current >= start and current not in snapshot_meta:
+                yield current, state_chain(current)
+            # 只有快照记录、没有新写入行的快照（delta模式下所有合约都未变化）
+            while position < len(pending) and pending[position] < row.timestamp:
+                yield pending[position], meta_chain(pending[position])
+                position += 1
+            current = row.timestamp
+        state[_row_key(row)] = row
+        underlying[row.exchange] = row.underlying_price
+
+    if current is not None and current >= start and current not in snapshot_meta:
+        yield current, state_chain(current)
+    for ts in pending[position:]:
+        yield ts, meta_chain(ts)
+
+
+def iter_db_snapshots(symbol, start, end):
+    """从数据库按时间顺序读取 [start, end) 内的快照，只读"""
+    snapshot_meta = {}
+    rows_start = start
+    snapshots = OptionSnapshot.query.filter(
+        OptionSnapshot.symbol == symbol,
+        OptionSnapshot.snapshot_time >= start,
+        OptionSnapshot.snapshot_time < end
+    ).all()
+    for snapshot in snapshots:
+        snapshot_meta.setdefault(snapshot.snapshot_time, []).append(
+            (snapshot.exchange, snapshot.underlying_price, set(json.loads(snapshot.instrument_ids)))
+        )
+        # delta模式下需要从关键帧开始重建
+        rows_start = min(rows_start, snapshot.keyframe_time)
+
+    columns = [getattr(OptionData, name) for name in ARCHIVE_COLUMNS]
+    query = db.session.query(*columns).filter(
+        OptionData.symbol == symbol,
+        OptionData.timestamp >= rows_start,
+        OptionData.timestamp < end
+    ).order_by(OptionData.timestamp).execution_options(yield_per=10000)
+
+    yield from _stream_snapshots((ReplayRow(*row) for row in query), start, snapshot_meta)
+
+
+def iter_archive_snapshots(symbol, start, end):
+    """从Parquet归档按时间顺序读取 [start, end) 内的快照"""
+    load_start = start - timedelta(minutes=Config.OPTION_KEYFRAME_MINUTES)
+    table = read_archive_table(symbol, load_start, end)
+    if table is None or table.num_rows == 0:
+        return
+
+    table = table.sort_by('timestamp')
+    columns = [table.column(name).to_pylist() for name in ARCHIVE_COLUMNS]
+    yield from _stream_snapshots((ReplayRow(*values) for values in zip(*columns)), start, {})
+
+
+def iter_snapshots(symbol, start, end, source):
+    """按数据源读取快照，source为'db'或'parquet'"""
+    if source == 'parquet':
+        return iter_archive_snapshots(symbol, start, end)
+    return iter_db_snapshots(symbol, start, end)
+
+
+def load_thresholds(time_periods):
+    """
+    回放使用的阈值：数据库中的设置优先，其余使用配置默认值；已禁用的阈值不参与回放
+
+    返回:
+    {(指标, 时间周期): (关注, 警告, 严重)}
+    """
+    thresholds = {}
+    for indicator, periods in Config.DEFAULT_ALERT_THRESHOLDS.items():
+        for period in time_periods:
+            levels = periods.get(period, periods.get('4h'))
+            thresholds[(indicator, period)] = (levels['attention'], levels['warning'], levels['severe'])
+
+    for threshold in AlertThreshold.query.filter(AlertThreshold.time_period.in_(time_periods)).all():
+        key = (threshold.indicator, threshold.time_period)
+        if not threshold.is_enabled:
+            thresholds.pop(key, None)
+        else:
+            thresholds[key] = (threshold.attention_threshold, threshold.warning_threshold,
+                               threshold.severe_threshold)
+    return thresholds
+
+
+class ShardReplay:
+    """单个分片的回放状态，按时间顺序接收快照"""
+
+    def __init__(self, symbol, thresholds, time_periods, deviation_periods):
+        self.symbol = symbol
+        self.thresholds = thresholds
+        self.time_periods = time_periods
+        self.deviation_windows = {period: timedelta(minutes=Config.TIME_PERIODS[period]['minutes'])
+                                  for period in deviation_periods}
+        self.history_span = 2 * max(self.deviation_windows.values(), default=timedelta(0))
+
+        self.alerts = []
+        self.snapshots = 0
+        # (指标, 时间周期) -> 指标回落前已经触发过的级别
+        self._fired_levels = {}
+        # (时间周期, 交易所, 执行价, 类型, 级别) -> 上次触发时间
+        self._deviation_fired = {}
+        # 偏离计算使用的历史快照: {合约键: (成交量, 权利金, 标的价格)}
+        self._history_times = []
+        self._history_chains = []
+
+    def warm_up(self, snapshot_time, chain):
+        """分片开始前的快照，只用于建立偏离计算的历史窗口"""
+        self._remember(snapshot_time, chain)
+
+    def seed_thresholds(self, chain):
+        """用分片开始前的最后一个快照初始化阈值警报状态，避免分片边界重复报警"""
+        values = compute_risk_indicators(self.symbol, options_to_frame(chain))
+        self._check_thresholds(None, values, emit=False)
+
+    def process(self, snapshot_time, chain):
+        self.snapshots += 1
+        values = compute_risk_indicators(self.symbol, options_to_frame(chain))
+        self._check_thresholds(snapshot_time, values)
+        self._check_deviations(snapshot_time, chain)
+        self._remember(snapshot_time, chain)
+
+    def _check_thresholds(self, snapshot_time, values, emit=True):
+        for period in self.time_periods:
+            for indicator in ALERT_INDICATORS:
+                levels = self.thresholds.get((indicator, period))
+                value = values.get(indicator)
+                if levels is None or value is None:
+                    continue
+
+                alert_type, threshold_value = evaluate_threshold(value, *levels)
+                fired = self._fired_levels.setdefault((indicator, period), set())
+                if alert_type is None:
+                    fired.clear()
+                    continue
+                if alert_type in fired:
+                    continue
+
+                fired.add(alert_type)
+                if emit:
+                    self.alerts.append({
+                        'kind': 'indicator',
+                        'symbol': self.symbol,
+                        'timestamp': snapshot_time.isoformat(),
+                        'time_period': period,
+                        'indicator': indicator,
+                        'alert_type': alert_type,
+                        'value': value,
+                        'threshold': threshold_value
+                    })
+
+    def _remember(self, snapshot_time, chain):
+        if not self.deviation_windows:
+            return
+        self._history_times.append(snapshot_time)
+        self._history_chains.append({_row_key(row): (row.volume, row.option_price, row.underlying_price)
+                                     for row in chain})
+
+        expired = bisect.bisect_left(self._history_times, snapshot_time - self.history_span)
+        if expired > 256:
+            del self._history_times[:expired]
+            del self._history_chains[:expired]
+
+    def _previous_chain(self, snapshot_time, window):
+        """上一个时间窗口 [T-2w, T-w) 内的最后一个快照"""
+        index = bisect.bisect_left(self._history_times, snapshot_time - window) - 1
+        if index < 0 or self._history_times[index] < snapshot_time - 2 * window:
+            return None
+        return self._history_chains[index]
+
+    def _check_deviations(self, snapshot_time, chain):
+        dedup_window = timedelta(minutes=DEVIATION_DEDUP_MINUTES)
+
+        for period, window in self.deviation_windows.items():
+            previous_chain = self._previous_chain(snapshot_time, window)
+
+            for option in chain:
+                if not option.volume or not option.underlying_price:
+                    continue
+                market_price = option.underlying_price
+                deviation_percent = abs((option.strike_price - market_price) / market_price * 100)
+                if deviation_percent > Config.OPTION_STRIKE_RANGE_PCT:
+                    continue
+
+                volume_change = premium_change = price_change = None
+                previous = previous_chain.get(_row_key(option)) if previous_chain else None
+                if previous:
+                    prev_volume, prev_price, prev_underlying = previous
+                    if prev_volume and prev_volume > 0:
+                        volume_change = (option.volume - prev_volume) / prev_volume * 100
+                    else:
+                        volume_change = 100.0
+                    if prev_price and prev_price > 0:
+                        premium_change = (option.option_price - prev_price) / prev_price * 100
+                    if prev_underlying and prev_underlying > 0:
+                        price_change = (market_price - prev_underlying) / prev_underlying * 100
+
+                is_anomaly, anomaly_level = check_deviation_anomaly(
+                    volume_change, premium_change, price_change,
+                    option.option_type, option.strike_price, market_price
+                )
+                if not is_anomaly:
+                    continue
+
+                key = (period, option.exchange, option.strike_price, option.option_type, anomaly_level)
+                last_fired = self._deviation_fired.get(key)
+                if last_fired is not None and snapshot_time - last_fired < dedup_window:
+                    continue
+                self._deviation_fired[key] = snapshot_time
+
+                self.alerts.append({
+                    'kind': 'deviation',
+                    'symbol': self.symbol,
+                    'timestamp': snapshot_time.isoformat(),
+                    'time_period': period,
+                    'exchange': option.exchange,
+                    'strike_price': option.strike_price,
+                    'option_type': option.option_type,
+                    'expiration_date': option.expiration_date.isoformat() if option.expiration_date else None,
+                    'alert_type': anomaly_level,
+                    'deviation_percent': deviation_percent,
+                    'volume_change': volume_change,
+                    'premium_change': premium_change,
+                    'price_change': price_change
+                })
+
+
+def replay_shard(symbol, day, source, thresholds, time_periods, deviation_periods):
+    """
+    回放一个品种一天的快照（在工作进程中执行）
+
+    返回:
+    dict - symbol, date, source, snapshots, alerts
+    """
+    day_start = datetime.combine(day, dt_time.min)
+    day_end = day_start + timedelta(days=1)
+    replay = ShardReplay(symbol, thresholds, time_periods, deviation_periods)
+    load_start = day_start - replay.history_span
+
+    with app.app_context():
+        try:
+            snapshots = iter_snapshots(symbol, load_start, day_end, source)
+            last_warmup_chain = None
+            for snapshot_time, chain in snapshots:
+                if not chain:
+                    continue
+                if snapshot_time < day_start:
+                    replay.warm_up(snapshot_time, chain)
+                    last_warmup_chain = chain
+                    continue
+                if last_warmup_chain is not None:
+                    replay.seed_thresholds(last_warmup_chain)
+                    last_warmup_chain = None
+                replay.process(snapshot_time, chain)
+        finally:
+            db.session.remove()
+
+    logger.info(f"回放 {symbol} {day} ({source}): {replay.snapshots} 个快照，{len(replay.alerts)} 条警报")
+    return {
+        'symbol': symbol,
+        'date': day.isoformat(),
+        'source': source,
+        'snapshots': replay.snapshots,
+        'alerts': replay.alerts
+    }
+
+
+def indicator_series_shard(symbol, day, source):
+    """
+    计算一个品种一天内每个快照的风险指标序列（在工作进程中执行），供阈值扫描等离线分析使用
+
+    返回:
+    dict - timestamps, underlying（快照的平均标的价格）, 以及ALERT_INDICATORS中每个指标的取值列表
+    """
+    day_start = datetime.combine(day, dt_time.min)
+    series = {'timestamps': [], 'underlying': []}
+    series.update({indicator: [] for indicator in ALERT_INDICATORS})
+
+    with app.app_context():
+        try:
+            for snapshot_time, chain in iter_snapshots(symbol, day_start, day_start + timedelta(days=1), source):
+                if not chain:
+                    continue
+                values = compute_risk_indicators(symbol, options_to_frame(chain))
+                series['timestamps'].append(snapshot_time)
+                series['underlying'].append(sum(row.underlying_price for row in chain) / len(chain))
+                for indicator in ALERT_INDICATORS:
+                    series[indicator].append(values[indicator])
+        finally:
+            db.session.remove()
+    return series
+
+
+def init_worker():
+    # 工作进程不能复用父进程连接池中的连接
+    with app.app_context():
+        db.engine.dispose(close=False)
+
+
+def resolve_source(source, day):
+    if source != 'auto':
+        return source
+    return 'parquet' if day < hot_window_start().date() else 'db'
+
+
+def run_replay(symbols, start, end, source='auto', time_periods=None, deviation_periods=None, workers=None):
+    """
+    回放 [start, end) 日期范围内的历史快照
+
+    参数:
+    symbols - 品种列表
+    start, end - 起止日期（date，不含end）
+    source - 'db'、'parquet'，或'auto'（热数据窗口内读数据库，更早的读归档）
+    time_periods - 阈值警报的时间周期，默认全部
+    deviation_periods - 偏离异常的时间周期，默认Config.REPLAY_DEVIATION_PERIODS
+    workers - 进程数，默认Config.REPLAY_WORKERS
+
+    返回:
+    dict - shards（每个分片的快照数和警报数）, snapshots, alerts（按时间排序）, summary
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown replay source: {source}")
+    time_periods = list(time_periods or Config.TIME_PERIODS.keys())
+    deviation_periods = list(Config.REPLAY_DEVIATION_PERIODS if deviation_periods is None else deviation_periods)
+
+    with app.app_context():
+        thresholds = load_thresholds(time_periods)
+        shards = []
+        day = start
+        while day < end:
+            for symbol in symbols:
+                shards.append((symbol, day, resolve_source(source, day)))
+            day += timedelta(days=1)
+        db.session.remove()
+
+    results = []
+    with ProcessPoolExecutor(max_workers=workers or Config.REPLAY_WORKERS, initializer=init_worker) as executor:
+        futures = {
+            executor.submit(replay_shard, symbol, day, shard_source, thresholds, time_periods, deviation_periods):
+                (symbol, day)
+            for symbol, day, shard_source in shards
+        }
+        for future in as_completed(futures):
+            symbol, day = futures[future]
+            try:
+                results.append(future.result())
+            except Exception as e:
+                logger.error(f"回放 {symbol} {day} 失败: {str(e)}")
+                results.append({'symbol': symbol, 'date': day.isoformat(), 'error': str(e),
+                                 'snapshots': 0, 'alerts': []})
+
+    results.sort(key=lambda r: (r['date'], r['symbol']))
+    alerts = sorted((alert for result in results for alert in result['alerts']),
+                    key=lambda a: (a['timestamp'], a['symbol']))
+    summary = Counter(f"{alert['kind']}:{alert['alert_type']}" for alert in alerts)
+
+    return {
+        'shards': [{key: value for key, value in result.items() if key != 'alerts'} | {'alerts': len(result['alerts'])}
+                   for result in results],
+        'snapshots': sum(result['snapshots'] for result in results),
+        'alerts': alerts,
+        'summary': dict(summary)
+    }
+
+
+def _parse_date(value):
+    return date.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Replay historical option snapshots through the risk and alert logic')
+    parser.add_argument('--start', type=_parse_date, required=True, help='start date (YYYY-MM-DD, UTC)')
+    parser.add_argument('--end', type=_parse_date, help='end date, exclusive (default: start + 1 day)')
+    parser.add_argument('--symbol', action='append', dest='symbols', help='symbol to replay, repeatable')
+    parser.add_argument('--source', choices=SOURCES, default='auto')
+    parser.add_argument('--periods', nargs='+', choices=list(Config.TIME_PERIODS), help='threshold time periods')
+    parser.add_argument('--deviation-periods', nargs='*', choices=list(Config.TIME_PERIODS))
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--output', help='write the full report as JSON to this file')
+    args = parser.parse_args(argv)
+
+    report = run_replay(
+        args.symbols or Config.TRACKED_SYMBOLS,
+        args.start,
+        args.end or args.start + timedelta(days=1),
+        source=args.source,
+        time_periods=args.periods,
+        deviation_periods=args.deviation_periods,
+        workers=args.workers
+    )
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, ensure_ascii=False, indent=2)
+
+    for shard in report['shards']:
+        print(f"{shard['date']} {shard['symbol']}: {shard['snapshots']} snapshots, {shard['alerts']} alerts"
+              f"{' (' + shard['error'] + ')' if shard.get('error') else ''}")
+    print(f"Total: {report['snapshots']} snapshots, {len(report['alerts'])} alerts")
+    for name, count in sorted(report['summary'].items()):
+        print(f"  {name}: {count}")
+
+
+if __name__ == '__main__':
+    main()
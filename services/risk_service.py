@@ -1,15 +1,18 @@
 import logging
 import numpy as np
-import pandas as pd
-import random
 from datetime import datetime, timedelta
 from typing import List, Dict, Any, Optional
-from sqlalchemy import func
 
 from app import db
-from models import OptionData, RiskIndicator, ScenarioAnalysis
+from models import RiskIndicator, ScenarioAnalysis
 from services.alert_service import check_alert_thresholds
 from config import Config
+from services.event_hub import publish_event
+from services.option_store import load_option_chain, get_latest_snapshot_time
+from services.scenario_engine import evaluate_scenario, evaluate_scenario_grid
+from services.portfolio_service import portfolio_chain
+from services.scenario_cache import scenario_cache
+from services.indicators import options_to_frame, compute_risk_indicators
 from services.exchange_api_ccxt import get_underlying_price
 
 logger = logging.getLogger(__name__)
@@ -21,19 +24,20 @@ class RiskService:
         """初始化风险服务"""
         logger.info("RiskService initialized")
         
-    def calculate_risk_indicators(self, symbol, time_periods=None):
+    def calculate_risk_indicators(self, symbol, time_periods=None, snapshot_time=None):
         """
         计算风险指标
         
         Args:
             symbol: 交易对符号 (BTC或ETH)
             time_periods: 时间周期列表, 如果为None则使用所有配置的时间周期
+            snapshot_time: 快照时间戳, 如果为None则使用最新快照
             
         Returns:
             成功返回True, 失败返回False
         """
         logger.info(f"计算 {symbol} 的风险指标 (时间周期: {time_periods})")
-        return calculate_risk_indicators(symbol, time_periods)
+        return calculate_risk_indicators(symbol, time_periods, snapshot_time)
         
     def get_historical_risk_indicators(self, symbol, time_period='1h', days=30):
         """
@@ -79,7 +83,8 @@ class RiskService:
             return self._risk_indicator_to_dict(indicator)
         return None
         
-    def run_scenario_analysis(self, name, symbol, price_change, volatility_change, time_horizon, description=''):
+    def run_scenario_analysis(self, name, symbol, price_change, volatility_change, time_horizon, description='',
+                              engine_mode=None, portfolio_id=None):
         """
         运行情景分析
         
@@ -90,12 +95,38 @@ class RiskService:
             volatility_change: 波动率变化百分比
             time_horizon: 时间范围(天)
             description: 描述
+            engine_mode: 'full' 全量重定价或 'linear' delta-gamma近似, 为None时使用配置的默认值
+            portfolio_id: 按该组合的持仓计算, 为None时按每个合约各持有1份计算
             
         Returns:
             创建的情景分析对象，如果失败则返回None
         """
         logger.info(f"运行情景分析: {name} (符号: {symbol}, 价格变化: {price_change}%)")
-        return run_scenario_analysis(name, symbol, price_change, volatility_change, time_horizon, description)
+        return run_scenario_analysis(name, symbol, price_change, volatility_change, time_horizon, description,
+                                     engine_mode, portfolio_id)
+    
+    def run_scenario_grid(self, symbol, price_changes, volatility_changes, time_horizons, engine_mode=None,
+                          save_summary=False, name=None, description='', portfolio_id=None):
+        """
+        批量计算情景网格
+        
+        Args:
+            symbol: 交易对符号
+            price_changes: 价格变化百分比列表
+            volatility_changes: 波动率变化列表
+            time_horizons: 时间范围(天)列表
+            engine_mode: 'full' 或 'linear'
+            save_summary: 是否将最差情景保存为一条情景分析记录
+            name: 保存时使用的名称
+            description: 保存时使用的描述
+            portfolio_id: 按该组合的持仓计算
+            
+        Returns:
+            网格结果字典，没有数据时返回None
+        """
+        logger.info(f"运行情景网格: {symbol} ({len(price_changes)}x{len(volatility_changes)}x{len(time_horizons)})")
+        return run_scenario_grid(symbol, price_changes, volatility_changes, time_horizons, engine_mode,
+                                 save_summary, name, description, portfolio_id)
         
     def _risk_indicator_to_dict(self, indicator):
         """将RiskIndicator对象转换为字典"""
@@ -117,7 +148,7 @@ class RiskService:
             'current_price': price
         }
 
-def calculate_risk_indicators(symbol, time_periods=None):
+def calculate_risk_indicators(symbol, time_periods=None, snapshot_time=None):
     """
     计算各种风险指标，基于期权市场数据
     实现反身性理论来识别市场反馈循环
@@ -125,6 +156,7 @@ def calculate_risk_indicators(symbol, time_periods=None):
     参数:
     symbol - 要计算的交易对符号
     time_periods - 要计算的时间周期列表，如果为None则计算所有配置的时间周期
+    snapshot_time - 要计算的快照时间戳，如果为None则使用最新快照
     """
     try:
         if time_periods is None:
@@ -133,72 +165,42 @@ def calculate_risk_indicators(symbol, time_periods=None):
         
         logger.info(f"Calculating risk indicators for {symbol}")
         
-        # 获取最新的数据时间戳
-        latest_time = db.session.query(func.max(OptionData.timestamp)).filter(
-            OptionData.symbol == symbol
-        ).scalar()
+        # 获取指定快照或最新的数据时间戳
+        latest_time = snapshot_time or get_latest_snapshot_time(symbol)
         
         if not latest_time:
             logger.warning(f"No option data found for {symbol}")
             return False
         
-        # Get data from this timestamp
-        options = OptionData.query.filter(
-            OptionData.symbol == symbol,
-            OptionData.timestamp == latest_time
-        ).all()
+        # Get the full option chain at this timestamp
+        options = load_option_chain(symbol, latest_time)
         
         if not options:
             logger.warning(f"No option data found for {symbol} at {latest_time}")
             return False
         
         # Convert to pandas DataFrame for easier calculations
-        df = pd.DataFrame([{
-            'strike': opt.strike_price,
-            'option_type': opt.option_type,
-            'price': opt.option_price,
-            'iv': opt.implied_volatility,
-            'delta': opt.delta,
-            'gamma': opt.gamma,
-            'vega': opt.vega,
-            'theta': opt.theta,
-            'volume': opt.volume,
-            'open_interest': opt.open_interest,
-            'underlying': opt.underlying_price
-        } for opt in options])
-        
-        # 计算关键风险指标
-        volaxivity = calculate_volaxivity(df)
-        volatility_skew = calculate_volatility_skew(df)
-        put_call_ratio = calculate_put_call_ratio(df)
-        reflexivity = calculate_reflexivity_indicator(df)
-        market_sentiment = determine_market_sentiment(volaxivity, put_call_ratio, reflexivity)
-        
-        # 计算加密货币特有的风险指标（如适用）
-        crypto_risk = None
-        if symbol in ['BTC', 'ETH']:
-            crypto_risk = get_crypto_specific_risk(symbol, df)
+        df = options_to_frame(options)
+        
+        # 计算关键风险指标（与历史回放共用 services.indicators.compute_risk_indicators）
+        indicators = compute_risk_indicators(symbol, df)
         
         # 为每个时间周期创建风险指标记录
         success = False
         for period in time_periods:
-            # 创建风险指标记录 - 将numpy类型转换为Python原生类型
             current_indicator = RiskIndicator(
                 symbol=str(symbol),
                 time_period=period,  # 设置时间周期
                 timestamp=latest_time,
-                volaxivity=float(volaxivity),
-                volatility_skew=float(volatility_skew),
-                put_call_ratio=float(put_call_ratio),
-                market_sentiment=str(market_sentiment),
-                reflexivity_indicator=float(reflexivity)
+                volaxivity=indicators['volaxivity'],
+                volatility_skew=indicators['volatility_skew'],
+                put_call_ratio=indicators['put_call_ratio'],
+                market_sentiment=indicators['market_sentiment'],
+                reflexivity_indicator=indicators['reflexivity_indicator'],
+                funding_rate=indicators['funding_rate'],
+                liquidation_risk=indicators['liquidation_risk']
             )
             
-            # 添加加密货币特有指标（如适用）
-            if crypto_risk:
-                current_indicator.funding_rate = float(crypto_risk['funding_rate'])
-                current_indicator.liquidation_risk = float(crypto_risk['liquidation_risk'])
-            
             # 添加到数据库并检查阈值
             db.session.add(current_indicator)
             db.session.commit()
@@ -207,10 +209,22 @@ def calculate_risk_indicators(symbol, time_periods=None):
             check_alert_thresholds(current_indicator)
             success = True
         
-        if crypto_risk:
-            logger.info(f"Added crypto-specific indicators for {symbol}: Funding Rate={crypto_risk['funding_rate']:.4f}, Liquidation Risk={crypto_risk['liquidation_risk']:.2f}")
-        
-        logger.info(f"Calculated risk indicators for {symbol}: Volaxivity={volaxivity:.2f}, Skew={volatility_skew:.2f}, PCR={put_call_ratio:.2f}, Reflexivity={reflexivity:.2f}")
+        # 推送新风险指标事件
+        publish_event('indicators', {
+            'symbol': symbol,
+            'timestamp': latest_time.isoformat(),
+            'time_periods': list(time_periods),
+            'volaxivity': indicators['volaxivity'],
+            'volatility_skew': indicators['volatility_skew'],
+            'put_call_ratio': indicators['put_call_ratio'],
+            'reflexivity_indicator': indicators['reflexivity_indicator'],
+            'market_sentiment': indicators['market_sentiment']
+        })
+        
+        if indicators['funding_rate'] is not None:
+            logger.info(f"Added crypto-specific indicators for {symbol}: Funding Rate={indicators['funding_rate']:.4f}, Liquidation Risk={indicators['liquidation_risk']:.2f}")
+        
+        logger.info(f"Calculated risk indicators for {symbol}: Volaxivity={indicators['volaxivity']:.2f}, Skew={indicators['volatility_skew']:.2f}, PCR={indicators['put_call_ratio']:.2f}, Reflexivity={indicators['reflexivity_indicator']:.2f}")
         return success
         
     except Exception as e:
@@ -218,240 +232,49 @@ def calculate_risk_indicators(symbol, time_periods=None):
         db.session.rollback()
         return False
 
-def calculate_volaxivity(df):
-    """
-    Calculate the Volaxivity indicator (custom volatility index)
-    Higher values indicate higher market risk
-    """
-    # Get ATM options (closest to current price)
-    underlying_price = df['underlying'].iloc[0]
-    
-    # Filter to near-the-money options
-    atm_options = df[abs(df['strike'] - underlying_price) / underlying_price < 0.05]
-    
-    if atm_options.empty:
-        # If no options are near ATM, use all options
-        atm_options = df
-    
-    # Calculate weighted average IV using volume as weight
-    if 'volume' in atm_options and atm_options['volume'].sum() > 0:
-        weighted_iv = (atm_options['iv'] * atm_options['volume']).sum() / atm_options['volume'].sum()
-    else:
-        weighted_iv = atm_options['iv'].mean()
-    
-    # Calculate IV change rate compared to historical average (simulated)
-    historical_iv_avg = 0.20  # This would normally be retrieved from historical data
-    iv_change_rate = weighted_iv / historical_iv_avg - 1
-    
-    # Calculate option activity indicator (volume relative to open interest)
-    if atm_options['open_interest'].sum() > 0:
-        activity_ratio = atm_options['volume'].sum() / atm_options['open_interest'].sum()
-    else:
-        activity_ratio = 0
-    
-    # Calculate Volaxivity
-    volaxivity = (weighted_iv * 100) * (1 + iv_change_rate) * (1 + min(activity_ratio, 1))
-    
-    return volaxivity
-
-def calculate_volatility_skew(df):
-    """
-    Calculate volatility skew (difference between OTM put and call implied volatility)
-    Higher values indicate more fear in the market
-    """
-    # Get the underlying price
-    underlying_price = df['underlying'].iloc[0]
-    
-    # Find OTM puts (strike < price)
-    otm_puts = df[(df['option_type'] == 'put') & (df['strike'] < underlying_price)]
-    
-    # Find OTM calls (strike > price)
-    otm_calls = df[(df['option_type'] == 'call') & (df['strike'] > underlying_price)]
-    
-    if otm_puts.empty or otm_calls.empty:
-        return 0
-    
-    # Calculate average IV for OTM puts and calls
-    avg_put_iv = otm_puts['iv'].mean()
-    avg_call_iv = otm_calls['iv'].mean()
-    
-    # Calculate skew (put IV - call IV)
-    skew = avg_put_iv - avg_call_iv
-    
-    return skew
-
-def calculate_put_call_ratio(df):
-    """
-    Calculate put-call ratio based on volume or open interest
-    High values indicate bearish sentiment
-    """
-    # Get total put and call volume
-    put_volume = df[df['option_type'] == 'put']['volume'].sum()
-    call_volume = df[df['option_type'] == 'call']['volume'].sum()
-    
-    # Calculate put-call ratio
-    if call_volume > 0:
-        pcr = put_volume / call_volume
-    else:
-        pcr = 1.0  # Default to neutral if no call volume
-    
-    return pcr
+def _portfolio_scope(chain, symbol, portfolio_id):
+    """指定组合时只保留持有的合约并附加持仓数量"""
+    return chain if portfolio_id is None else portfolio_chain(chain, portfolio_id, symbol)
 
-def calculate_reflexivity_indicator(df):
-    """
-    Calculate reflexivity indicator based on market feedback loops
-    Uses gamma exposure as a proxy for potential market feedback
-    """
-    # Get the underlying price
-    underlying_price = df['underlying'].iloc[0]
-    
-    # Calculate total gamma exposure
-    total_gamma = (df['gamma'] * df['open_interest']).sum()
-    
-    # Normalize by underlying price
-    normalized_gamma = total_gamma / underlying_price
-    
-    # Calculate delta imbalance (call delta - put delta)
-    call_delta = df[df['option_type'] == 'call']['delta'].sum()
-    put_delta = abs(df[df['option_type'] == 'put']['delta'].sum())
-    delta_imbalance = abs(call_delta - put_delta) / (call_delta + put_delta) if (call_delta + put_delta) > 0 else 0
-    
-    # Combine gamma exposure and delta imbalance for reflexivity indicator
-    reflexivity = normalized_gamma * (1 + delta_imbalance)
-    
-    # Scale to a 0-1 range
-    scaled_reflexivity = min(1.0, reflexivity / 0.1)  # 0.1 is a normalization factor
-    
-    return scaled_reflexivity
-
-def determine_market_sentiment(volaxivity, put_call_ratio, reflexivity):
-    """
-    Determine market sentiment based on risk indicators
-    Returns 'risk-on' or 'risk-off'
-    """
-    # Define thresholds
-    volaxivity_threshold = 25
-    pcr_threshold = 1.2
-    reflexivity_threshold = 0.5
-    
-    # Count risk-off signals
-    risk_off_signals = 0
-    
-    if volaxivity > volaxivity_threshold:
-        risk_off_signals += 1
-    
-    if put_call_ratio > pcr_threshold:
-        risk_off_signals += 1
-    
-    if reflexivity > reflexivity_threshold:
-        risk_off_signals += 1
-    
-    # Determine sentiment based on majority of signals
-    if risk_off_signals >= 2:
-        return 'risk-off'
-    else:
-        return 'risk-on'
-        
-def get_crypto_specific_risk(symbol, df):
-    """
-    Calculate crypto-specific risk indicators
-    """
-    if symbol not in ['BTC', 'ETH']:
-        return None
-        
-    try:
-        # Get the underlying price
-        underlying_price = df['underlying'].iloc[0]
-        
-        # Calculate funding rate imbalance (simulated)
-        # In real implementation, this would come from exchange API
-        funding_rate = random.uniform(-0.01, 0.01)
-        
-        # Calculate liquidation risk (higher when price is near large put or call clusters)
-        # Simulated based on open interest distribution
-        call_oi_distribution = df[df['option_type'] == 'call'].groupby('strike')['open_interest'].sum()
-        put_oi_distribution = df[df['option_type'] == 'put'].groupby('strike')['open_interest'].sum()
-        
-        # Find strikes with highest open interest
-        if not call_oi_distribution.empty and not put_oi_distribution.empty:
-            max_call_strike = call_oi_distribution.idxmax()
-            max_put_strike = put_oi_distribution.idxmax()
-            
-            # Calculate distance to these strikes
-            call_distance = abs(max_call_strike - underlying_price) / underlying_price
-            put_distance = abs(max_put_strike - underlying_price) / underlying_price
-            
-            # Liquidation risk increases as price approaches these levels
-            liquidation_risk = max(0, min(1, 0.2 / min(call_distance, put_distance)))
-        else:
-            liquidation_risk = 0.5  # Default if no data
-            
-        return {
-            'funding_rate': funding_rate,
-            'liquidation_risk': liquidation_risk
-        }
-    except Exception as e:
-        logger.error(f"Error calculating crypto-specific risk: {str(e)}")
-        return None
+def _cached_scenario(symbol, snapshot_time, chain, price_change, volatility_change, time_horizon, engine_mode,
+                     portfolio_id=None):
+    """同一快照上相同参数的情景只计算一次"""
+    key = scenario_cache.result_key(
+        'scenario', symbol, snapshot_time,
+        (float(price_change), float(volatility_change), int(time_horizon)),
+        engine_mode, portfolio_id
+    )
+    return scenario_cache.get_or_compute(key, lambda: evaluate_scenario(
+        _portfolio_scope(chain, symbol, portfolio_id), price_change, volatility_change, time_horizon, engine_mode
+    ))
 
-def run_scenario_analysis(name, symbol, price_change, volatility_change, time_horizon, description=''):
+def run_scenario_analysis(name, symbol, price_change, volatility_change, time_horizon, description='',
+                          engine_mode=None, portfolio_id=None):
     """
     Run a scenario analysis for a given symbol with specified market changes
     Returns the created ScenarioAnalysis object
+
+    portfolio_id为None时按每个合约各持有1份计算，否则按该组合的持仓数量计算
     """
     try:
         logger.info(f"Running scenario analysis '{name}' for {symbol}")
         
-        # Get the latest option data for the symbol
-        latest_time = db.session.query(func.max(OptionData.timestamp)).filter(
-            OptionData.symbol == symbol
-        ).scalar()
+        # Get the latest option chain for the symbol - 同一快照的期权链只加载一次
+        latest_time, chain = scenario_cache.latest_chain(symbol)
         
         if not latest_time:
             logger.warning(f"No option data found for {symbol}")
             return None
         
-        options = OptionData.query.filter(
-            OptionData.symbol == symbol,
-            OptionData.timestamp == latest_time
-        ).all()
-        
-        if not options:
+        if chain is None:
             logger.warning(f"No option data found for {symbol} at {latest_time}")
             return None
         
-        # Get current underlying price
-        current_price = options[0].underlying_price
-        
-        # Calculate new price based on price change percentage
-        new_price = current_price * (1 + price_change / 100)
-        
-        # Simulate the effect on option Greeks and P&L
-        total_delta = 0
-        total_gamma = 0
-        total_vega = 0
-        total_theta = 0
-        estimated_pnl = 0
-        
-        for option in options:
-            # Calculate price change effect
-            price_effect = option.delta * (new_price - current_price)
-            
-            # Calculate volatility change effect (using vega)
-            vol_effect = option.vega * volatility_change
-            
-            # Calculate time decay effect
-            time_effect = option.theta * time_horizon
-            
-            # Calculate total P&L effect
-            option_pnl = price_effect + vol_effect + time_effect
-            estimated_pnl += option_pnl
-            
-            # Accumulate Greeks for the new scenario
-            total_delta += option.delta
-            total_gamma += option.gamma
-            total_vega += option.vega
-            total_theta += option.theta
+        # 向量化计算情景损益：full模式全量重定价，linear模式delta-gamma近似
+        engine_mode = engine_mode or Config.SCENARIO_ENGINE_MODE
+        result = _cached_scenario(symbol, latest_time, chain, price_change, volatility_change, time_horizon,
+                                  engine_mode, portfolio_id)
+        estimated_pnl = result['pnl']
         
         # Create and save the scenario analysis
         scenario = ScenarioAnalysis(
@@ -463,19 +286,119 @@ def run_scenario_analysis(name, symbol, price_change, volatility_change, time_ho
             volatility_change=volatility_change,
             time_horizon=time_horizon,
             estimated_pnl=estimated_pnl,
-            estimated_delta=total_delta,
-            estimated_gamma=total_gamma,
-            estimated_vega=total_vega,
-            estimated_theta=total_theta
+            estimated_delta=result['delta'],
+            estimated_gamma=result['gamma'],
+            estimated_vega=result['vega'],
+            estimated_theta=result['theta'],
+            engine_mode=engine_mode,
+            portfolio_id=portfolio_id,
+            snapshot_time=latest_time
         )
         
         db.session.add(scenario)
         db.session.commit()
         
-        logger.info(f"Scenario analysis completed: Estimated P&L = {estimated_pnl:.2f}")
+        logger.info(f"Scenario analysis completed ({engine_mode}, {result['repriced']}/{result['contracts']} repriced): "
+                    f"Estimated P&L = {estimated_pnl:.2f}")
         return scenario
         
     except Exception as e:
         logger.error(f"Error running scenario analysis: {str(e)}")
         db.session.rollback()
         return None
+
+def run_scenario_grid(symbol, price_changes, volatility_changes, time_horizons, engine_mode=None,
+                      save_summary=False, name=None, description='', portfolio_id=None):
+    """
+    在最新期权链上一次计算 价格变化 × 波动率变化 × 时间范围 的情景网格，
+    指定portfolio_id时只计算该组合持有的合约并按持仓数量加权
+
+    返回:
+    dict - pnl为 [时间范围][价格变化][波动率变化] 的三维列表，以及坐标轴、最差/最好情景；
+           save_summary为True时只把最差情景保存为一条ScenarioAnalysis记录（scenario_id）
+    """
+    engine_mode = engine_mode or Config.SCENARIO_ENGINE_MODE
+
+    latest_time, chain = scenario_cache.latest_chain(symbol)
+    if not latest_time:
+        logger.warning(f"No option data found for {symbol}")
+        return None
+
+    if chain is None:
+        logger.warning(f"No option data found for {symbol} at {latest_time}")
+        return None
+
+    def compute_grid():
+        scoped = _portfolio_scope(chain, symbol, portfolio_id)
+        grid = evaluate_scenario_grid(scoped, price_changes, volatility_changes, time_horizons, engine_mode)
+        grid.setflags(write=False)
+        return grid, int(len(scoped['strike']))
+
+    key = scenario_cache.result_key(
+        'grid', symbol, latest_time,
+        (tuple(map(float, price_changes)), tuple(map(float, volatility_changes)), tuple(map(int, time_horizons))),
+        engine_mode, portfolio_id
+    )
+    grid, contracts = scenario_cache.get_or_compute(key, compute_grid)
+
+    def scenario_at(index):
+        h, p, v = index
+        return {
+            'price_change': float(price_changes[p]),
+            'volatility_change': float(volatility_changes[v]),
+            'time_horizon': int(time_horizons[h]),
+            'pnl': float(grid[index])
+        }
+
+    worst = scenario_at(np.unravel_index(np.argmin(grid), grid.shape))
+    best = scenario_at(np.unravel_index(np.argmax(grid), grid.shape))
+
+    result = {
+        'symbol': symbol,
+        'snapshot_time': latest_time.isoformat(),
+        'engine_mode': engine_mode,
+        'portfolio_id': portfolio_id,
+        'contracts': contracts,
+        'price_changes': [float(value) for value in price_changes],
+        'volatility_changes': [float(value) for value in volatility_changes],
+        'time_horizons': [int(value) for value in time_horizons],
+        'pnl': np.round(grid, 2).tolist(),
+        'worst': worst,
+        'best': best
+    }
+
+    if save_summary:
+        try:
+            # 只保存最差情景，Greeks按该情景重新计算
+            summary = _cached_scenario(symbol, latest_time, chain, worst['price_change'],
+                                       worst['volatility_change'], worst['time_horizon'], engine_mode, portfolio_id)
+            grid_description = (f"Grid {len(price_changes)}x{len(volatility_changes)}x{len(time_horizons)} worst case; "
+                                f"best case {best['pnl']:.2f} at {best['price_change']:+g}% / "
+                                f"{best['volatility_change']:+g} vol / {best['time_horizon']}d")
+            scenario = ScenarioAnalysis(
+                name=name or f"{symbol} scenario grid",
+                description=f"{description}\n{grid_description}".strip(),
+                symbol=symbol,
+                created_at=datetime.utcnow(),
+                price_change=worst['price_change'],
+                volatility_change=worst['volatility_change'],
+                time_horizon=worst['time_horizon'],
+                estimated_pnl=summary['pnl'],
+                estimated_delta=summary['delta'],
+                estimated_gamma=summary['gamma'],
+                estimated_vega=summary['vega'],
+                estimated_theta=summary['theta'],
+                engine_mode=engine_mode,
+                portfolio_id=portfolio_id,
+                snapshot_time=latest_time
+            )
+            db.session.add(scenario)
+            db.session.commit()
+            result['scenario_id'] = scenario.id
+        except Exception as e:
+            logger.error(f"Error saving scenario grid summary: {str(e)}")
+            db.session.rollback()
+
+    logger.info(f"Scenario grid for {symbol} completed ({engine_mode}, {grid.size} scenarios): "
+                f"worst {worst['pnl']:.2f}, best {best['pnl']:.2f}")
+    return result
@@ -0,0 +1,86 @@
+"""
+情景分析结果缓存
+- 期权链数组按 (品种, 快照时间) 缓存，同一快照上的重复情景不再查询和重建期权链
+- 情景结果按 (品种, 快照时间, 情景参数, 引擎, 组合及其持仓版本) 缓存，LRU淘汰
+- 新快照到达时清除该品种较旧快照的条目；其他进程写入的快照在下一次读取最新快照时发现并清除
+"""
+import logging
+import threading
+
+from config import Config
+from models import Portfolio
+from services.cache_service import LRUCache
+from services.option_store import load_option_chain, get_latest_snapshot_time
+from services.scenario_engine import chain_arrays
+
+logger = logging.getLogger(__name__)
+
+
+class ScenarioCache:
+    """进程内的期权链和情景结果缓存，键的第二项为品种、第三项为快照时间"""
+
+    def __init__(self, max_entries=512, ttl_seconds=3600):
+        self._chains = LRUCache(max(len(Config.TRACKED_SYMBOLS) * 2, 4), ttl_seconds)
+        self._results = LRUCache(max_entries, ttl_seconds)
+        self._latest = {}
+        self._lock = threading.Lock()
+
+    def on_snapshot(self, symbol, snapshot_time):
+        """清除该品种早于snapshot_time的期权链和结果"""
+        with self._lock:
+            latest = self._latest.get(symbol)
+            if latest is not None and snapshot_time <= latest:
+                return
+            self._latest[symbol] = snapshot_time
+
+        def stale(key):
+            return key[1] == symbol and key[2] < snapshot_time
+
+        removed = self._chains.delete_where(stale) + self._results.delete_where(stale)
+        if removed:
+            logger.debug(f"{symbol} 新快照 {snapshot_time}，清除 {removed} 个情景缓存条目")
+
+    def latest_chain(self, symbol):
+        """
+        最新快照的期权链数组（只读）
+
+        返回:
+        (快照时间, chain_arrays)；没有数据时期权链为None
+        """
+        snapshot_time = get_latest_snapshot_time(symbol)
+        if snapshot_time is None:
+            return None, None
+        self.on_snapshot(symbol, snapshot_time)
+
+        key = ('chain', symbol, snapshot_time)
+        chain = self._chains.get(key)
+        if chain is None:
+            options = load_option_chain(symbol, snapshot_time)
+            if not options:
+                return snapshot_time, None
+            chain = chain_arrays(options, snapshot_time)
+            # 缓存的数组被多个请求共用，禁止原地修改
+            for values in chain.values():
+                values.setflags(write=False)
+            self._chains.set(key, chain)
+        return snapshot_time, chain
+
+    def result_key(self, kind, symbol, snapshot_time, params, engine_mode, portfolio_id=None):
+        """结果缓存的键；组合的持仓变化会更新 Portfolio.updated_at，使旧结果不再命中"""
+        portfolio_version = None
+        if portfolio_id is not None:
+            portfolio = Portfolio.query.get(portfolio_id)
+            portfolio_version = portfolio.updated_at if portfolio else None
+        return (kind, symbol, snapshot_time, tuple(params), engine_mode, portfolio_id, portfolio_version)
+
+    def get_or_compute(self, key, compute):
+        """命中时返回缓存的结果，否则调用compute()并缓存"""
+        result = self._results.get(key)
+        if result is not None:
+            return result
+        result = compute()
+        self._results.set(key, result)
+        return result
+
+
+scenario_cache = ScenarioCache(Config.SCENARIO_CACHE_MAX_ENTRIES, Config.SCENARIO_CACHE_TTL_SECONDS)
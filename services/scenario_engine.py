@@ -0,0 +1,207 @@
+"""
+情景分析计算
+- full: 用冲击后的标的价格、波动率和剩余期限对期权链中每个合约做Black-76全量重定价，
+  大幅波动（如±30%）时仍然准确
+- linear: delta-gamma近似 delta·dS + ½·gamma·dS² + vega·dVol + theta·天数，作为快速路径
+
+没有隐含波动率、无法重定价的合约在full模式下退回linear近似；计算只依赖期权链数组，不访问数据库
+期权链带有 quantity（持仓数量，见 services/portfolio_service.py）时按持仓加权，否则按每个合约各持有1份计算
+"""
+import numpy as np
+
+from config import Config
+from services.pricing import (
+    black76_price, black76_greeks, implied_volatility, quote_currency_premium, year_fraction,
+    DAYS_PER_YEAR, MIN_VOL, GREEKS
+)
+
+# 网格计算时每块中间数组的元素数上限
+GRID_CHUNK_ELEMENTS = 2_000_000
+
+
+def _to_array(values):
+    return np.array([np.nan if value is None else value for value in values], dtype=float)
+
+
+def chain_arrays(options, as_of):
+    """
+    将期权链转换为定价使用的数组
+
+    参数:
+    options - OptionData（或同结构的对象）列表
+    as_of - 快照时间，用于计算剩余期限
+
+    早期版本入库时把缺失的隐含波动率和Greeks存为0: 隐含波动率不为正时由权利金反解，
+    四个Greeks同时为0的合约视为缺失，由 current_greeks 按模型补齐
+    """
+    chain = {
+        'instrument_id': np.array([option.instrument_id or 0 for option in options], dtype=np.int64),
+        'underlying': _to_array([option.underlying_price for option in options]),
+        'strike': _to_array([option.strike_price for option in options]),
+        'expiry': year_fraction([option.expiration_date for option in options], as_of),
+        'iv': _to_array([option.implied_volatility for option in options]),
+        'is_call': np.array([option.option_type == 'call' for option in options], dtype=bool),
+        'open_interest': _to_array([option.open_interest for option in options]),
+        **{greek: _to_array([getattr(option, greek) for option in options]) for greek in GREEKS}
+    }
+
+    missing_iv = ~(chain['iv'] > 0)
+    if missing_iv.any():
+        price = quote_currency_premium(_to_array([option.option_price for option in options]), chain['underlying'],
+                                       [option.exchange for option in options])
+        chain['iv'][missing_iv] = implied_volatility(
+            price[missing_iv], chain['underlying'][missing_iv], chain['strike'][missing_iv],
+            chain['expiry'][missing_iv], chain['is_call'][missing_iv]
+        )
+
+    zero_greeks = np.all([chain[greek] == 0 for greek in GREEKS], axis=0)
+    for greek in GREEKS:
+        chain[greek][zero_greeks] = np.nan
+    return chain
+
+
+def quantities(chain):
+    """每个合约的持仓数量，期权链不带quantity时为1"""
+    quantity = chain.get('quantity')
+    return np.ones(len(chain['strike'])) if quantity is None else quantity
+
+
+def _linear_pnl(greeks, price_move, volatility_change, time_horizon):
+    return (greeks['delta'] * price_move +
+            0.5 * greeks['gamma'] * price_move * price_move +
+            greeks['vega'] * volatility_change +
+            greeks['theta'] * time_horizon)
+
+
+def current_greeks(chain):
+    """
+    返回 (可重定价的合约掩码, 当前Greeks)；缺失的交易所Greeks用模型值补齐，仍无法计算的按0处理
+    """
+    F0, K, T0, iv, is_call = (chain[key] for key in ('underlying', 'strike', 'expiry', 'iv', 'is_call'))
+    priceable = np.isfinite(iv) & (iv > 0) & (K > 0) & (F0 > 0)
+
+    greeks = {greek: chain[greek].copy() for greek in GREEKS}
+    if priceable.any():
+        model = black76_greeks(F0[priceable], K[priceable], T0[priceable], iv[priceable], is_call[priceable])
+        for greek in GREEKS:
+            values = greeks[greek][priceable]
+            missing = np.isnan(values)
+            values[missing] = model[greek][missing]
+            greeks[greek][priceable] = values
+    return priceable, {greek: np.nan_to_num(values) for greek, values in greeks.items()}
+
+
+def evaluate_scenario(chain, price_change, volatility_change, time_horizon, mode=None):
+    """
+    计算期权链在情景下的损益和Greeks（按持仓数量加权）
+
+    参数:
+    chain - chain_arrays 的返回值
+    price_change - 标的价格变化百分比
+    volatility_change - 隐含波动率变化（百分点）
+    time_horizon - 经过的天数
+    mode - 'full' 或 'linear'，默认Config.SCENARIO_ENGINE_MODE
+
+    返回:
+    dict - pnl, delta, gamma, vega, theta, contracts, repriced（full模式下重定价的合约数）；
+           full模式的Greeks为情景下重新计算的值，linear模式为当前值
+    """
+    mode = mode or Config.SCENARIO_ENGINE_MODE
+    F0 = chain['underlying']
+    K = chain['strike']
+    T0 = chain['expiry']
+    iv = chain['iv']
+    is_call = chain['is_call']
+
+    price_move = F0 * price_change / 100
+    priceable, greeks = current_greeks(chain)
+
+    pnl = _linear_pnl(greeks, price_move, volatility_change, time_horizon)
+    repriced = 0
+
+    if mode == 'full' and priceable.any():
+        F1 = F0[priceable] * (1 + price_change / 100)
+        iv1 = np.maximum(iv[priceable] + volatility_change / 100, MIN_VOL)
+        T1 = np.maximum(T0[priceable] - time_horizon / DAYS_PER_YEAR, 0.0)
+        base = black76_price(F0[priceable], K[priceable], T0[priceable], iv[priceable], is_call[priceable])
+        shocked = black76_price(F1, K[priceable], T1, iv1, is_call[priceable])
+        pnl[priceable] = shocked - base
+
+        shocked_greeks = black76_greeks(F1, K[priceable], T1, iv1, is_call[priceable])
+        for greek in GREEKS:
+            greeks[greek][priceable] = shocked_greeks[greek]
+        repriced = int(priceable.sum())
+
+    quantity = quantities(chain)
+    return {
+        'pnl': float(pnl @ quantity),
+        **{greek: float(values @ quantity) for greek, values in greeks.items()},
+        'contracts': int(len(F0)),
+        'repriced': repriced
+    }
+
+
+def evaluate_scenario_grid(chain, price_changes, volatility_changes, time_horizons, mode=None):
+    """
+    一次计算整个情景网格的损益
+
+    参数:
+    chain - chain_arrays 的返回值
+    price_changes - 标的价格变化百分比序列 (S,)
+    volatility_changes - 波动率变化百分点序列 (V,)
+    time_horizons - 天数序列 (H,)
+    mode - 'full' 或 'linear'
+
+    返回:
+    ndarray (H, S, V) - 每个情景的总损益
+    """
+    mode = mode or Config.SCENARIO_ENGINE_MODE
+    price_changes = np.asarray(price_changes, dtype=float)
+    volatility_changes = np.asarray(volatility_changes, dtype=float)
+    time_horizons = np.asarray(time_horizons, dtype=float)
+
+    priceable, greeks = current_greeks(chain)
+    if mode != 'full':
+        priceable = np.zeros_like(priceable)
+    linear = ~priceable
+    quantity = quantities(chain)
+
+    # 线性近似可以按合约先求和，网格上只剩标量运算
+    F0 = chain['underlying']
+    q = quantity[linear]
+    price_moves = price_changes / 100
+    grid = (
+        np.sum(q * greeks['delta'][linear] * F0[linear]) * price_moves[None, :, None] +
+        0.5 * np.sum(q * greeks['gamma'][linear] * F0[linear] ** 2) * price_moves[None, :, None] ** 2 +
+        np.sum(q * greeks['vega'][linear]) * volatility_changes[None, None, :] +
+        np.sum(q * greeks['theta'][linear]) * time_horizons[:, None, None]
+    )
+    grid = np.broadcast_to(grid, (len(time_horizons), len(price_changes), len(volatility_changes))).copy()
+
+    if priceable.any():
+        F0, K, T0, iv, is_call = (chain[key][priceable]
+                                  for key in ('underlying', 'strike', 'expiry', 'iv', 'is_call'))
+        q = quantity[priceable]
+        base = black76_price(F0, K, T0, iv, is_call) @ q
+
+        # 按合约分块，限制 (S, V, 合约数) 中间数组的大小
+        cells = len(price_changes) * len(volatility_changes)
+        chunk = max(1, GRID_CHUNK_ELEMENTS // cells)
+        spot_factor = (1 + price_moves)[:, None, None]
+        vol_shift = (volatility_changes / 100)[None, :, None]
+
+        for h, horizon in enumerate(time_horizons):
+            T1 = np.maximum(T0 - horizon / DAYS_PER_YEAR, 0.0)
+            shocked = np.zeros((len(price_changes), len(volatility_changes)))
+            for start in range(0, len(K), chunk):
+                part = slice(start, start + chunk)
+                shocked += black76_price(
+                    F0[part][None, None, :] * spot_factor,
+                    K[part][None, None, :],
+                    T1[part][None, None, :],
+                    np.maximum(iv[part][None, None, :] + vol_shift, MIN_VOL),
+                    is_call[part][None, None, :]
+                ) @ q[part]
+            grid[h] += shocked - base
+
+    return grid
@@ -7,6 +7,10 @@ from apscheduler.schedulers.background import BackgroundScheduler
 from services.data_service import fetch_latest_option_data, cleanup_old_data
 from services.risk_calculator import calculate_risk_indicators
 from services.deviation_monitor_service import calculate_deviation_metrics
+from services.leader_election import scheduler_lease, leader_only
+from services.compute_pipeline import compute_pipeline
+from services.gex_service import update_gamma_profile
+from services.option_store import get_latest_snapshot_time
 from config import Config
 
 logger = logging.getLogger(__name__)
@@ -18,25 +22,68 @@ def init_scheduler(app):
         scheduler.init_app(app)
         scheduler.start()
         
+        # 租约心跳 - 只有持有租约的进程才会真正执行下面的任务
+        scheduler.add_job(id='scheduler_lease_heartbeat', func=renew_scheduler_lease,
+                          trigger='interval', seconds=Config.SCHEDULER_LEASE_RENEW_SECONDS)
+        
         # 添加数据获取任务 - 每5分钟执行一次
-        scheduler.add_job(id='fetch_option_data', func=fetch_option_data, 
+        scheduler.add_job(id='fetch_option_data', func=leader_only(fetch_option_data), 
                           trigger='interval', minutes=5)
         
         # 添加数据计算任务 - 每10分钟执行一次
-        scheduler.add_job(id='calculate_all_data', func=calculate_all_data,
-                          trigger='interval', minutes=10)
+        # 事件驱动模式下由每个新快照触发计算，不需要固定周期的计算任务
+        if Config.PIPELINE_MODE != 'event':
+            scheduler.add_job(id='calculate_all_data', func=leader_only(calculate_all_data),
+                              trigger='interval', minutes=10)
         
-        scheduler.add_job(id='cleanup_old_data', func=cleanup_old_data, 
+        scheduler.add_job(id='cleanup_old_data', func=leader_only(cleanup_old_data), 
                           trigger='cron', hour=1)  # 每天凌晨1点清理旧数据
         
+        # 交易所实例在采集周期之间复用，市场数据按较慢的周期刷新
+        scheduler.add_job(id='refresh_exchange_markets', func=leader_only(refresh_exchange_markets),
+                          trigger='interval', minutes=Config.EXCHANGE_MARKETS_REFRESH_MINUTES)
+        
+        if Config.MONTE_CARLO_ENABLED:
+            scheduler.add_job(id='run_monte_carlo_var', func=leader_only(run_monte_carlo_var),
+                              trigger='interval', minutes=Config.MONTE_CARLO_INTERVAL_MINUTES)
+        
         logger.info("Scheduler initialized and jobs added")
         
-        # Run initial data fetch for all symbols
-        update_all_option_data()
+        # 立即尝试获取租约，并在后台执行首次数据更新，不阻塞启动
+        renew_scheduler_lease()
+        scheduler.add_job(id='initial_update', func=leader_only(update_all_option_data),
+                          trigger='date')
         
     except Exception as e:
         logger.error(f"Error initializing scheduler: {str(e)}")
+
+def shutdown_scheduler():
+    """停止调度器并释放租约"""
+    from app import app
+    
+    try:
+        scheduler.shutdown(wait=True)
+    except Exception as e:
+        logger.error(f"Error shutting down scheduler: {str(e)}")
+    
+    with app.app_context():
+        scheduler_lease.release()
+
+def renew_scheduler_lease():
+    """获取或续约调度器租约"""
+    from app import app
+    
+    with app.app_context():
+        scheduler_lease.try_acquire()
         
+def refresh_exchange_markets():
+    """刷新交易所的市场数据（新上市/到期的合约）"""
+    from services.exchange_api_ccxt import refresh_markets
+    
+    # 最大缓存时间取刷新周期的一半: 提前几秒触发的任务不会因缓存"仍未过期"而跳过，
+    # 市场数据最多比一个刷新周期略旧；刚因凭证变化重建过的实例仍可跳过
+    refresh_markets(max_age_minutes=Config.EXCHANGE_MARKETS_REFRESH_MINUTES / 2)
+
 def fetch_option_data():
     """只获取期权数据，不进行计算"""
     logger.info("正在执行计划任务: 获取最新期权数据")
@@ -49,10 +96,14 @@ def fetch_option_data():
         for symbol in Config.TRACKED_SYMBOLS:
             try:
                 # 只获取期权数据
-                success = fetch_latest_option_data(symbol)
+                snapshot_time = fetch_latest_option_data(symbol)
                 
-                if success:
+                if snapshot_time:
                     logger.info(f"已成功获取 {symbol} 的最新期权数据")
+                    
+                    # 事件驱动模式: 新快照立即排队计算
+                    if Config.PIPELINE_MODE == 'event':
+                        compute_pipeline.submit(symbol, snapshot_time)
                 else:
                     logger.warning(f"获取 {symbol} 期权数据失败")
                     
@@ -76,6 +127,14 @@ def calculate_all_data():
                 # 计算风险指标
                 calculate_risk_indicators(symbol)
                 
+                # 计算最新快照的Gamma敞口，失败不影响偏离指标的计算
+                try:
+                    snapshot_time = get_latest_snapshot_time(symbol)
+                    if snapshot_time:
+                        update_gamma_profile(symbol, snapshot_time)
+                except Exception as e:
+                    logger.error(f"计算{symbol} Gamma敞口失败: {str(e)}")
+                
                 # 计算期权执行价偏离指标
                 calculate_deviation_metrics(symbol)
                 
@@ -84,6 +143,19 @@ def calculate_all_data():
             except Exception as e:
                 logger.error(f"计算 {symbol} 指标时出错: {str(e)}")
 
+def run_monte_carlo_var():
+    """对最新期权链计算蒙特卡洛VaR/ES"""
+    logger.info("正在执行计划任务: 蒙特卡洛VaR")
+    
+    from app import app
+    from services.var_service import run_monte_carlo_var as run_var
+    
+    with app.app_context():
+        try:
+            run_var()
+        except Exception as e:
+            logger.error(f"蒙特卡洛VaR计算出错: {str(e)}")
+
 def update_all_option_data():
     """兼容旧代码的函数，同时获取数据并计算指标"""
     logger.info("Running scheduled update of option data")
@@ -96,11 +168,17 @@ def update_all_option_data():
         for symbol in Config.TRACKED_SYMBOLS:
             try:
                 # Fetch new option data
-                success = fetch_latest_option_data(symbol)
+                snapshot_time = fetch_latest_option_data(symbol)
                 
-                if success:
+                if snapshot_time:
                     # Calculate risk indicators
-                    calculate_risk_indicators(symbol)
+                    calculate_risk_indicators(symbol, snapshot_time=snapshot_time)
+                    
+                    # Gamma敞口是附加指标，失败不影响偏离指标的计算
+                    try:
+                        update_gamma_profile(symbol, snapshot_time)
+                    except Exception as e:
+                        logger.error(f"计算{symbol}@{snapshot_time} Gamma敞口失败: {str(e)}")
                     
                     # Calculate strike price deviation metrics
                     calculate_deviation_metrics(symbol)
@@ -0,0 +1,242 @@
+"""
+警报阈值网格扫描
+在历史回放得到的指标序列上，一次向量化计算大量 (关注, 警告, 严重) 阈值组合的警报次数和命中率
+
+- 警报规则与回放引擎一致：每个快照取达到的最高级别，同一级别在指标回落到关注级以下之前只触发一次
+- 命中：警报后一个时间周期内标的价格的绝对变动不小于 move_pct；周期结束时间超出数据范围的警报不计入命中率
+- 指标序列按 (品种, 日期) 分片回放，阈值组合按块分片，都在进程池中并行计算
+
+用法:
+    python -m services.threshold_sweep --start 2025-01-01 --end 2025-02-01 --symbol BTC \
+        --indicator volaxivity --period 1h --attention 10:30:1 --warning 20:40:1 --severe 30:60:2
+"""
+import argparse
+import json
+import logging
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import date, timedelta
+
+import numpy as np
+
+from config import Config
+from services.indicators import ALERT_INDICATORS
+from services.replay_engine import SOURCES, indicator_series_shard, init_worker, resolve_source
+
+logger = logging.getLogger(__name__)
+
+LEVELS = ('attention', 'warning', 'severe')
+
+# 每个任务计算的阈值组合数，限制 组合数×快照数 的中间数组大小
+DEFAULT_CHUNK_SIZE = 256
+
+
+def load_series(executor, symbol, start, end, source='auto'):
+    """
+    回放 [start, end) 日期范围内的指标序列
+
+    返回:
+    dict - timestamps (datetime64[us]), underlying, 以及每个指标的float数组，按时间升序
+    """
+    days = [start + timedelta(days=offset) for offset in range((end - start).days)]
+    futures = [executor.submit(indicator_series_shard, symbol, day, resolve_source(source, day)) for day in days]
+
+    merged = {'timestamps': [], 'underlying': []}
+    merged.update({indicator: [] for indicator in ALERT_INDICATORS})
+    for future in futures:
+        shard = future.result()
+        for key, values in shard.items():
+            merged[key].extend(values)
+
+    series = {key: np.asarray(values, dtype=float) for key, values in merged.items() if key != 'timestamps'}
+    series['timestamps'] = np.asarray(merged['timestamps'], dtype='datetime64[us]')
+    return series
+
+
+def forward_moves(timestamps, prices, horizon):
+    """
+    每个时间点之后horizon时间内的标的价格绝对变动百分比（取horizon之后第一个快照的价格）
+
+    返回:
+    float数组，horizon超出数据范围时为NaN
+    """
+    moves = np.full(len(prices), np.nan)
+    if len(prices) == 0:
+        return moves
+    target = np.searchsorted(timestamps, timestamps + np.timedelta64(horizon), side='left')
+    valid = (target < len(prices)) & (prices > 0)
+    moves[valid] = np.abs(prices[target[valid]] / prices[valid] - 1) * 100
+    return moves
+
+
+def parse_range(text):
+    """'start:stop:step'（含stop）或逗号分隔的取值列表"""
+    if ':' in text:
+        start, stop, step = (float(part) for part in text.split(':'))
+        return np.arange(start, stop + step / 2, step)
+    return np.asarray([float(part) for part in text.split(',')])
+
+
+def build_grid(attention_values, warning_values, severe_values):
+    """所有满足 关注 < 警告 < 严重 的阈值组合，形状 (组合数, 3)"""
+    attention, warning, severe = np.meshgrid(attention_values, warning_values, severe_values, indexing='ij')
+    grid = np.stack([attention.ravel(), warning.ravel(), severe.ravel()], axis=1)
+    return grid[(grid[:, 0] < grid[:, 1]) & (grid[:, 1] < grid[:, 2])]
+
+
+def default_grid(indicator, period, steps=11, spread=0.5):
+    """以当前默认阈值为中心、每个级别上下浮动spread比例的网格"""
+    periods = Config.DEFAULT_ALERT_THRESHOLDS[indicator]
+    levels = periods.get(period, periods.get('4h'))
+    scale = np.linspace(1 - spread, 1 + spread, steps)
+    return build_grid(*(levels[level] * scale for level in LEVELS))
+
+
+def evaluate_grid(values, grid, moves, move_pct):
+    """
+    向量化计算每个阈值组合的警报次数和命中次数
+
+    参数:
+    values - 指标序列 (n,)，不含NaN
+    grid - 阈值组合 (m, 3)
+    moves - 每个时间点之后的价格绝对变动百分比 (n,)，NaN表示无法评估
+    move_pct - 命中所需的最小变动百分比
+
+    返回:
+    (counts (m, 3) 各级别警报次数, hits (m,), evaluable (m,) 可评估命中的警报数)
+    """
+    v = values[None, :]
+    attention, warning, severe = grid[:, 0:1], grid[:, 1:2], grid[:, 2:3]
+
+    # 回落到关注级以下时重置已触发的级别
+    below = v < attention
+    state = (v >= attention).astype(np.int8) + (v >= warning) + (v >= severe)
+
+    known = ~np.isnan(moves)
+    significant = known & (moves >= move_pct)
+
+    counts = np.zeros((len(grid), len(LEVELS)), dtype=np.int64)
+    hits = np.zeros(len(grid), dtype=np.int64)
+    evaluable = np.zeros(len(grid), dtype=np.int64)
+    for level in range(1, len(LEVELS) + 1):
+        at_level = state == level
+        # 本级别累计出现次数减去上次回落时的累计值 == 1 即回落后第一次达到该级别
+        seen = np.cumsum(at_level, axis=1, dtype=np.int32)
+        seen_at_reset = np.maximum.accumulate(np.where(below, seen, 0), axis=1)
+        fired = at_level & (seen - seen_at_reset == 1)
+
+        counts[:, level - 1] = fired.sum(axis=1)
+        hits += (fired & significant).sum(axis=1)
+        evaluable += (fired & known).sum(axis=1)
+
+    return counts, hits, evaluable
+
+
+def run_sweep(symbol, start, end, targets, move_pct=None, source='auto', workers=None,
+              chunk_size=DEFAULT_CHUNK_SIZE):
+    """
+    对多个 (指标, 时间周期, 阈值网格) 执行扫描
+
+    参数:
+    symbol - 品种
+    start, end - 起止日期（date，不含end）
+    targets - [(indicator, period, grid)]，grid为None时使用default_grid
+    move_pct - 命中所需的价格变动百分比，默认Config.THRESHOLD_SWEEP_MOVE_PCT
+
+    返回:
+    dict - points（快照数）, days, results: {"indicator/period": [每个阈值组合的统计]}
+    """
+    if source not in SOURCES:
+        raise ValueError(f"Unknown replay source: {source}")
+    move_pct = Config.THRESHOLD_SWEEP_MOVE_PCT if move_pct is None else move_pct
+    days = max((end - start).days, 1)
+
+    results = {}
+    with ProcessPoolExecutor(max_workers=workers or Config.REPLAY_WORKERS, initializer=init_worker) as executor:
+        series = load_series(executor, symbol, start, end, source)
+        logger.info(f"{symbol} 指标序列: {len(series['timestamps'])} 个快照")
+
+        jobs = []
+        for indicator, period, grid in targets:
+            if grid is None:
+                grid = default_grid(indicator, period)
+            values = series[indicator]
+            valid = ~np.isnan(values)
+            horizon = timedelta(minutes=Config.TIME_PERIODS[period]['minutes'])
+            moves = forward_moves(series['timestamps'][valid], series['underlying'][valid], horizon)
+
+            chunks = [grid[offset:offset + chunk_size] for offset in range(0, len(grid), chunk_size)]
+            futures = [executor.submit(evaluate_grid, values[valid], chunk, moves, move_pct) for chunk in chunks]
+            jobs.append((indicator, period, chunks, futures))
+
+        for indicator, period, chunks, futures in jobs:
+            rows = []
+            for chunk, future in zip(chunks, futures):
+                counts, hits, evaluable = future.result()
+                for thresholds, level_counts, hit_count, evaluable_count in zip(chunk, counts, hits, evaluable):
+                    alerts = int(level_counts.sum())
+                    row = {level: float(value) for level, value in zip(LEVELS, thresholds)}
+                    row.update({f"{level}_alerts": int(count) for level, count in zip(LEVELS, level_counts)})
+                    row.update({
+                        'alerts': alerts,
+                        'alerts_per_day': alerts / days,
+                        'hits': int(hit_count),
+                        'hit_rate': float(hit_count / evaluable_count) if evaluable_count else None
+                    })
+                    rows.append(row)
+            results[f"{indicator}/{period}"] = rows
+
+    return {'points': int(len(series['timestamps'])), 'days': days, 'results': results}
+
+
+def _parse_date(value):
+    return date.fromisoformat(value)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Sweep alert threshold grids over replayed indicator history')
+    parser.add_argument('--start', type=_parse_date, required=True, help='start date (YYYY-MM-DD, UTC)')
+    parser.add_argument('--end', type=_parse_date, required=True, help='end date, exclusive')
+    parser.add_argument('--symbol', default=Config.TRACKED_SYMBOLS[0])
+    parser.add_argument('--indicator', action='append', choices=ALERT_INDICATORS, dest='indicators')
+    parser.add_argument('--period', action='append', choices=list(Config.TIME_PERIODS), dest='periods')
+    parser.add_argument('--attention', type=parse_range, help="start:stop:step or comma separated values")
+    parser.add_argument('--warning', type=parse_range)
+    parser.add_argument('--severe', type=parse_range)
+    parser.add_argument('--move-pct', type=float)
+    parser.add_argument('--min-alerts', type=int, default=1, help='hide settings with fewer alerts')
+    parser.add_argument('--source', choices=SOURCES, default='auto')
+    parser.add_argument('--workers', type=int)
+    parser.add_argument('--top', type=int, default=10, help='settings to print per indicator/period')
+    parser.add_argument('--output', help='write all results as JSON to this file')
+    args = parser.parse_args(argv)
+
+    explicit_grid = None
+    if args.attention is not None or args.warning is not None or args.severe is not None:
+        if args.attention is None or args.warning is None or args.severe is None:
+            parser.error('--attention, --warning and --severe must be given together')
+        explicit_grid = build_grid(args.attention, args.warning, args.severe)
+
+    targets = [(indicator, period, explicit_grid)
+               for indicator in (args.indicators or ALERT_INDICATORS)
+               for period in (args.periods or ['1h'])]
+    report = run_sweep(args.symbol, args.start, args.end, targets, move_pct=args.move_pct,
+                       source=args.source, workers=args.workers)
+
+    if args.output:
+        os.makedirs(os.path.dirname(os.path.abspath(args.output)), exist_ok=True)
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+    print(f"{args.symbol}: {report['points']} snapshots over {report['days']} days")
+    for name, rows in report['results'].items():
+        candidates = [row for row in rows if row['alerts'] >= args.min_alerts and row['hit_rate'] is not None]
+        candidates.sort(key=lambda row: (row['hit_rate'], row['alerts']), reverse=True)
+        print(f"\n{name}: {len(rows)} settings")
+        for row in candidates[:args.top]:
+            print(f"  {row['attention']:.4g}/{row['warning']:.4g}/{row['severe']:.4g}: "
+                  f"{row['alerts']} alerts ({row['alerts_per_day']:.1f}/day), hit rate {row['hit_rate']:.1%}")
+
+
+if __name__ == '__main__':
+    main()
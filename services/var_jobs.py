@@ -0,0 +1,89 @@
+"""
+蒙特卡洛VaR后台任务
+POST /api/risk/var 只负责排队并立即返回任务ID，模拟在后台线程中执行，不占用Web请求线程；
+结果以任务ID作为run_id保存到VarEstimate。排队和运行中的任务总数有上限，超出时拒绝新的请求
+"""
+import logging
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta
+
+from app import app, db
+from models import VarJob
+from config import Config
+
+logger = logging.getLogger(__name__)
+
+ACTIVE_STATUSES = ('queued', 'running')
+
+
+class VarJobManager:
+    """后台蒙特卡洛VaR任务管理"""
+
+    def __init__(self, max_workers=1):
+        self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix='var-job')
+
+    def submit(self, symbols, horizons, confidences, paths, seed, portfolio_id=None):
+        """
+        提交模拟任务
+
+        返回:
+        VarJob - 排队中的任务；进行中的任务已达上限时返回None
+        """
+        # 超时未结束的任务（如进程重启）标记为失败，不再占用名额
+        stale_before = datetime.utcnow() - timedelta(minutes=Config.MONTE_CARLO_JOB_STALE_MINUTES)
+        VarJob.query.filter(
+            VarJob.status.in_(ACTIVE_STATUSES),
+            VarJob.created_at < stale_before
+        ).update({'status': 'failed', 'finished_at': datetime.utcnow(), 'error': 'stale'},
+                 synchronize_session=False)
+        db.session.commit()
+
+        active = VarJob.query.filter(VarJob.status.in_(ACTIVE_STATUSES)).count()
+        if active >= Config.MONTE_CARLO_MAX_ACTIVE_JOBS:
+            logger.warning(f"进行中的蒙特卡洛VaR任务已有 {active} 个，拒绝新请求")
+            return None
+
+        job = VarJob(id=str(uuid.uuid4()), status='queued', portfolio_id=portfolio_id, paths=paths)
+        db.session.add(job)
+        db.session.commit()
+
+        self._executor.submit(self._run, job.id, symbols, horizons, confidences, paths, seed, portfolio_id)
+        logger.info(f"已提交蒙特卡洛VaR任务 {job.id}")
+        return job
+
+    def get(self, job_id):
+        return db.session.get(VarJob, job_id)
+
+    def _run(self, job_id, symbols, horizons, confidences, paths, seed, portfolio_id):
+        from services.var_service import run_monte_carlo_var
+
+        with app.app_context():
+            self._update(job_id, status='running', started_at=datetime.utcnow())
+            try:
+                result = run_monte_carlo_var(symbols, horizons, confidences, paths, seed,
+                                             portfolio_id=portfolio_id, run_id=job_id)
+                if result is None:
+                    self._update(job_id, status='failed', finished_at=datetime.utcnow(),
+                                 error='No option data available')
+                    return
+
+                self._update(job_id, status='succeeded', finished_at=datetime.utcnow())
+                logger.info(f"蒙特卡洛VaR任务 {job_id} 完成")
+            except Exception as e:
+                db.session.rollback()
+                logger.error(f"蒙特卡洛VaR任务 {job_id} 失败: {str(e)}")
+                self._update(job_id, status='failed', finished_at=datetime.utcnow(), error=str(e))
+            finally:
+                db.session.remove()
+
+    def _update(self, job_id, **fields):
+        try:
+            VarJob.query.filter_by(id=job_id).update(fields, synchronize_session=False)
+            db.session.commit()
+        except Exception as e:
+            db.session.rollback()
+            logger.error(f"更新蒙特卡洛VaR任务 {job_id} 状态失败: {str(e)}")
+
+
+var_job_manager = VarJobManager(Config.MONTE_CARLO_JOB_WORKERS)
@@ -0,0 +1,111 @@
+"""
+蒙特卡洛风险价值服务
+读取各品种最新的期权链，调用 services/monte_carlo.py 计算VaR/ES并保存到VarEstimate
+"""
+import logging
+import uuid
+
+from app import db
+from models import VarEstimate
+from config import Config
+from services.monte_carlo import simulate_var, atm_volatility
+from services.portfolio_service import portfolio_chain
+from services.scenario_cache import scenario_cache
+
+logger = logging.getLogger(__name__)
+
+
+def run_monte_carlo_var(symbols=None, horizons=None, confidences=None, paths=None, seed=None, save=True,
+                        portfolio_id=None, run_id=None):
+    """
+    对最新期权链运行蒙特卡洛模拟
+
+    参数:
+    symbols - 品种列表，默认Config.TRACKED_SYMBOLS
+    horizons, confidences, paths, seed - 见 simulate_var，默认使用配置
+    save - 是否保存到VarEstimate
+    portfolio_id - 按该组合的持仓计算，为None时按每个合约各持有1份计算
+    run_id - 结果保存使用的run_id，默认新生成
+
+    返回:
+    dict - simulate_var 的结果加上 run_id 和 snapshot_times；没有可用期权链时返回None
+    """
+    chains = {}
+    snapshot_times = {}
+    spot_vols = {}
+    for symbol in symbols or Config.TRACKED_SYMBOLS:
+        snapshot_time, chain = scenario_cache.latest_chain(symbol)
+        if chain is None:
+            continue
+        if portfolio_id is not None:
+            # 标的价格波动率仍按完整期权链估计，只对持仓合约重定价
+            spot_vols[symbol] = atm_volatility(chain)
+            chain = portfolio_chain(chain, portfolio_id, symbol)
+            if len(chain['strike']) == 0:
+                continue
+        chains[symbol] = chain
+        snapshot_times[symbol] = snapshot_time
+
+    if not chains:
+        logger.warning("没有可用于蒙特卡洛模拟的期权数据")
+        return None
+
+    # 模拟在子进程中运行，期间不占用数据库连接
+    db.session.remove()
+    result = simulate_var(chains, horizons=horizons, confidences=confidences, paths=paths, seed=seed,
+                          spot_vols=spot_vols)
+    result['run_id'] = run_id or str(uuid.uuid4())
+    result['portfolio_id'] = portfolio_id
+    result['snapshot_times'] = {symbol: ts.isoformat() for symbol, ts in snapshot_times.items()}
+
+    if save:
+        try:
+            db.session.add_all([
+                VarEstimate(
+                    run_id=result['run_id'],
+                    symbol=row['symbol'],
+                    snapshot_time=snapshot_times.get(row['symbol']),
+                    horizon_days=row['horizon_days'],
+                    confidence=row['confidence'],
+                    var=row['var'],
+                    expected_shortfall=row['expected_shortfall'],
+                    paths=result['paths'],
+                    converged=result['converged'],
+                    seed=result['seed'],
+                    portfolio_id=portfolio_id
+                )
+                for row in result['results']
+            ])
+            db.session.commit()
+        except Exception as e:
+            logger.error(f"保存蒙特卡洛VaR结果失败: {str(e)}")
+            db.session.rollback()
+
+    return result
+
+
+def get_latest_var(portfolio_id=None):
+    """最近一次保存的模拟结果（全部合约或指定组合），没有时返回None"""
+    latest = VarEstimate.query.filter_by(portfolio_id=portfolio_id).order_by(VarEstimate.created_at.desc()).first()
+    if not latest:
+        return None
+    return get_var_run(latest.run_id)
+
+
+def get_var_run(run_id):
+    """指定run_id的模拟结果，没有时返回None"""
+    rows = VarEstimate.query.filter_by(run_id=run_id).order_by(
+        VarEstimate.symbol, VarEstimate.horizon_days, VarEstimate.confidence
+    ).all()
+    if not rows:
+        return None
+    first = rows[0]
+    return {
+        'run_id': first.run_id,
+        'portfolio_id': first.portfolio_id,
+        'created_at': first.created_at.isoformat(),
+        'paths': first.paths,
+        'converged': first.converged,
+        'seed': first.seed,
+        'results': [row.to_dict() for row in rows]
+    }
@@ -0,0 +1,233 @@
+"""
+隐含波动率曲面（每个到期日一条SVI微笑曲线）
+
+SVI原始参数化: 总方差 w(k) = a + b·(ρ·(k - m) + sqrt((k - m)² + σ²))，k = ln(K/F)
+- 固定 (m, σ) 时 w 对 (a, b·ρ, b) 是线性的: 对一组 (m, σ) 候选值批量求解正规方程，取残差最小者，
+  再在其附近加密搜索一次，不需要逐条曲线迭代优化
+- 只使用虚值合约（K<F 的看跌、K>=F 的看涨），每个到期日至少 MIN_POINTS 个报价
+- 拟合时预先计算每个到期日的ATM波动率和25 delta风险逆转，按期限查询只需在到期日之间插值
+
+拟合结果按 (品种, 快照时间) 缓存在进程内；本模块不依赖数据库，实时计算和历史回放共用
+"""
+import logging
+
+import numpy as np
+from scipy.special import ndtri
+
+from config import Config
+from services.cache_service import LRUCache
+from services.pricing import year_fraction, DAYS_PER_YEAR
+
+logger = logging.getLogger(__name__)
+
+MIN_POINTS = 5
+# 剩余期限短于该值（年）的到期日不参与拟合，临近到期的报价噪声过大
+MIN_EXPIRY = 1 / DAYS_PER_YEAR
+# 参与拟合的隐含波动率范围
+MIN_IV = 0.01
+MAX_IV = 5.0
+
+# (m, σ) 候选网格
+M_STEPS = 15
+SIGMA_GRID = np.geomspace(0.005, 1.5, 12)
+
+# 25 delta 对应的 d1（看涨 N(d1)=0.25，看跌 N(d1)-1=-0.25）
+D1_CALL_25 = float(ndtri(0.25))
+D1_PUT_25 = float(ndtri(0.75))
+
+CACHE_SIZE = 32
+_cache = LRUCache(CACHE_SIZE, ttl_seconds=3600)
+
+
+def _solve_candidates(k, w, m, sigma):
+    """
+    对每个 (m, σ) 候选值求解线性最小二乘
+
+    参数:
+    k, w - (n,) 对数执行价和总方差
+    m, sigma - (G,) 候选值
+
+    返回:
+    (params (G, 5) [a, b, ρ, m, σ], 残差平方和 (G,))
+    """
+    x = k[None, :] - m[:, None]
+    root = np.sqrt(x * x + sigma[:, None] ** 2)
+    design = np.stack([np.ones_like(x), x, root], axis=2)  # (G, n, 3)
+
+    normal = np.einsum('gni,gnj->gij', design, design)
+    normal += np.eye(3) * 1e-12 * np.trace(normal, axis1=1, axis2=2)[:, None, None]
+    rhs = np.einsum('gni,n->gi', design, w)
+    coef = np.linalg.solve(normal, rhs[:, :, None])[:, :, 0]
+
+    # 投影到可行域: b >= 0, |ρ| <= 1，a 按约束后的斜率重新求解
+    b = np.maximum(coef[:, 2], 0.0)
+    c = np.clip(coef[:, 1], -b, b)
+    a = np.mean(w[None, :] - c[:, None] * x - b[:, None] * root, axis=1)
+    # 最小总方差 a + b·σ·sqrt(1-ρ²) 不能为负
+    rho = np.divide(c, b, out=np.zeros_like(c), where=b > 0)
+    a = np.maximum(a, -b * sigma * np.sqrt(1 - rho * rho))
+
+    residual = w[None, :] - (a[:, None] + c[:, None] * x + b[:, None] * root)
+    return np.column_stack([a, b, rho, m, sigma]), np.sum(residual * residual, axis=1)
+
+
+def fit_svi(k, w):
+    """
+    拟合一条SVI曲线
+
+    返回:
+    ndarray [a, b, ρ, m, σ]
+    """
+    span = max(k.max() - k.min(), 1e-3)
+    m_grid = np.linspace(k.min(), k.max(), M_STEPS)
+    m, sigma = (values.ravel() for values in np.meshgrid(m_grid, SIGMA_GRID, indexing='ij'))
+    params, errors = _solve_candidates(k, w, m, sigma)
+    best = params[np.argmin(errors)]
+
+    # 在最优候选值附近加密搜索一次
+    m_step = span / (M_STEPS - 1)
+    m_fine = np.linspace(best[3] - m_step, best[3] + m_step, M_STEPS)
+    sigma_fine = best[4] * np.geomspace(0.5, 2.0, len(SIGMA_GRID))
+    m, sigma = (values.ravel() for values in np.meshgrid(m_fine, sigma_fine, indexing='ij'))
+    params, errors = _solve_candidates(k, w, m, sigma)
+    return params[np.argmin(errors)]
+
+
+def svi_total_variance(params, k):
+    a, b, rho, m, sigma = params
+    x = np.asarray(k, dtype=float) - m
+    return a + b * (rho * x + np.sqrt(x * x + sigma * sigma))
+
+
+def _delta_strike(params, T, d1_target):
+    """微笑曲线上 d1 = d1_target 的对数执行价（d1 随k单调递减）"""
+    atm_sd = np.sqrt(max(svi_total_variance(params, 0.0), 1e-8))
+    k = np.linspace(-6 * atm_sd, 6 * atm_sd, 241)
+    w = np.maximum(svi_total_variance(params, k), 1e-10)
+    d1 = (-k + 0.5 * w) / np.sqrt(w)
+    return float(np.interp(d1_target, d1[::-1], k[::-1]))
+
+
+class VolSurface:
+    """一个快照的波动率曲面，按到期日保存SVI参数和预先计算的ATM波动率、25 delta风险逆转"""
+
+    def __init__(self, expiries):
+        """expiries - [(到期日, 年化期限, SVI参数, 拟合点数, 均方根误差)]，按期限升序"""
+        self.expiries = expiries
+        self.times = np.array([T for _, T, _, _, _ in expiries])
+        self.atm_vols = np.array([self.smile_vol(i, 0.0) for i in range(len(expiries))])
+        self.risk_reversals = np.array([
+            self.smile_vol(i, _delta_strike(params, T, D1_CALL_25)) -
+            self.smile_vol(i, _delta_strike(params, T, D1_PUT_25))
+            for i, (_, T, params, _, _) in enumerate(expiries)
+        ])
+
+    def smile_vol(self, index, k):
+        """第index个到期日在对数执行价k处的隐含波动率"""
+        _, T, params, _, _ = self.expiries[index]
+        return np.sqrt(np.maximum(svi_total_variance(params, k), 0.0) / T)
+
+    def covers(self, days):
+        """期限（天）是否落在已拟合的到期日范围内"""
+        T = days / DAYS_PER_YEAR
+        return self.times[0] <= T <= self.times[-1]
+
+    def _tenor(self, days):
+        """查询期限（年）；超出已拟合到期日范围时记录警告并取最近的到期日"""
+        days = days or Config.VOL_SURFACE_TENOR_DAYS
+        if not self.covers(days):
+            logger.warning(f"期限 {days} 天超出已拟合到期日范围 "
+                           f"[{self.times[0] * DAYS_PER_YEAR:.2f}, {self.times[-1] * DAYS_PER_YEAR:.2f}] 天，"
+                           f"取最近的到期日")
+        return min(max(days / DAYS_PER_YEAR, self.times[0]), self.times[-1])
+
+    def atm_vol(self, days=None):
+        """指定期限（天）的ATM波动率，到期日之间按总方差线性插值，超出范围时取最近的到期日"""
+        T = self._tenor(days)
+        total_variance = np.interp(T, self.times, self.atm_vols ** 2 * self.times)
+        return float(np.sqrt(total_variance / T))
+
+    def risk_reversal_25d(self, days=None):
+        """指定期限的25 delta风险逆转（看涨IV - 看跌IV），到期日之间线性插值，超出范围时取最近的到期日"""
+        T = self._tenor(days)
+        return float(np.interp(T, self.times, self.risk_reversals))
+
+    def term_structure(self):
+        return [
+            {
+                'expiration_date': expiration.isoformat(),
+                'days': float(T * DAYS_PER_YEAR),
+                'atm_vol': float(atm),
+                'risk_reversal_25d': float(rr),
+                'points': points,
+                'rmse': float(rmse),
+                'svi': dict(zip(('a', 'b', 'rho', 'm', 'sigma'), (float(value) for value in params)))
+            }
+            for (expiration, T, params, points, rmse), atm, rr in zip(self.expiries, self.atm_vols, self.risk_reversals)
+        ]
+
+
+def fit_surface(df):
+    """
+    由期权链拟合波动率曲面
+
+    参数:
+    df - options_to_frame 的返回值（需要 expiration_date 和 timestamp 列）
+
+    返回:
+    VolSurface；没有任何到期日有足够的报价时返回None
+    """
+    if df.empty:
+        return None
+    as_of = df['timestamp'].max()
+    F = df['underlying'].to_numpy(dtype=float)
+    K = df['strike'].to_numpy(dtype=float)
+    iv = df['iv'].to_numpy(dtype=float)
+    T = year_fraction(list(df['expiration_date']), as_of)
+    with np.errstate(divide='ignore', invalid='ignore'):
+        k = np.log(K / F)
+    is_call = (df['option_type'] == 'call').to_numpy()
+
+    usable = (np.isfinite(k) & np.isfinite(iv) & (iv > MIN_IV) & (iv < MAX_IV) & (T > MIN_EXPIRY) &
+              np.where(is_call, k >= 0, k < 0))
+
+    expiries = []
+    for expiration in sorted(set(df['expiration_date'][usable])):
+        mask = usable & (df['expiration_date'] == expiration).to_numpy()
+        if mask.sum() < MIN_POINTS:
+            continue
+        T_expiry = float(T[mask][0])
+        w = iv[mask] ** 2 * T_expiry
+        params = fit_svi(k[mask], w)
+        fitted = np.sqrt(np.maximum(svi_total_variance(params, k[mask]), 0.0) / T_expiry)
+        rmse = np.sqrt(np.mean((fitted - iv[mask]) ** 2))
+        expiries.append((expiration, T_expiry, params, int(mask.sum()), rmse))
+
+    if not expiries:
+        return None
+    return VolSurface(expiries)
+
+
+def get_surface(symbol, df):
+    """
+    同一快照的曲面只拟合一次；快照由期权链中最新的timestamp确定
+
+    返回:
+    VolSurface 或 None
+    """
+    if df.empty:
+        return None
+    key = (symbol, df['timestamp'].max(), len(df))
+    # 拟合失败的快照也缓存（值为None），因此缓存条目包装为单元素元组
+    entry = _cache.get(key)
+    if entry is not None:
+        return entry[0]
+
+    try:
+        surface = fit_surface(df)
+    except Exception as e:
+        logger.warning(f"{symbol} 波动率曲面拟合失败: {str(e)}")
+        surface = None
+
+    _cache.set(key, (surface,))
+    return surface
@@ -58,6 +58,9 @@ document.addEventListener('DOMContentLoaded', function() {
             loadDashboardData(currentSymbol, 30, currentTimePeriod);
         }, 600000); // 10 minutes (600000ms)
         
+        // 订阅服务端推送，新指标产生后立即刷新，定时刷新仅作为兜底
+        setupEventStream();
+        
         // 在页面上显示初始化完成信息
         showToast('仪表盘初始化完成，正在加载数据...', 'info');
     } catch (error) {
@@ -66,6 +69,46 @@ document.addEventListener('DOMContentLoaded', function() {
     }
 });
 
+// 订阅SSE推送通道
+function setupEventStream() {
+    if (typeof EventSource === 'undefined') {
+        console.warn('浏览器不支持EventSource，仅使用定时刷新');
+        return;
+    }
+
+    const source = new EventSource('/api/stream?topics=indicators,gamma_profile,alert');
+
+    source.addEventListener('indicators', function(e) {
+        const data = JSON.parse(e.data);
+        const currentSymbol = document.getElementById('symbol-selector')?.value || 'BTC';
+        const currentTimePeriod = document.getElementById('time-period-selector')?.value || '15m';
+        if (data.symbol === currentSymbol) {
+            console.log('收到新的风险指标推送:', data);
+            loadDashboardData(currentSymbol, 30, currentTimePeriod);
+        }
+    });
+
+    // GEX曲线在风险指标之后计算，单独推送
+    source.addEventListener('gamma_profile', function(e) {
+        const data = JSON.parse(e.data);
+        const currentSymbol = document.getElementById('symbol-selector')?.value || 'BTC';
+        if (data.symbol === currentSymbol) {
+            loadGammaExposure(currentSymbol);
+        }
+    });
+
+    source.addEventListener('alert', function(e) {
+        const data = JSON.parse(e.data);
+        const type = data.alert_type === 'severe' ? 'danger' : (data.alert_type === 'warning' ? 'warning' : 'info');
+        showToast(data.message, type);
+    });
+
+    source.onerror = function() {
+        // EventSource会自动重连，这里只记录日志
+        console.warn('推送连接中断，正在重连...');
+    };
+}
+
 // 设置所有事件监听器
 function setupEventListeners() {
     console.log('设置事件监听器...');
@@ -131,17 +174,24 @@ function setupEventListeners() {
             })
             .then(response => response.json())
             .then(data => {
-                if (data.success) {
+                if (!data.success) {
+                    throw new Error(data.message || '未知错误');
+                }
+                // 刷新在后台执行，轮询任务状态直到完成
+                return waitForRefreshJob(data.job_id);
+            })
+            .then(job => {
+                if (job.status === 'succeeded') {
                     // 刷新成功后重新加载仪表盘数据
                     loadDashboardData(symbol, 30, timePeriod);
                     showToast('数据刷新成功', 'success');
                 } else {
-                    showToast('刷新数据失败: ' + (data.message || '未知错误'), 'danger');
+                    showToast('刷新数据失败: ' + (job.error || '未知错误'), 'danger');
                 }
             })
             .catch(error => {
                 console.error('刷新数据出错:', error);
-                showToast('连接服务器出错', 'danger');
+                showToast('刷新数据失败: ' + (error.message || '连接服务器出错'), 'danger');
             })
             .finally(() => {
                 // 恢复按钮状态
@@ -160,10 +210,38 @@ function setupEventListeners() {
     });
 }
 
+/**
+ * 轮询后台刷新任务状态，直到任务成功或失败
+ */
+function waitForRefreshJob(jobId, intervalMs = 1500, timeoutMs = 300000) {
+    const startedAt = Date.now();
+    return new Promise((resolve, reject) => {
+        const poll = () => {
+            fetch(`/api/data/refresh/${jobId}`)
+                .then(response => response.json())
+                .then(job => {
+                    if (job.status === 'succeeded' || job.status === 'failed') {
+                        resolve(job);
+                    } else if (Date.now() - startedAt > timeoutMs) {
+                        reject(new Error('刷新任务超时'));
+                    } else {
+                        setTimeout(poll, intervalMs);
+                    }
+                })
+                .catch(reject);
+        };
+        poll();
+    });
+}
+
 // 加载仪表盘数据
 function loadDashboardData(symbol, days = 30, timePeriod = '15m') {
     console.log(`加载${symbol}的最近${days}天数据，时间周期：${timePeriod}...`);
 
+    // 持仓组合的汇总Greeks和GEX曲线随指标一起刷新
+    loadPortfolioExposure(symbol);
+    loadGammaExposure(symbol);
+
     // 初始化全局图表对象容器
     if (!window.chartObjects) {
         window.chartObjects = {};
@@ -306,6 +384,95 @@ function loadDashboardData(symbol, days = 30, timePeriod = '15m') {
         });
 }
 
+// 加载各持仓组合在当前品种上的汇总Greeks
+function loadPortfolioExposure(symbol) {
+    const container = document.getElementById('portfolio-exposure');
+    if (!container) {
+        return;
+    }
+
+    fetch(`/api/portfolios?symbol=${encodeURIComponent(symbol)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success || data.portfolios.length === 0) {
+                container.textContent = 'No portfolios';
+                return;
+            }
+            const rows = data.portfolios.map(portfolio => {
+                const greeks = portfolio.greeks[symbol];
+                return `<tr><td>${portfolio.name}</td><td>${greeks.positions}</td>` +
+                    `<td>${greeks.delta.toFixed(2)}</td><td>${greeks.gamma.toFixed(4)}</td>` +
+                    `<td>${greeks.vega.toFixed(2)}</td><td>${greeks.theta.toFixed(2)}</td></tr>`;
+            }).join('');
+            container.innerHTML = '<table class="table table-sm mb-0"><thead><tr><th>Portfolio</th><th>Pos.</th>' +
+                '<th>Delta</th><th>Gamma</th><th>Vega</th><th>Theta</th></tr></thead>' +
+                `<tbody>${rows}</tbody></table>`;
+        })
+        .catch(error => {
+            console.error('加载持仓组合Greeks失败:', error);
+        });
+}
+
+// 加载当前品种最新快照的做市商GEX曲线
+function loadGammaExposure(symbol) {
+    const chartElement = document.getElementById('gamma-exposure-chart');
+    if (!chartElement || typeof Chart === 'undefined') {
+        return;
+    }
+
+    fetch(`/api/risk/gamma-exposure?symbol=${encodeURIComponent(symbol)}`)
+        .then(response => response.json())
+        .then(data => {
+            if (!data.success) {
+                updateElementText('gamma-exposure-summary', 'No gamma exposure data');
+                return;
+            }
+            const profile = data.profile;
+            const format = value => value === null ? 'N/A' : value.toFixed(0);
+            updateElementText('gamma-exposure-summary',
+                `Spot ${format(profile.spot)} | Flip ${format(profile.flip_level)} | ` +
+                `Call wall ${format(profile.call_wall)} | Put wall ${format(profile.put_wall)}`);
+
+            if (window.chartObjects.gammaExposureChart) {
+                window.chartObjects.gammaExposureChart.destroy();
+            }
+            window.chartObjects.gammaExposureChart = new Chart(chartElement.getContext('2d'), {
+                type: 'line',
+                data: {
+                    labels: profile.spot_grid.map(value => value.toFixed(0)),
+                    datasets: [{
+                        label: 'Net GEX (USD / 1%)',
+                        data: profile.gex,
+                        borderColor: 'rgba(255, 159, 64, 1)',
+                        backgroundColor: 'rgba(255, 159, 64, 0.1)',
+                        borderWidth: 2,
+                        pointRadius: 0,
+                        fill: true
+                    }]
+                },
+                options: {
+                    responsive: true,
+                    maintainAspectRatio: false,
+                    plugins: {
+                        legend: {
+                            position: 'top'
+                        }
+                    },
+                    scales: {
+                        x: {
+                            ticks: {
+                                maxTicksLimit: 10
+                            }
+                        }
+                    }
+                }
+            });
+        })
+        .catch(error => {
+            console.error('加载GEX曲线失败:', error);
+        });
+}
+
 // 创建风险指标图表
 function createRiskChart(data) {
     console.log('创建风险指标图表...');
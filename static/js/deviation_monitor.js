@@ -3253,4 +3253,25 @@ document.addEventListener('DOMContentLoaded', function() {
     document.getElementById('refresh-data-btn').addEventListener('click', function() {
         VolumeAnalysisModule.fetchVolumeAnalysisData();
     });
+
+    // 订阅服务端推送：开启自动刷新时，新的偏离警报或指标到达后立即刷新
+    if (typeof EventSource !== 'undefined') {
+        const source = new EventSource('/api/stream?topics=indicators,deviation_alert');
+        let pushRefreshTimer = null;
+        const onPush = function(e) {
+            const data = JSON.parse(e.data);
+            const symbol = document.getElementById('symbol-filter')?.value;
+            const autoRefresh = document.getElementById('auto-refresh-toggle')?.checked;
+            if (autoRefresh && data.symbol === symbol) {
+                // 一次计算会产生多条警报，合并为一次刷新
+                clearTimeout(pushRefreshTimer);
+                pushRefreshTimer = setTimeout(() => {
+                    DataService.refreshData();
+                    VolumeAnalysisModule.fetchVolumeAnalysisData();
+                }, 1000);
+            }
+        };
+        source.addEventListener('indicators', onPush);
+        source.addEventListener('deviation_alert', onPush);
+    }
 });
\ No newline at end of file
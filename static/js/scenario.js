@@ -10,6 +10,15 @@ document.addEventListener('DOMContentLoaded', function() {
         });
     }
     
+    // Set up grid form submission
+    const gridForm = document.getElementById('scenario-grid-form');
+    if (gridForm) {
+        gridForm.addEventListener('submit', function(e) {
+            e.preventDefault();
+            runScenarioGrid();
+        });
+    }
+    
     // Set up delete buttons
     document.querySelectorAll('.delete-scenario').forEach(button => {
         button.addEventListener('click', function() {
@@ -28,6 +37,8 @@ function runScenarioAnalysis() {
     const priceChange = parseFloat(document.getElementById('price-change').value);
     const volatilityChange = parseFloat(document.getElementById('volatility-change').value);
     const timeHorizon = parseInt(document.getElementById('time-horizon').value);
+    const engineMode = document.getElementById('engine-mode').value;
+    const portfolioId = document.getElementById('scenario-portfolio').value || null;
     
     // Validate inputs
     if (!scenarioName || isNaN(priceChange) || isNaN(volatilityChange) || isNaN(timeHorizon)) {
@@ -52,7 +63,9 @@ function runScenarioAnalysis() {
             symbol: symbol,
             price_change: priceChange,
             volatility_change: volatilityChange,
-            time_horizon: timeHorizon
+            time_horizon: timeHorizon,
+            engine_mode: engineMode,
+            portfolio_id: portfolioId
         })
     })
     .then(response => response.json())
@@ -103,7 +116,7 @@ function addScenarioToTable(scenario) {
         <td>${priceChangeFormatted}</td>
         <td>${volChangeFormatted}</td>
         <td>${scenario.time_horizon} days</td>
-        <td class="${scenario.estimated_pnl >= 0 ? 'text-success' : 'text-danger'}">
+        <td class="${scenario.estimated_pnl >= 0 ? 'text-success' : 'text-danger'}" title="${scenario.engine_mode}">
             ${scenario.estimated_pnl >= 0 ? '+' : ''}${scenario.estimated_pnl.toFixed(2)}
         </td>
         <td>
@@ -157,6 +170,119 @@ function deleteScenario(scenarioId) {
     });
 }
 
+// Latest grid result, kept so the horizon selector can redraw without another request
+let scenarioGrid = null;
+
+// Run a batch scenario grid and render it as a heatmap
+function runScenarioGrid() {
+    const axis = (prefix) => ({
+        min: parseFloat(document.getElementById(`${prefix}-min`).value),
+        max: parseFloat(document.getElementById(`${prefix}-max`).value),
+        step: parseFloat(document.getElementById(`${prefix}-step`).value)
+    });
+    const horizons = document.getElementById('grid-horizons').value
+        .split(',')
+        .map(value => parseInt(value.trim()))
+        .filter(value => !isNaN(value));
+    const saveSummary = document.getElementById('grid-save').checked;
+    const symbol = document.getElementById('grid-symbol').value;
+    
+    const submitButton = document.querySelector('#scenario-grid-form button[type="submit"]');
+    submitButton.innerHTML = '<span class="spinner-border spinner-border-sm" role="status" aria-hidden="true"></span> Running...';
+    submitButton.disabled = true;
+    
+    fetch('/api/scenario/grid', {
+        method: 'POST',
+        headers: {
+            'Content-Type': 'application/json'
+        },
+        body: JSON.stringify({
+            symbol: symbol,
+            price_changes: axis('grid-price'),
+            volatility_changes: axis('grid-vol'),
+            time_horizons: horizons,
+            engine_mode: document.getElementById('engine-mode').value,
+            portfolio_id: document.getElementById('scenario-portfolio').value || null,
+            save: saveSummary,
+            name: `${symbol} grid ${new Date().toLocaleString()}`
+        })
+    })
+    .then(response => response.json())
+    .then(data => {
+        if (!data.success) {
+            showToast('Error running scenario grid: ' + data.message, 'danger');
+            return;
+        }
+        
+        scenarioGrid = data.grid;
+        renderHorizonSelect(scenarioGrid);
+        renderScenarioHeatmap(scenarioGrid, 0);
+        
+        if (saveSummary && scenarioGrid.scenario_id) {
+            // The saved summary row is the worst-case cell
+            addScenarioToTable({
+                id: scenarioGrid.scenario_id,
+                name: `${symbol} grid (worst case)`,
+                symbol: symbol,
+                created_at: new Date().toISOString(),
+                price_change: scenarioGrid.worst.price_change,
+                volatility_change: scenarioGrid.worst.volatility_change,
+                time_horizon: scenarioGrid.worst.time_horizon,
+                estimated_pnl: scenarioGrid.worst.pnl,
+                engine_mode: scenarioGrid.engine_mode
+            });
+        }
+    })
+    .catch(error => {
+        console.error('Error:', error);
+        showToast('Error connecting to server', 'danger');
+    })
+    .finally(() => {
+        submitButton.innerHTML = 'Run Grid';
+        submitButton.disabled = false;
+    });
+}
+
+// Populate the horizon selector for a grid result
+function renderHorizonSelect(grid) {
+    const select = document.getElementById('grid-horizon-select');
+    select.innerHTML = grid.time_horizons
+        .map((days, index) => `<option value="${index}">${days} days</option>`)
+        .join('');
+    select.classList.toggle('d-none', grid.time_horizons.length < 2);
+    select.onchange = () => renderScenarioHeatmap(scenarioGrid, parseInt(select.value));
+}
+
+// Render one horizon of the grid: rows are price changes, columns are volatility changes
+function renderScenarioHeatmap(grid, horizonIndex) {
+    const table = document.getElementById('scenario-heatmap');
+    const matrix = grid.pnl[horizonIndex];
+    const maxAbs = Math.max(...matrix.flat().map(Math.abs)) || 1;
+    const formatChange = value => `${value > 0 ? '+' : ''}${value}`;
+    
+    const header = '<thead><tr><th>Price \\ Vol</th>' +
+        grid.volatility_changes.map(value => `<th>${formatChange(value)}</th>`).join('') +
+        '</tr></thead>';
+    
+    const rows = matrix.map((row, i) => {
+        const cells = row.map((pnl, j) => {
+            // Green for gains, red for losses, intensity relative to the largest absolute P&L
+            const alpha = (Math.abs(pnl) / maxAbs * 0.85).toFixed(2);
+            const color = pnl >= 0 ? `rgba(25, 135, 84, ${alpha})` : `rgba(220, 53, 69, ${alpha})`;
+            const title = `Price ${formatChange(grid.price_changes[i])}%, Vol ${formatChange(grid.volatility_changes[j])}: ${pnl.toFixed(2)}`;
+            return `<td style="background-color: ${color}" title="${title}">${Math.round(pnl).toLocaleString()}</td>`;
+        }).join('');
+        return `<tr><th>${formatChange(grid.price_changes[i])}%</th>${cells}</tr>`;
+    }).join('');
+    
+    table.innerHTML = header + '<tbody>' + rows + '</tbody>';
+    
+    document.getElementById('grid-summary').textContent =
+        `${grid.symbol} @ ${new Date(grid.snapshot_time + 'Z').toLocaleString()} · ${grid.contracts} contracts · ${grid.engine_mode} · ` +
+        `worst ${grid.worst.pnl.toFixed(2)} (${formatChange(grid.worst.price_change)}%, ${formatChange(grid.worst.volatility_change)} vol, ${grid.worst.time_horizon}d) · ` +
+        `best ${grid.best.pnl.toFixed(2)}`;
+}
+
 // Show a toast notification
 function showToast(message, type = 'info') {
     const toastContainer = document.getElementById('toast-container');
@@ -0,0 +1,49 @@
+"""
+采集/计算worker进程入口
+独立于Web服务运行定时任务：获取期权数据、计算风险指标和偏离指标、清理旧数据
+可在多台主机上同时运行，通过数据库租约选出唯一的主节点执行任务，其余进程热备
+
+用法:
+    python worker.py
+"""
+import signal
+import threading
+
+from app import app
+from config import Config
+from services.scheduler import init_scheduler, shutdown_scheduler
+from services.monte_carlo import shutdown_pool
+from utils.logging_config import get_logger
+
+logger = get_logger(__name__)
+
+_stop_event = threading.Event()
+
+
+def _handle_signal(signum, frame):
+    logger.info(f"Received signal {signum}, shutting down worker")
+    _stop_event.set()
+
+
+def main():
+    signal.signal(signal.SIGTERM, _handle_signal)
+    signal.signal(signal.SIGINT, _handle_signal)
+
+    if not Config.EVENT_REDIS_URL:
+        logger.warning("EVENT_REDIS_URL is not set: events published by this worker "
+                       "will not reach SSE clients of the web service")
+
+    init_scheduler(app)
+    logger.info("Collector worker started")
+
+    # 调度器在后台线程中运行，主线程等待退出信号
+    while not _stop_event.is_set():
+        _stop_event.wait(60)
+
+    shutdown_scheduler()
+    shutdown_pool()
+    logger.info("Collector worker stopped")
+
+
+if __name__ == "__main__":
+    main()